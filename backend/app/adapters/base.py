@@ -1,11 +1,25 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from typing import Iterator
 
 
 class LLMAdapter(ABC):
+    # context window in tokens (prompt + answer); backends that know theirs override it
+    context_size: int = 4096
+
+    def count_tokens(self, text: str) -> int:
+        """Tokens `text` takes up in the context window.
+
+        Backends without a tokenizer to ask over-estimate at ~3 characters
+        per token, so budgeted prompts stay inside the window.
+        """
+        return len(text) // 3 + 1
+
     @abstractmethod
     def generate(self, prompt: str, max_tokens: int = 512, temperature: float = 0.2) -> str:
         ...
 
-
+    def stream(self, prompt: str, max_tokens: int = 512, temperature: float = 0.2) -> Iterator[str]:
+        """Yield the completion piece by piece; backends without streaming yield it whole."""
+        yield self.generate(prompt, max_tokens=max_tokens, temperature=temperature)
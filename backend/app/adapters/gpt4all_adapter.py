@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Iterator
+
 from .base import LLMAdapter
 
 
@@ -14,4 +16,7 @@ class GPT4AllAdapter(LLMAdapter):
     def generate(self, prompt: str, max_tokens: int = 512, temperature: float = 0.2) -> str:
         return self.model.generate(prompt, max_tokens=max_tokens, temp=temperature)
 
-
+    def stream(self, prompt: str, max_tokens: int = 512, temperature: float = 0.2) -> Iterator[str]:
+        yield from self.model.generate(
+            prompt, max_tokens=max_tokens, temp=temperature, streaming=True
+        )
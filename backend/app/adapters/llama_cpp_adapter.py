@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Iterator
+
 from .base import LLMAdapter
 
 
@@ -11,8 +13,21 @@ class LlamaCppAdapter(LLMAdapter):
             raise RuntimeError("llama-cpp-python is not installed. pip install llama-cpp-python") from e
         self.llm = Llama(model_path=model_path, n_ctx=4096)
 
+    @property
+    def context_size(self) -> int:
+        return self.llm.n_ctx()
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False))
+
     def generate(self, prompt: str, max_tokens: int = 512, temperature: float = 0.2) -> str:
         out = self.llm(prompt=prompt, max_tokens=max_tokens, temperature=temperature)
         return out.get("choices", [{}])[0].get("text", "")
 
-
+    def stream(self, prompt: str, max_tokens: int = 512, temperature: float = 0.2) -> Iterator[str]:
+        for part in self.llm(
+            prompt=prompt, max_tokens=max_tokens, temperature=temperature, stream=True
+        ):
+            text = part.get("choices", [{}])[0].get("text", "")
+            if text:
+                yield text
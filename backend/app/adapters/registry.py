@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from .base import LLMAdapter
+
+
+class AdapterPool:
+    """A fixed number of warm adapter instances, each used by one caller at a time.
+
+    Instances are created lazily up to `size` and then reused; callers beyond
+    that wait for an instance to be returned. llama.cpp and GPT4All models are
+    not safe to call concurrently, so this also serializes access per model.
+    """
+
+    def __init__(self, factory: Callable[[], LLMAdapter], size: int = 1):
+        self.factory = factory
+        self.size = max(1, size)
+        self._free: "queue.Queue[LLMAdapter]" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _take(self, timeout: Optional[float]) -> LLMAdapter:
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self.factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("no LLM instance became free in time") from None
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None) -> Iterator[LLMAdapter]:
+        adapter = self._take(timeout)
+        try:
+            yield adapter
+        finally:
+            self._free.put(adapter)
+
+    def warm(self) -> None:
+        """Create every instance up front."""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            try:
+                self._free.put(self.factory())
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+    def stats(self) -> dict:
+        return {"size": self.size, "loaded": self._created, "idle": self._free.qsize()}
+
+
+class ModelRegistry:
+    """Process-wide home of the LLM adapter pool.
+
+    The pool is keyed by the model settings it was built from (backend, model
+    path, pool size); it is only rebuilt when those change in config.yaml, so
+    a multi-GB GGUF model is loaded once instead of once per query.
+    """
+
+    def __init__(self, factory: Callable[[dict], LLMAdapter]):
+        self.factory = factory
+        self._pool: Optional[AdapterPool] = None
+        self._key: Optional[tuple] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _settings(cfg: dict) -> tuple:
+        llm = cfg.get("llm") or {}
+        return (cfg.get("model_backend"), cfg.get("model_path"), int(llm.get("pool_size", 1)))
+
+    def pool(self, cfg: dict) -> AdapterPool:
+        key = self._settings(cfg)
+        with self._lock:
+            if self._pool is None or key != self._key:
+                # instances of the old pool are released once their callers return them
+                self._pool = AdapterPool(lambda: self.factory(cfg), key[2])
+                self._key = key
+            return self._pool
+
+    @contextmanager
+    def acquire(self, cfg: dict) -> Iterator[LLMAdapter]:
+        timeout = (cfg.get("llm") or {}).get("acquire_timeout_s")
+        with self.pool(cfg).acquire(float(timeout) if timeout else None) as adapter:
+            yield adapter
+
+    def preload(self, cfg: dict) -> None:
+        self.pool(cfg).warm()
+
+    def stats(self) -> dict:
+        with self._lock:
+            if self._pool is None:
+                return {"backend": None}
+            return {"backend": self._key[0], "model_path": self._key[1], **self._pool.stats()}
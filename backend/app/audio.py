@@ -0,0 +1,222 @@
+"""
+Chunked, parallel whisper.cpp transcription.
+
+Audio is decoded once to 16 kHz mono PCM (ffmpeg, or directly for WAVs
+already in that format) and cut into segments of about `audio.segment_s`
+seconds, each ending at the quietest 30 ms frame in its last
+`audio.silence_search_s` seconds so words aren't split. A pool of
+`audio.workers` whisper.cpp processes with `audio.threads` threads each
+transcribes the segments; their timestamps are shifted by the segment
+offset so the merged transcript carries absolute times.
+
+Any failure (missing binary or model, undecodable audio, a whisper.cpp
+error) raises TranscriptionError instead of yielding an empty transcript.
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .config import get_section
+
+
+SAMPLE_RATE = 16000  # what whisper.cpp expects
+FRAME = SAMPLE_RATE * 30 // 1000
+
+Segment = Tuple[int, int, str]  # (start_ms, end_ms, text)
+
+
+class TranscriptionError(RuntimeError):
+    pass
+
+
+def _settings() -> dict:
+    cfg = get_section("audio")
+    return {
+        "binary": cfg.get("whisper_bin") or os.getenv("WHISPER_CPP_BIN", "./models/whisper/main"),
+        "model": cfg.get("whisper_model")
+        or os.getenv("WHISPER_CPP_MODEL", "./models/whisper/ggml-base.en.bin"),
+        "workers": int(cfg.get("workers", 2)),
+        "threads": int(cfg.get("threads", 4)),
+        "segment_s": float(cfg.get("segment_s", 300)),
+        "search_s": float(cfg.get("silence_search_s", 20)),
+    }
+
+
+def decode(path: str) -> np.ndarray:
+    """The whole file as 16 kHz mono int16 samples."""
+    try:
+        with wave.open(path, "rb") as w:
+            if (w.getframerate(), w.getnchannels(), w.getsampwidth()) == (SAMPLE_RATE, 1, 2):
+                return np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+    except (wave.Error, EOFError):
+        pass
+    if not shutil.which("ffmpeg"):
+        raise TranscriptionError(
+            f"ffmpeg is not installed; it is needed to decode {os.path.basename(path)}"
+        )
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-v",
+        "error",
+        "-i",
+        path,
+        "-f",
+        "s16le",
+        "-ac",
+        "1",
+        "-ar",
+        str(SAMPLE_RATE),
+        "-",
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise TranscriptionError(
+            f"ffmpeg could not decode {os.path.basename(path)}: {proc.stderr.decode(errors='ignore').strip()}"
+        )
+    return np.frombuffer(proc.stdout, dtype=np.int16)
+
+
+def split_on_silence(
+    samples: np.ndarray, segment_s: float, search_s: float
+) -> List[Tuple[int, int]]:
+    """(start, end) sample ranges of at most `segment_s`, cut at the quietest frame near each end."""
+    n = len(samples)
+    seg = max(int(segment_s * SAMPLE_RATE), FRAME)
+    search = min(int(search_s * SAMPLE_RATE), seg // 2) // FRAME
+    frames = n // FRAME
+    energy = (
+        np.square(samples[: frames * FRAME].astype(np.float32)).reshape(frames, FRAME).mean(axis=1)
+    )
+    ranges: List[Tuple[int, int]] = []
+    start = 0
+    while n - start > seg:
+        last = (start + seg) // FRAME  # first frame past the segment
+        first = max(last - search, start // FRAME + 1)
+        cut = (
+            (first + int(np.argmin(energy[first:last]))) * FRAME + FRAME // 2
+            if last > first
+            else start + seg
+        )
+        ranges.append((start, cut))
+        start = cut
+    if start < n:
+        ranges.append((start, n))
+    return ranges
+
+
+def _parse(data: dict) -> List[Segment]:
+    out: List[Segment] = []
+    if "transcription" in data:  # whisper.cpp -oj
+        for seg in data["transcription"]:
+            out.append(
+                (
+                    int(seg["offsets"]["from"]),
+                    int(seg["offsets"]["to"]),
+                    (seg.get("text") or "").strip(),
+                )
+            )
+    else:
+        for seg in data.get("segments", []):
+            out.append(
+                (int(seg.get("t0") or 0), int(seg.get("t1") or 0), (seg.get("text") or "").strip())
+            )
+    return [s for s in out if s[2]]
+
+
+def _transcribe_segment(
+    samples: np.ndarray, offset_ms: int, workdir: str, index: int, opts: dict
+) -> List[Segment]:
+    wav = os.path.join(workdir, f"seg{index}.wav")
+    with wave.open(wav, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(samples.tobytes())
+    prefix = os.path.join(workdir, f"seg{index}")
+    cmd = [
+        opts["binary"],
+        "-m",
+        opts["model"],
+        "-f",
+        wav,
+        "-t",
+        str(opts["threads"]),
+        "-oj",
+        "-of",
+        prefix,
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    where = f"segment {index} at {offset_ms / 1000:.0f}s"
+    if proc.returncode != 0:
+        err = proc.stderr.decode(errors="ignore").strip().splitlines()
+        raise TranscriptionError(
+            f"whisper.cpp failed on {where} (exit {proc.returncode}): {' '.join(err[-3:])}"
+        )
+    try:
+        with open(prefix + ".json", "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise TranscriptionError(f"whisper.cpp wrote no readable JSON for {where}: {e}") from e
+    return [(t0 + offset_ms, t1 + offset_ms, text) for t0, t1, text in _parse(data)]
+
+
+def transcribe(path: str, **overrides) -> Tuple[str, List[Segment]]:
+    """Return (full_transcript, segments) with absolute millisecond timestamps.
+
+    Keyword arguments override the `audio` config: binary, model, workers,
+    threads, segment_s, search_s.
+    """
+    opts = {**_settings(), **{k: v for k, v in overrides.items() if v is not None}}
+    for key in ("binary", "model"):
+        if not os.path.exists(opts[key]):
+            raise TranscriptionError(f"whisper.cpp {key} not found: {opts[key]}")
+    samples = decode(path)
+    ranges = split_on_silence(samples, opts["segment_s"], opts["search_s"])
+    with (
+        tempfile.TemporaryDirectory() as td,
+        ThreadPoolExecutor(max_workers=max(1, opts["workers"])) as pool,
+    ):
+        futures = [
+            pool.submit(_transcribe_segment, samples[s:e], s * 1000 // SAMPLE_RATE, td, i, opts)
+            for i, (s, e) in enumerate(ranges)
+        ]
+        segments: List[Segment] = []
+        errors: List[str] = []
+        for fut in futures:
+            try:
+                segments.extend(fut.result())
+            except TranscriptionError as e:
+                errors.append(str(e))
+    if errors:
+        raise TranscriptionError("; ".join(errors))
+    return " ".join(text for _, _, text in segments), segments
+
+
+def span_timestamps(
+    spans: List[Tuple[int, int]], bounds: List[Tuple[int, int]], segments: List[Segment]
+) -> List[Optional[str]]:
+    """ "start_ms-end_ms" of each transcript span, from the first to the last segment it overlaps.
+
+    `bounds` are the (start, end) character offsets of `segments` in the
+    transcript; both lists are in transcript order.
+    """
+    starts = [b0 for b0, _ in bounds]
+    ends = [b1 for _, b1 in bounds]
+    out: List[Optional[str]] = []
+    for s, e in spans:
+        i = bisect.bisect_right(ends, s)
+        j = bisect.bisect_left(starts, e, lo=i) - 1
+        out.append(f"{segments[i][0]}-{segments[j][1]}" if i < len(segments) and j >= i else None)
+    return out
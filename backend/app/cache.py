@@ -0,0 +1,134 @@
+"""
+In-process caches for repeated queries.
+
+- "embeddings": normalized query text -> query embedding
+- "results": (query, index version, top_k, model config, ...) -> search
+  results or a generated answer
+
+Sizes and TTLs come from the `cache` section of config.yaml. Result
+entries carry the index version in their key and the whole cache is
+dropped as soon as a different version is seen, so ingests, compactions
+and rebuilds invalidate it automatically.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from .config import get_section
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe LRU cache with an optional per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if (
+                item is not _MISSING
+                and self.ttl is not None
+                and time.monotonic() - item[1] > self.ttl
+            ):
+                del self._data[key]
+                item = _MISSING
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class VersionedCache(LRUCache):
+    """LRU cache that empties itself whenever the index version it is asked about changes."""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        super().__init__(max_size, ttl)
+        self._version: Any = None
+
+    def _check_version(self, version: Hashable) -> None:
+        with self._lock:
+            if version != self._version:
+                self._data.clear()
+                self._version = version
+
+    def get_versioned(self, version: Hashable, key: Hashable, default: Any = None) -> Any:
+        self._check_version(version)
+        return self.get((version, key), default)
+
+    def put_versioned(self, version: Hashable, key: Hashable, value: Any) -> None:
+        self._check_version(version)
+        self.put((version, key), value)
+
+
+_caches: Dict[str, LRUCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str) -> LRUCache:
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cfg = get_section("cache")
+            if name == "embeddings":
+                cache = LRUCache(int(cfg.get("embedding_size", 2048)))
+            else:
+                ttl = cfg.get("result_ttl_s", 600)
+                cache = VersionedCache(
+                    int(cfg.get("result_size", 512)), float(ttl) if ttl else None
+                )
+            _caches[name] = cache
+        return cache
+
+
+def normalize_query(text: str) -> str:
+    return " ".join((text or "").split()).lower()
+
+
+def cache_stats() -> dict:
+    with _caches_lock:
+        return {name: cache.stats() for name, cache in _caches.items()}
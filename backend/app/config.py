@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import os
+import threading
+
+import yaml
+
+
+CONFIG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "config.yaml"))
+
+DEFAULTS = {
+    "model_backend": "mistral",
+    "model_path": None,
+    "top_k": 5,
+    "max_tokens": 512,
+    "temperature": 0.2,
+}
+
+_cache: dict = {}
+_lock = threading.Lock()
+
+
+def load_config(path: str = CONFIG_PATH) -> dict:
+    if not os.path.exists(path):
+        return dict(DEFAULTS)
+    with open(path, "r") as f:
+        return yaml.safe_load(f) or {}
+
+
+def get_config(path: str = CONFIG_PATH) -> dict:
+    """Return the parsed config file, re-reading it only when the file changes."""
+    try:
+        st = os.stat(path)
+        sig = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        sig = None
+    with _lock:
+        cached = _cache.get(path)
+        if cached is None or cached[0] != sig:
+            cached = _cache[path] = (sig, load_config(path))
+        return cached[1]
+
+
+def get_section(name: str) -> dict:
+    return get_config().get(name) or {}
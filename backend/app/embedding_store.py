@@ -0,0 +1,142 @@
+"""
+Persistent copy of every embedding, keyed by vector id.
+
+Each collection keeps an append-only float32 matrix (`<name>.f32`), the
+int64 vector id of every row (`<name>.ids`) and a JSON sidecar recording
+the model and dimension that produced them. Rebuilding an index, switching
+its type or recovering from a lossy (PQ) index reads vectors back from the
+memory-mapped matrix instead of re-running the encoder.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+
+class EmbeddingStore:
+    def __init__(self, path: str):
+        self.path = path + ".f32"
+        self.ids_path = path + ".ids"
+        self.meta_path = path + ".json"
+        self._lock = threading.Lock()
+        self._sorted: Optional[tuple] = None  # (signature, order, sorted ids) for get()
+
+    def meta(self) -> Optional[dict]:
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def compatible(self, model: str, dim: int) -> bool:
+        meta = self.meta()
+        return meta is not None and meta.get("model") == model and int(meta.get("dim", 0)) == dim
+
+    def _ids(self) -> np.ndarray:
+        if not os.path.exists(self.ids_path):
+            return np.zeros(0, dtype=np.int64)
+        return np.fromfile(self.ids_path, dtype=np.int64)
+
+    def _matrix(self, dim: int, n: int) -> np.ndarray:
+        if n == 0:
+            return np.zeros((0, dim), dtype=np.float32)
+        return np.memmap(self.path, dtype=np.float32, mode="r", shape=(n, dim))
+
+    def count(self) -> int:
+        meta = self.meta()
+        if meta is None or not os.path.exists(self.path):
+            return 0
+        rows = os.path.getsize(self.path) // (4 * int(meta["dim"]))
+        return min(rows, len(self._ids()))
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray, model: str) -> None:
+        """Persist vectors under their ids; a different model or dimension starts the store over."""
+        dim = vectors.shape[1]
+        with self._lock:
+            if not self.compatible(model, dim):
+                self._write(
+                    np.zeros(0, dtype=np.int64), np.zeros((0, dim), dtype=np.float32), model
+                )
+            n = self.count()
+            # drop any torn row left by a crash so matrix rows and ids stay aligned
+            for path, size in ((self.path, n * dim * 4), (self.ids_path, n * 8)):
+                if os.path.exists(path) and os.path.getsize(path) != size:
+                    os.truncate(path, size)
+            for path, arr in (
+                (self.path, np.ascontiguousarray(vectors, dtype=np.float32)),
+                (self.ids_path, np.ascontiguousarray(ids, dtype=np.int64)),
+            ):
+                with open(path, "ab") as f:
+                    f.write(arr.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def load(self, model: str, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+        """All stored ids and their vectors; the vectors are memory-mapped, not read into RAM."""
+        with self._lock:
+            if not self.compatible(model, dim):
+                return np.zeros(0, dtype=np.int64), np.zeros((0, dim), dtype=np.float32)
+            n = self.count()
+            return self._ids()[:n], self._matrix(dim, n)
+
+    def get(self, ids: Iterable[int], model: str, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return a mask of which `ids` are stored and their vectors (zeros where missing)."""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        found = np.zeros(len(ids), dtype=bool)
+        out = np.zeros((len(ids), dim), dtype=np.float32)
+        stored, matrix = self.load(model, dim)
+        if not len(ids) or not len(stored):
+            return found, out
+        order, sorted_ids = self._sorted_ids(stored)
+        pos = np.searchsorted(sorted_ids, ids, side="right") - 1
+        found = pos >= 0
+        found[found] = sorted_ids[pos[found]] == ids[found]
+        out[found] = matrix[order[pos[found]]]
+        return found, out
+
+    def _sorted_ids(self, stored: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # cached until rows are appended or the store is rewritten; the last copy of an id wins
+        sig = (len(stored), os.stat(self.ids_path).st_mtime_ns)
+        cached = self._sorted
+        if cached is None or cached[0] != sig:
+            order = np.argsort(stored, kind="stable")
+            cached = self._sorted = (sig, order, stored[order])
+        return cached[1], cached[2]
+
+    def retain(self, ids: np.ndarray) -> int:
+        """Rewrite the store without vectors whose id isn't in `ids`; returns how many went."""
+        with self._lock:
+            meta = self.meta()
+            if meta is None:
+                return 0
+            n = self.count()
+            stored = self._ids()[:n]
+            keep = np.isin(stored, ids)
+            if keep.all():
+                return 0
+            vectors = np.asarray(self._matrix(int(meta["dim"]), n)[keep])
+            self._write(stored[keep], vectors, meta["model"])
+            return int(n - keep.sum())
+
+    def reset(self, ids: np.ndarray, vectors: np.ndarray, model: str) -> None:
+        """Replace the whole store, e.g. to drop vectors of deleted rows."""
+        with self._lock:
+            self._write(ids, vectors, model)
+
+    def _write(self, ids: np.ndarray, vectors: np.ndarray, model: str) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        for path, arr in (
+            (self.path, np.ascontiguousarray(vectors, dtype=np.float32)),
+            (self.ids_path, np.ascontiguousarray(ids, dtype=np.int64)),
+        ):
+            tmp = path + ".tmp"
+            arr.tofile(tmp)
+            os.replace(tmp, path)
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"model": model, "dim": int(vectors.shape[1])}, f)
+        os.replace(tmp, self.meta_path)
@@ -1,52 +1,324 @@
 from __future__ import annotations
 
 import os
-from typing import List, Tuple
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
 
 import numpy as np
-import torch
-from PIL import Image
-from sentence_transformers import SentenceTransformer
-import open_clip
 
+from . import encoders
+from .config import get_section
+
+# torch, open_clip and sentence_transformers take seconds to import; they are
+# imported on first use so importing the app (and /health) stays fast
+if TYPE_CHECKING:
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+TEXT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+CLIP_MODEL = ("ViT-B-32", "openai")
+CLIP_IMAGE_SIZE = 224
+CLIP_DIM = 512
 
 _text_model: SentenceTransformer | None = None
 _clip_model: torch.nn.Module | None = None
 _clip_preprocess = None
+_clip_tokenizer = None
+_onnx_text: "encoders.OnnxTextEncoder | None" = None
+_onnx_clip: "encoders.OnnxClip | None" = None
 
 
 def get_text_model() -> SentenceTransformer:
     global _text_model
     if _text_model is None:
-        _text_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+        from sentence_transformers import SentenceTransformer
+
+        encoders.configure_threads()
+        if encoders.backend() == "quantized":
+            # int8 kernels are CPU-only
+            _text_model = encoders.quantize(SentenceTransformer(TEXT_MODEL, device="cpu"))
+        else:
+            _text_model = SentenceTransformer(TEXT_MODEL)
     return _text_model
 
 
 def get_clip() -> tuple[torch.nn.Module, any]:
     global _clip_model, _clip_preprocess
     if _clip_model is None:
+        import open_clip
+
+        encoders.configure_threads()
         model, _, preprocess = open_clip.create_model_and_transforms(
-            "ViT-B-32", pretrained="openai"
+            CLIP_MODEL[0], pretrained=CLIP_MODEL[1]
         )
         model.eval()
-        _clip_model = model
+        _clip_model = encoders.quantize(model) if encoders.backend() == "quantized" else model
         _clip_preprocess = preprocess
     return _clip_model, _clip_preprocess
 
 
+def get_onnx_text() -> encoders.OnnxTextEncoder:
+    global _onnx_text
+    if _onnx_text is None:
+        _onnx_text = encoders.OnnxTextEncoder(TEXT_MODEL)
+    return _onnx_text
+
+
+def get_onnx_clip() -> encoders.OnnxClip:
+    global _onnx_clip
+    if _onnx_clip is None:
+        _onnx_clip = encoders.OnnxClip(*CLIP_MODEL)
+    return _onnx_clip
+
+
 def embed_texts(texts: List[str]) -> np.ndarray:
+    if encoders.backend() == "onnx":
+        return get_onnx_text().encode(texts)
     model = get_text_model()
     embs = model.encode(texts, convert_to_numpy=True, normalize_embeddings=True, batch_size=64, show_progress_bar=False)
     return embs.astype(np.float32)
 
 
+def _decode_image(path: str, preprocess) -> tuple:
+    from .image_utils import load_image
+
+    image, size = load_image(path, CLIP_IMAGE_SIZE)
+    return preprocess(image), size
+
+
+def embed_images(
+    paths: List[str], batch_size: int | None = None, workers: int | None = None
+) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """CLIP-embed image files; returns the vectors and each image's original (width, height).
+
+    Images are decoded and preprocessed by `workers` threads (default
+    `images.decode_workers`) and fed to the model in mini-batches of
+    `batch_size` (default `images.batch_size`); the next mini-batch is
+    decoded while the model runs on the current one, so at most two
+    mini-batches of pixels are held in memory however many paths are given.
+    """
+    import torch
+
+    cfg = get_section("images")
+    batch_size = batch_size or int(cfg.get("batch_size", 32))
+    workers = workers or int(cfg.get("decode_workers", 4))
+    if encoders.backend() == "onnx":
+        clip = get_onnx_clip()
+        preprocess = clip.preprocess
+
+        def encode(batch):
+            return clip.encode_images(batch.numpy())
+
+    else:
+        model, preprocess = get_clip()
+
+        def encode(batch):
+            with torch.no_grad():
+                feats = model.encode_image(batch)
+                feats = feats / feats.norm(dim=-1, keepdim=True)
+            return feats.cpu().numpy().astype(np.float32)
+
+    batches = [paths[i : i + batch_size] for i in range(0, len(paths), batch_size)]
+    out: List[np.ndarray] = []
+    sizes: List[Tuple[int, int]] = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-decode") as pool:
+        pending = [pool.submit(_decode_image, p, preprocess) for p in batches[0]] if batches else []
+        for i in range(len(batches)):
+            decoded = [f.result() for f in pending]
+            if i + 1 < len(batches):
+                pending = [pool.submit(_decode_image, p, preprocess) for p in batches[i + 1]]
+            sizes.extend(size for _, size in decoded)
+            out.append(encode(torch.stack([t for t, _ in decoded])))
+    if not out:
+        return np.zeros((0, CLIP_DIM), dtype=np.float32), sizes
+    return np.concatenate(out), sizes
+
+
 def embed_image_paths(paths: List[str]) -> np.ndarray:
-    model, preprocess = get_clip()
-    images = [preprocess(Image.open(p).convert("RGB")) for p in paths]
-    batch = torch.stack(images)
+    return embed_images(paths)[0]
+
+
+def embed_clip_texts(texts: List[str]) -> np.ndarray:
+    """Embed text into CLIP's joint space, for text -> image (cross-modal) search."""
+    global _clip_tokenizer
+    if encoders.backend() == "onnx":
+        return get_onnx_clip().encode_texts(texts)
+    import open_clip
+    import torch
+
+    model, _ = get_clip()
+    if _clip_tokenizer is None:
+        _clip_tokenizer = open_clip.get_tokenizer("ViT-B-32")
     with torch.no_grad():
-        feats = model.encode_image(batch)
+        feats = model.encode_text(_clip_tokenizer(texts))
         feats = feats / feats.norm(dim=-1, keepdim=True)
     return feats.cpu().numpy().astype(np.float32)
 
 
+class MicroBatcher:
+    """Coalesces single-text encode calls from concurrent threads into batches.
+
+    The first request in an empty queue waits at most `max_wait_ms` for
+    others to join it (up to `max_batch`), then one background thread
+    encodes them together and resolves each caller's future. Batch sizes and
+    queue waits are counted for `/status`.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], np.ndarray],
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+    ):
+        self.encode = encode
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def submit(self, text: str) -> Future:
+        fut: Future = Future()
+        self._queue.put((text, fut, time.monotonic()))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._thread.start()
+        return fut
+
+    def __call__(self, text: str) -> np.ndarray:
+        """Encode one text; returns a (1, dim) array like `encode([text])` would."""
+        return self.submit(text).result()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(
+                        self._queue.get(timeout=remaining)
+                        if remaining > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch: List[tuple]) -> None:
+        started = time.monotonic()
+        waits = [started - enqueued for _, _, enqueued in batch]
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.wait_total += sum(waits)
+            self.wait_max = max(self.wait_max, max(waits))
+        try:
+            vecs = self.encode([text for text, _, _ in batch])
+        except Exception as e:
+            for _, fut, _ in batch:
+                fut.set_exception(e)
+            return
+        for i, (_, fut, _) in enumerate(batch):
+            fut.set_result(vecs[i : i + 1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "max_batch": self.max_batch_seen,
+                "avg_wait_ms": round(self.wait_total / self.items * 1000, 3) if self.items else 0.0,
+                "max_wait_ms": round(self.wait_max * 1000, 3),
+                "queued": self._queue.qsize(),
+            }
+
+
+_batchers: Dict[str, MicroBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(
+    kind: str, encode: Callable[[List[str]], np.ndarray]
+) -> Callable[[str], np.ndarray]:
+    """The shared batcher for `kind`, or a plain single-text call when batching is off."""
+    cfg = get_section("batching")
+    if not cfg.get("enabled", True) or not cfg.get("max_wait_ms", 5):
+        return lambda text: encode([text])
+    with _batchers_lock:
+        batcher = _batchers.get(kind)
+        if batcher is None:
+            batcher = _batchers[kind] = MicroBatcher(
+                encode, int(cfg.get("max_batch", 32)), float(cfg.get("max_wait_ms", 5))
+            )
+        return batcher
+
+
+def batch_stats() -> dict:
+    with _batchers_lock:
+        return {kind: b.stats() for kind, b in _batchers.items()}
+
+
+def _cached_query(kind: str, text: str, embed) -> np.ndarray:
+    from .cache import get_cache, normalize_query
+
+    cache = get_cache("embeddings")
+    key = (kind, normalize_query(text))
+    emb = cache.get(key)
+    if emb is None:
+        # concurrent misses are encoded together rather than as batches of one
+        emb = get_batcher(kind, embed)(text)
+        cache.put(key, emb)
+    return emb
+
+
+def embed_query(text: str) -> np.ndarray:
+    """MiniLM embedding of a single query, memoized on its normalized text."""
+    return _cached_query("text", text, embed_texts)
+
+
+def embed_clip_query(text: str) -> np.ndarray:
+    """CLIP text embedding of a single query, memoized on its normalized text."""
+    return _cached_query("clip", text, embed_clip_texts)
+
+
+def _cached_queries(kind: str, texts: List[str], embed) -> np.ndarray:
+    from .cache import get_cache, normalize_query
+
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    cache = get_cache("embeddings")
+    keys = [(kind, normalize_query(t)) for t in texts]
+    found = {key: emb for key in keys if (emb := cache.get(key)) is not None}
+    # the misses (deduplicated) are already a batch: one encoder call, no micro-batcher
+    missing: Dict[tuple, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            missing.setdefault(key, text)
+    if missing:
+        embs = embed(list(missing.values()))
+        for i, key in enumerate(missing):
+            found[key] = embs[i : i + 1]
+            cache.put(key, found[key])
+    return np.concatenate([found[key] for key in keys])
+
+
+def embed_queries(texts: List[str]) -> np.ndarray:
+    """MiniLM embeddings of many queries, one row each; cached like `embed_query`."""
+    return _cached_queries("text", texts, embed_texts)
+
+
+def embed_clip_queries(texts: List[str]) -> np.ndarray:
+    """CLIP text embeddings of many queries, one row each; cached like `embed_clip_query`."""
+    return _cached_queries("clip", texts, embed_clip_texts)
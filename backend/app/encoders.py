@@ -0,0 +1,262 @@
+"""
+Faster CPU inference paths for the MiniLM and CLIP encoders.
+
+`encoders.backend` in config.yaml selects how `embeddings` runs them:
+
+- torch: the fp32 PyTorch models (default)
+- quantized: the same models with their Linear layers converted to int8 by
+  torch dynamic quantization; no extra dependencies
+- onnx: the models exported once to ONNX under `encoders.onnx_dir` and run
+  with ONNX Runtime (pip install onnxruntime)
+
+`encoders.threads` sets the intra-op thread count for torch and ONNX
+Runtime (0 keeps their defaults). `scripts/bench_encoders.py` compares the
+backends' throughput and their cosine similarity to the fp32 vectors.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import TYPE_CHECKING, List, Optional
+
+import numpy as np
+
+from .config import get_section
+
+
+if TYPE_CHECKING:
+    import torch
+
+BACKENDS = ("torch", "quantized", "onnx")
+ONNX_OPSET = 17
+
+_threads_lock = threading.Lock()
+_threads_set = False
+
+
+def backend() -> str:
+    name = get_section("encoders").get("backend") or "torch"
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown encoders.backend: {name} (expected one of {', '.join(BACKENDS)})"
+        )
+    return name
+
+
+def threads() -> int:
+    return int(get_section("encoders").get("threads", 0) or 0)
+
+
+def configure_threads() -> None:
+    """Apply `encoders.threads` to torch once per process."""
+    global _threads_set
+    with _threads_lock:
+        if not _threads_set and threads():
+            import torch
+
+            torch.set_num_threads(threads())
+        _threads_set = True
+
+
+def quantize(model: torch.nn.Module) -> torch.nn.Module:
+    """int8 weights for every Linear layer; activations are quantized on the fly."""
+    import torch
+
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def onnx_dir() -> str:
+    path = get_section("encoders").get("onnx_dir") or os.path.join(
+        os.path.dirname(__file__), "..", "storage", "onnx"
+    )
+    return os.path.abspath(path)
+
+
+def _session(path: str):
+    try:
+        import onnxruntime as ort
+    except Exception as e:
+        raise RuntimeError("onnxruntime is not installed. pip install onnxruntime") from e
+    opts = ort.SessionOptions()
+    if threads():
+        opts.intra_op_num_threads = threads()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+
+
+def _legacy_exporter() -> dict:
+    # newer torch defaults to the dynamo exporter, which needs onnxscript; the
+    # TorchScript exporter handles these models fine and has no extra deps
+    import inspect
+
+    import torch
+
+    return {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+
+
+def _export(
+    module: torch.nn.Module, args: tuple, path: str, input_names: List[str], dynamic_axes: dict
+) -> None:
+    import torch
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    module.eval()
+    # the fused multi-head-attention fast path has no ONNX symbolic
+    mha = getattr(torch.backends, "mha", None)
+    fastpath = mha.get_fastpath_enabled() if mha else None
+    if mha:
+        mha.set_fastpath_enabled(False)
+    try:
+        with torch.no_grad():
+            torch.onnx.export(
+                module,
+                args,
+                tmp,
+                input_names=input_names,
+                output_names=["output"],
+                dynamic_axes={**dynamic_axes, "output": {0: "batch"}},
+                opset_version=ONNX_OPSET,
+                **_legacy_exporter(),
+            )
+    finally:
+        if mha:
+            mha.set_fastpath_enabled(fastpath)
+    os.replace(tmp, path)
+
+
+class OnnxTextEncoder:
+    """all-MiniLM-L6-v2 under ONNX Runtime: transformer in ONNX, mean pooling + L2 norm in numpy."""
+
+    def __init__(self, model_name: str, path: Optional[str] = None, max_length: int = 256):
+        from transformers import AutoTokenizer
+
+        self.path = path or os.path.join(onnx_dir(), "minilm.onnx")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.max_length = max_length
+        if not os.path.exists(self.path):
+            self._export(model_name)
+        self.session = _session(self.path)
+        self.inputs = {i.name for i in self.session.get_inputs()}
+
+    def _export(self, model_name: str) -> None:
+        import torch
+        from transformers import AutoModel
+
+        model = AutoModel.from_pretrained(model_name)
+        enc = self.tokenizer(["export"], return_tensors="pt")
+        names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in enc]
+
+        class Wrapper(torch.nn.Module):
+            def __init__(self, inner):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, *args):
+                return self.inner(**dict(zip(names, args))).last_hidden_state
+
+        _export(
+            Wrapper(model),
+            tuple(enc[n] for n in names),
+            self.path,
+            names,
+            {n: {0: "batch", 1: "seq"} for n in names},
+        )
+
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        out = []
+        for i in range(0, len(texts), batch_size):
+            enc = self.tokenizer(
+                texts[i : i + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.inputs}
+            hidden = self.session.run(None, feeds)[0]
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            out.append(pooled / np.linalg.norm(pooled, axis=1, keepdims=True))
+        if not out:
+            return np.zeros((0, 384), dtype=np.float32)
+        return np.concatenate(out).astype(np.float32)
+
+
+class OnnxClip:
+    """CLIP ViT-B-32 image and text towers under ONNX Runtime, exported from open_clip."""
+
+    def __init__(self, model_name: str = "ViT-B-32", pretrained: str = "openai"):
+        import open_clip
+
+        self.image_path = os.path.join(onnx_dir(), "clip_image.onnx")
+        self.text_path = os.path.join(onnx_dir(), "clip_text.onnx")
+        self.tokenizer = open_clip.get_tokenizer(model_name)
+        if not (os.path.exists(self.image_path) and os.path.exists(self.text_path)):
+            model, _, preprocess = open_clip.create_model_and_transforms(
+                model_name, pretrained=pretrained
+            )
+            self._export(model)
+        else:
+            # the eval transform only depends on the architecture, not the weights
+            cfg = open_clip.get_model_config(model_name)
+            preprocess = open_clip.image_transform(
+                cfg["vision_cfg"]["image_size"],
+                is_train=False,
+                mean=open_clip.OPENAI_DATASET_MEAN,
+                std=open_clip.OPENAI_DATASET_STD,
+            )
+        self.preprocess = preprocess
+        self.image_session = _session(self.image_path)
+        self.text_session = _session(self.text_path)
+
+    def _export(self, model: torch.nn.Module) -> None:
+        import torch
+
+        class Image(torch.nn.Module):
+            def __init__(self, inner):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, pixels):
+                return self.inner.encode_image(pixels)
+
+        class Text(torch.nn.Module):
+            def __init__(self, inner):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, tokens):
+                return self.inner.encode_text(tokens)
+
+        size = model.visual.image_size
+        size = size if isinstance(size, (tuple, list)) else (size, size)
+        _export(
+            Image(model),
+            (torch.zeros(1, 3, *size),),
+            self.image_path,
+            ["pixels"],
+            {"pixels": {0: "batch"}},
+        )
+        _export(
+            Text(model),
+            (self.tokenizer(["export"]),),
+            self.text_path,
+            ["tokens"],
+            {"tokens": {0: "batch"}},
+        )
+
+    @staticmethod
+    def _normalize(feats: np.ndarray) -> np.ndarray:
+        return (feats / np.linalg.norm(feats, axis=1, keepdims=True)).astype(np.float32)
+
+    def encode_images(self, pixels: np.ndarray) -> np.ndarray:
+        return self._normalize(
+            self.image_session.run(None, {"pixels": pixels.astype(np.float32)})[0]
+        )
+
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(texts).numpy().astype(np.int64)
+        return self._normalize(self.text_session.run(None, {"tokens": tokens})[0])
@@ -1,15 +1,14 @@
 from __future__ import annotations
 
+import json
 import os
-import subprocess
-import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import ExitStack
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import Callable, Iterator, List, Optional, Tuple
 
-from PIL import Image
-from .image_utils import get_image_size
-import fitz  # PyMuPDF
-from docx import Document
+from .splitter import get_splitter
 
 
 @dataclass
@@ -20,42 +19,109 @@ class Chunk:
     page_number: Optional[int] = None
     timestamp: Optional[str] = None
     filepath: Optional[str] = None
+    # JSON: {"page": [width, height], "boxes": [[x0, y0, x1, y1], ...]} of the PDF blocks a chunk came from
+    bbox: Optional[str] = None
 
 
-def _split_text(text: str, min_size: int = 400, max_size: int = 700, overlap_ratio: float = 0.2) -> List[str]:
-    text = (text or "").strip()
-    if not text:
-        return []
-    chunks: List[str] = []
-    start = 0
-    overlap = int(max_size * overlap_ratio)
-    while start < len(text):
-        end = min(start + max_size, len(text))
-        # try to end at sentence boundary
-        boundary = max(text.rfind(". ", start, end), text.rfind("\n", start, end))
-        if boundary != -1 and boundary + 1 - start >= min_size:
-            end = boundary + 1
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-        if end == len(text):
-            break
-        start = max(0, end - overlap)
-    return chunks
+def _split_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) offsets of the token-bounded chunks `_split_text` returns."""
+    return get_splitter().spans(text or "")
 
 
-def extract_pdf(path: str, file_name: str) -> List[Chunk]:
-    doc = fitz.open(path)
+def _split_text(text: str) -> List[str]:
+    return [text[s:e] for s, e in _split_spans(text)]
+
+
+def _pdf_pages(path: str, file_name: str, start: int, end: int) -> List[Chunk]:
+    """Chunks of pages [start, end), each carrying the bounding boxes of the text blocks it overlaps."""
+    import fitz  # PyMuPDF
+
     chunks: List[Chunk] = []
-    for i, page in enumerate(doc, start=1):
-        text = page.get_text("text")
-        for ch in _split_text(text):
-            chunks.append(Chunk(content=ch, file_name=file_name, file_type="pdf", page_number=i, filepath=path))
-    doc.close()
+    with fitz.open(path) as doc:
+        for i in range(start, end):
+            page = doc[i]
+            text, blocks = "", []
+            for x0, y0, x1, y1, block_text, _, block_type in page.get_text("blocks"):
+                if block_type != 0:  # images
+                    continue
+                blocks.append(
+                    (
+                        len(text),
+                        len(text) + len(block_text),
+                        [round(v, 1) for v in (x0, y0, x1, y1)],
+                    )
+                )
+                text += block_text if block_text.endswith("\n") else block_text + "\n"
+            size = [round(page.rect.width, 1), round(page.rect.height, 1)]
+            for s, e in _split_spans(text):
+                boxes = [box for b0, b1, box in blocks if b0 < e and b1 > s]
+                chunks.append(
+                    Chunk(
+                        content=text[s:e].strip(),
+                        file_name=file_name,
+                        file_type="pdf",
+                        page_number=i + 1,
+                        filepath=path,
+                        bbox=json.dumps({"page": size, "boxes": boxes}),
+                    )
+                )
     return chunks
 
 
+def iter_pdf(
+    path: str,
+    file_name: str,
+    workers: Optional[int] = None,
+    pages_per_task: Optional[int] = None,
+    submit: Optional[Callable[..., Future]] = None,
+) -> Iterator[Chunk]:
+    """Yield a PDF's chunks in page order while later pages are still being parsed.
+
+    Page ranges of `pages_per_task` (default `ingest.pdf_pages_per_task`)
+    are parsed by `workers` processes (default `ingest.pdf_workers`), with
+    at most two ranges per worker in flight, so memory stays bounded and the
+    caller can embed the first pages of a 2,000-page manual while the rest
+    are still being parsed. Small documents are parsed in-process.
+
+    `submit(fn, *args)` hands the ranges to an existing pool instead (e.g.
+    the server's extract stage), for documents of any size.
+    """
+    import fitz  # PyMuPDF
+
+    from .config import get_section
+
+    cfg = get_section("ingest")
+    workers = workers or int(cfg.get("pdf_workers", os.cpu_count() or 1))
+    pages_per_task = pages_per_task or int(cfg.get("pdf_pages_per_task", 16))
+    with fitz.open(path) as doc:
+        n = doc.page_count
+    ranges = [(s, min(s + pages_per_task, n)) for s in range(0, n, pages_per_task)]
+    if submit is None and (workers <= 1 or len(ranges) < 2):
+        for s, e in ranges:
+            yield from _pdf_pages(path, file_name, s, e)
+        return
+    with ExitStack() as stack:
+        if submit is None:
+            submit = stack.enter_context(
+                ProcessPoolExecutor(max_workers=min(workers, len(ranges)))
+            ).submit
+        todo, pending = deque(ranges), deque()
+        while todo and len(pending) < workers * 2:
+            pending.append(submit(_pdf_pages, path, file_name, *todo.popleft()))
+        while pending:
+            chunks = pending.popleft().result()
+            if todo:
+                pending.append(submit(_pdf_pages, path, file_name, *todo.popleft()))
+            yield from chunks
+
+
+def extract_pdf(path: str, file_name: str) -> List[Chunk]:
+    return list(iter_pdf(path, file_name, workers=1))
+
+
 def extract_docx(path: str, file_name: str) -> List[Chunk]:
+    from docx import Document
+
     doc = Document(path)
     text = "\n".join(p.text for p in doc.paragraphs)
     chunks = [Chunk(content=ch, file_name=file_name, file_type="docx", filepath=path) for ch in _split_text(text)]
@@ -63,60 +129,42 @@ def extract_docx(path: str, file_name: str) -> List[Chunk]:
 
 
 def extract_image(path: str, file_name: str) -> List[Chunk]:
-    # For images, return one chunk; embedding will use the image itself
-    try:
-        w, h = get_image_size(path)
-    except Exception:
-        w, h = None, None
+    # For images, return one chunk; embedding will use the image itself and
+    # fill in width/height from that decode (see ingest.index_chunks)
     ch = Chunk(content=f"Image: {file_name}", file_name=file_name, file_type="image", filepath=path)
-    # temporarily store dimensions in unused fields via setattr during metadata stage
-    setattr(ch, "width", w)
-    setattr(ch, "height", h)
     return [ch]
 
 
 def transcribe_audio_with_whisper_cpp(path: str):
     """
-    Invoke local whisper.cpp binary and return (full_transcript, segments).
-    segments is a list of tuples (start_ms, end_ms, text).
-    Configure via env:
+    Transcribe with local whisper.cpp and return (full_transcript, segments).
+    segments is a list of tuples (start_ms, end_ms, text) with absolute times.
+    Long audio is split on silence and transcribed in parallel (see app/audio.py);
+    configure the `audio` section of config.yaml, or via env:
       WHISPER_CPP_BIN=./models/whisper/main
       WHISPER_CPP_MODEL=./models/whisper/ggml-base.en.bin
+    Raises audio.TranscriptionError on failure.
     """
-    binary = os.getenv("WHISPER_CPP_BIN", "./models/whisper/main")
-    model = os.getenv("WHISPER_CPP_MODEL", "./models/whisper/ggml-base.en.bin")
-    try:
-        with tempfile.TemporaryDirectory() as td:
-            out_prefix = os.path.join(td, "out")
-            out_json = out_prefix + ".json"
-            cmd = [binary, "-m", model, "-f", path, "-oj", "-of", out_prefix]
-            subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if os.path.exists(out_json):
-                import json
-                data = json.load(open(out_json, "r", encoding="utf-8"))
-                parts = []
-                segments = []
-                for seg in data.get("segments", []):
-                    text = (seg.get("text") or "").strip()
-                    if not text:
-                        continue
-                    parts.append(text)
-                    segments.append((seg.get("t0"), seg.get("t1"), text))
-                return " ".join(parts), segments
-    except Exception:
-        pass
-    return "", []
+    from .audio import transcribe
+
+    return transcribe(path)
 
 
 def extract_audio(path: str, file_name: str) -> List[Chunk]:
-    transcript, segments = transcribe_audio_with_whisper_cpp(path)
-    chunks: List[Chunk] = []
-    split = _split_text(transcript)
-    for ch in split:
-        c = Chunk(content=ch, file_name=file_name, file_type="audio", filepath=path)
-        setattr(c, "segments", segments)
-        chunks.append(c)
-    return chunks
+    from .audio import span_timestamps
+
+    _, segments = transcribe_audio_with_whisper_cpp(path)
+    text, bounds = "", []
+    for _, _, seg_text in segments:
+        bounds.append((len(text), len(text) + len(seg_text)))
+        text += seg_text + " "
+    spans = _split_spans(text)
+    return [
+        Chunk(
+            content=text[s:e], file_name=file_name, file_type="audio", filepath=path, timestamp=ts
+        )
+        for (s, e), ts in zip(spans, span_timestamps(spans, bounds, segments))
+    ]
 
 
 def extract_any(path: str, file_name: str, mime: str) -> List[Chunk]:
@@ -136,5 +184,3 @@ def extract_any(path: str, file_name: str, mime: str) -> List[Chunk]:
         return [Chunk(content=ch, file_name=file_name, file_type="text", filepath=path) for ch in _split_text(text)]
     except Exception:
         return []
-
-
@@ -0,0 +1,72 @@
+"""
+Hybrid retrieval: FAISS vector search fused with SQLite FTS5 (BM25) keyword search.
+
+Dense retrieval finds paraphrases but misses exact tokens such as part
+numbers, error codes and names; BM25 finds those. Both run on the calling
+thread (a search or query stage worker), so the stage limits bound them,
+each returning its `hybrid.candidates` best text chunks, and the two rankings
+are merged with reciprocal rank fusion: score = sum over rankings of
+1 / (`hybrid.rrf_k` + rank). RRF only uses ranks, so cosine similarities
+and bm25 scores never have to be calibrated against each other.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .config import get_section
+from .embeddings import embed_query
+from .index_store import get_index_manager, lexical_search, lookup_vectors, search_collection
+
+
+MODES = ("dense", "hybrid")
+
+
+def rrf_fuse(rankings: Sequence[Sequence[int]], rrf_k: int = 60) -> List[Tuple[int, float]]:
+    """(id, fused score) for every id in `rankings`, best first."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, vid in enumerate(ranking, start=1):
+            scores[vid] = scores.get(vid, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def hybrid_search(
+    query: str,
+    k: int,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    filters: Optional[dict] = None,
+) -> List[dict]:
+    """Top-`k` text chunks for `query` by RRF over vector and BM25 rankings.
+
+    `filters` (see index_store.parse_filters) restrict both retrievers.
+
+    Each result is the chunk's metadata row with `score` (the fused score),
+    `dense_rank` and `lexical_rank` (1-based, None if that retriever missed it).
+    """
+    cfg = get_section("hybrid")
+    candidates = max(k, int(cfg.get("candidates", 50)))
+    dense: List[int] = []
+    if get_index_manager("text").ntotal:
+        _, I = search_collection("text", embed_query(query), candidates, nprobe, ef_search, filters)
+        dense = [int(i) for i in I[0] if i >= 0]
+    keyword = [vid for vid, _ in lexical_search(query, candidates, filters=filters)]
+
+    fused = rrf_fuse([dense, keyword], int(cfg.get("rrf_k", 60)))[:k]
+    meta_map = lookup_vectors([vid for vid, _ in fused], "text")
+    dense_rank = {vid: r for r, vid in enumerate(dense, start=1)}
+    lexical_rank = {vid: r for r, vid in enumerate(keyword, start=1)}
+    results = []
+    for vid, score in fused:
+        row = meta_map.get(vid)
+        if row:
+            results.append(
+                {
+                    **row,
+                    "score": score,
+                    "dense_rank": dense_rank.get(vid),
+                    "lexical_rank": lexical_rank.get(vid),
+                }
+            )
+    return results
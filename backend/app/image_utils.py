@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Optional, Tuple
+
 from PIL import Image
 
 
@@ -8,3 +10,21 @@ def get_image_size(path: str) -> tuple[int, int]:
         return im.width, im.height
 
 
+def load_image(path: str, min_side: Optional[int] = None) -> Tuple[Image.Image, Tuple[int, int]]:
+    """Decode an image as RGB and return it with its original (width, height).
+
+    With `min_side`, large images are decoded at a reduced scale where that is
+    cheap (DCT scaling via `draft` for JPEGs, integer box `reduce` otherwise),
+    never going below `min_side` on the short side. The model input is far
+    smaller than a camera photo, so most of a full decode is thrown away.
+    """
+    with Image.open(path) as im:
+        size = im.size
+        if min_side and im.format == "JPEG":
+            im.draft("RGB", (min_side, min_side))
+        rgb = im.convert("RGB")
+    if min_side:
+        factor = min(rgb.size) // min_side
+        if factor >= 2:
+            rgb = rgb.reduce(factor)
+    return rgb, size
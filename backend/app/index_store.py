@@ -1,27 +1,42 @@
 from __future__ import annotations
 
+import json
 import os
+import re
 import sqlite3
+import threading
+import unicodedata
 from contextlib import contextmanager
-from typing import Iterable, List, Optional, Tuple
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import faiss
 import numpy as np
 
+from .config import get_section
+from .embedding_store import EmbeddingStore
+
 
 STORAGE_DIR = os.path.join(os.path.dirname(__file__), "..", "storage")
 STORAGE_DIR = os.path.abspath(STORAGE_DIR)
 INDEX_PATH = os.path.join(STORAGE_DIR, "faiss.index")
 DB_PATH = os.path.join(STORAGE_DIR, "metadata.db")
 
+# Each collection has its own FAISS index, dimension and vector-id space:
+# MiniLM-L6-v2 text chunks and CLIP ViT-B-32 images.
+COLLECTIONS = {"text": 384, "image": 512}
+# recorded with stored embeddings; a mismatch means they must be re-encoded
+EMBEDDING_MODELS = {
+    "text": "sentence-transformers/all-MiniLM-L6-v2",
+    "image": "open_clip/ViT-B-32/openai",
+}
+
 
 def ensure_storage():
     os.makedirs(STORAGE_DIR, exist_ok=True)
 
 
-def connect_db():
-    ensure_storage()
-    conn = sqlite3.connect(DB_PATH)
+def _migrate_v1(conn: sqlite3.Connection) -> None:
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS vectors (
@@ -39,89 +54,1357 @@ def connect_db():
         )
         """
     )
-    conn.commit()
+
+
+def _migrate_v2(conn: sqlite3.Connection) -> None:
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(vectors)")}
+    if "collection" not in columns:
+        conn.execute("ALTER TABLE vectors ADD COLUMN collection TEXT NOT NULL DEFAULT 'text'")
+        conn.execute("UPDATE vectors SET collection = 'image' WHERE file_type = 'image'")
+
+
+def _migrate_v3(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_vectors_vector_id ON vectors (collection, vector_id)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vectors_file_name ON vectors (file_name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vectors_file_type ON vectors (file_type)")
+
+
+def _migrate_v4(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS files (
+            file_name TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            size INTEGER,
+            chunks INTEGER,
+            ingested_at TEXT
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files (content_hash)")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(vectors)")}
+    if "chunk_hash" not in columns:
+        conn.execute("ALTER TABLE vectors ADD COLUMN chunk_hash TEXT")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_vectors_chunk_hash ON vectors (file_name, chunk_hash)"
+    )
+
+
+_FTS_INSERT = "INSERT INTO vectors_fts (rowid, content) VALUES (new.id, new.content);"
+_FTS_DELETE = (
+    "INSERT INTO vectors_fts (vectors_fts, rowid, content) VALUES ('delete', old.id, old.content);"
+)
+
+
+def _migrate_v5(conn: sqlite3.Connection) -> None:
+    # BM25 index over chunk text; an external-content table, so text isn't stored twice.
+    # '-' and '_' are token characters so part numbers and error codes stay whole.
+    conn.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS vectors_fts USING fts5(
+            content, content='vectors', content_rowid='id', tokenize="unicode61 tokenchars '-_'"
+        )
+        """
+    )
+    for name, event, body in (
+        ("insert", "INSERT", _FTS_INSERT),
+        ("delete", "DELETE", _FTS_DELETE),
+        ("update", "UPDATE OF content", _FTS_DELETE + " " + _FTS_INSERT),
+    ):
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS vectors_fts_{name} AFTER {event} ON vectors BEGIN {body} END"
+        )
+    conn.execute("INSERT INTO vectors_fts (vectors_fts) VALUES ('rebuild')")
+
+
+def _migrate_v6(conn: sqlite3.Connection) -> None:
+    # search filters (file_name and file_type already have indexes)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_vectors_page_number ON vectors (collection, page_number)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_ingested_at ON files (ingested_at)")
+
+
+# applied in order; PRAGMA user_version records how many have run
+MIGRATIONS = [_migrate_v1, _migrate_v2, _migrate_v3, _migrate_v4, _migrate_v5, _migrate_v6]
+
+_db_local = threading.local()
+_db_init_lock = threading.Lock()
+_db_initialized: set = set()
+
+
+def _open_db() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -65536")  # 64 MiB page cache
+    conn.execute("PRAGMA mmap_size = 268435456")
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def init_db() -> None:
+    """Switch the metadata DB to WAL and apply pending schema migrations, once per process."""
+    if DB_PATH in _db_initialized:
+        return
+    with _db_init_lock:
+        if DB_PATH in _db_initialized:
+            return
+        ensure_storage()
+        conn = _open_db()
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for i, migrate in enumerate(MIGRATIONS[version:], start=version + 1):
+                with conn:
+                    migrate(conn)
+                    conn.execute(f"PRAGMA user_version = {i}")
+        finally:
+            conn.close()
+        _db_initialized.add(DB_PATH)
+
+
+def connect_db() -> sqlite3.Connection:
+    """Return this thread's pooled connection to the metadata DB.
+
+    Connections are opened once per thread and reused; callers must not close
+    them. Use `with conn:` for a transaction.
+    """
+    init_db()
+    conns = getattr(_db_local, "conns", None)
+    if conns is None:
+        conns = _db_local.conns = {}
+    conn = conns.get(DB_PATH)
+    if conn is None:
+        conn = conns[DB_PATH] = _open_db()
     return conn
 
 
-def load_or_init_index(dim: int) -> faiss.Index:
+class RWLock:
+    """Writer-preferring readers/writer lock.
+
+    Any number of readers may hold the lock at once; a writer waits for the
+    active readers to drain and blocks new readers while it is queued.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+def _file_signature(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    """The storage index inside an IndexIDMap2 wrapper (or the index itself)."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def index_ids(index: faiss.Index) -> np.ndarray:
+    """Explicit vector ids, in storage order."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    # legacy indexes address vectors by position
+    return np.arange(index.ntotal, dtype=np.int64)
+
+
+def _max_id(index: Optional[faiss.Index]) -> int:
+    if index is None or index.ntotal == 0:
+        return -1
+    return int(index_ids(index).max())
+
+
+def reconstruct_all(index: faiss.Index) -> np.ndarray:
+    inner = _unwrap(index)
+    if inner.ntotal == 0:
+        return np.zeros((0, inner.d), dtype=np.float32)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        ivf.make_direct_map()
+    return inner.reconstruct_n(0, inner.ntotal)
+
+
+def with_ids(index: faiss.Index) -> faiss.IndexIDMap2:
+    """Wrap an index in IndexIDMap2 so vectors carry explicit 64-bit ids.
+
+    Vectors of a legacy positional index keep their position as their id,
+    which is what the metadata DB already recorded for them.
+    """
+    if isinstance(index, faiss.IndexIDMap2):
+        return index
+    vectors, ids = reconstruct_all(index), index_ids(index)
+    inner = faiss.clone_index(_unwrap(index))
+    inner.reset()  # keeps any trained quantizer
+    wrapped = faiss.IndexIDMap2(inner)
+    if len(ids):
+        wrapped.add_with_ids(vectors, ids)
+    return wrapped
+
+
+def _without_ids(index: faiss.IndexIDMap2, ids: np.ndarray) -> faiss.IndexIDMap2:
+    """Drop ids from an index, rebuilding it when the index type can't remove in place (HNSW)."""
+    try:
+        index.remove_ids(faiss.IDSelectorBatch(ids))
+        return index
+    except RuntimeError:
+        keep = ~np.isin(index_ids(index), ids)
+        vectors, kept_ids = reconstruct_all(index)[keep], index_ids(index)[keep]
+        inner = faiss.clone_index(_unwrap(index))
+        inner.reset()
+        rebuilt = faiss.IndexIDMap2(inner)
+        if len(kept_ids):
+            rebuilt.add_with_ids(vectors, kept_ids)
+        return rebuilt
+
+
+class DeltaSegment:
+    """Append-only write-ahead log of vectors not yet merged into the base index.
+
+    Rows are stored as raw float32 in `<index>.delta` with their int64 ids in
+    `<index>.delta.ids`, plus a small JSON sidecar recording the dimension and
+    the next id to hand out. New vectors only ever cost an append, so bulk
+    ingests no longer rewrite the whole base index per file.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.ids_path = path + ".ids"
+        self.meta_path = path + ".json"
+        self.dim = dim
+        self.next_id = 0
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    def signature(self) -> tuple:
+        return (
+            _file_signature(self.path),
+            _file_signature(self.ids_path),
+            _file_signature(self.meta_path),
+        )
+
+    def load(self, base_max_id: int) -> None:
+        """Read the log from disk, dropping rows already merged into the base."""
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+        self.next_id = base_max_id + 1
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if int(meta["dim"]) != self.dim:
+            raise ValueError(f"delta segment has dim {meta['dim']}, index has dim {self.dim}")
+        self.next_id = max(self.next_id, int(meta.get("next_id", 0)))
+        if not os.path.exists(self.path):
+            return
+        rows = np.fromfile(self.path, dtype=np.float32)
+        n = rows.size // self.dim
+        if os.path.exists(self.ids_path):
+            ids = np.fromfile(self.ids_path, dtype=np.int64)
+        else:
+            # segments written before explicit ids were positional from start_id
+            ids = int(meta.get("start_id", 0)) + np.arange(n, dtype=np.int64)
+        # a torn final append leaves a partial row or a row without its id; ignore it
+        n = min(n, len(ids))
+        rows, ids = rows[: n * self.dim].reshape(n, self.dim), ids[:n]
+        # a crash between compaction's base rename and delta reset leaves merged rows behind
+        live = ids > base_max_id
+        if live.any():
+            self.index.add_with_ids(np.ascontiguousarray(rows[live]), ids[live])
+            self.next_id = max(self.next_id, int(ids.max()) + 1)
+
+    def append(self, embeddings: np.ndarray) -> np.ndarray:
+        """Log vectors under freshly allocated ids and return those ids."""
+        ensure_storage()
+        ids = np.arange(self.next_id, self.next_id + len(embeddings), dtype=np.int64)
+        if not os.path.exists(self.meta_path):
+            self._write_meta()
+        for path, arr in (
+            (self.path, np.ascontiguousarray(embeddings, dtype=np.float32)),
+            (self.ids_path, ids),
+        ):
+            with open(path, "ab") as f:
+                f.write(arr.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.index.add_with_ids(embeddings, ids)
+        self.next_id += len(ids)
+        return ids
+
+    def contents(self) -> Tuple[np.ndarray, np.ndarray]:
+        return reconstruct_all(self.index), index_ids(self.index)
+
+    def reset(self, next_id: int) -> None:
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dim))
+        self.next_id = max(self.next_id, next_id)
+        self._rewrite()
+
+    def _rewrite(self) -> None:
+        ensure_storage()
+        vectors, ids = self.contents()
+        for path, arr in ((self.path, vectors), (self.ids_path, ids)):
+            tmp = path + ".tmp"
+            arr.tofile(tmp)
+            os.replace(tmp, path)
+        self._write_meta()
+
+    def _write_meta(self) -> None:
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "next_id": self.next_id}, f)
+        os.replace(tmp, self.meta_path)
+
+
+class TombstoneSet:
+    """Ids deleted from the base index but not yet physically removed.
+
+    Deletes only append to `<index>.tombstones` and are hidden from searches
+    by an IDSelector, so they take effect immediately without rewriting the
+    base file; compaction drops the vectors for real and clears the set.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ids = np.zeros(0, dtype=np.int64)
+        self._selector: Optional[tuple] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def signature(self) -> Optional[tuple]:
+        return _file_signature(self.path)
+
+    def load(self, present: np.ndarray) -> None:
+        ids = (
+            np.fromfile(self.path, dtype=np.int64)
+            if os.path.exists(self.path)
+            else np.zeros(0, dtype=np.int64)
+        )
+        # ids a crashed compaction already purged are no longer in the index
+        self._set(np.intersect1d(ids, present))
+
+    def add(self, ids: np.ndarray) -> None:
+        ensure_storage()
+        with open(self.path, "ab") as f:
+            f.write(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._set(np.union1d(self.ids, ids))
+
+    def reset(self, ids: Optional[np.ndarray] = None) -> None:
+        ensure_storage()
+        ids = np.zeros(0, dtype=np.int64) if ids is None else ids.astype(np.int64)
+        tmp = self.path + ".tmp"
+        ids.tofile(tmp)
+        os.replace(tmp, self.path)
+        self._set(ids)
+
+    def _set(self, ids: np.ndarray) -> None:
+        self.ids = ids.astype(np.int64)
+        self._selector = None
+
+    def selector(self) -> Optional[faiss.IDSelector]:
+        """An IDSelector that rejects every tombstoned id, or None if there are none."""
+        if not len(self.ids):
+            return None
+        if self._selector is None:
+            batch = faiss.IDSelectorBatch(self.ids)
+            # keep the inner selector alive as long as the wrapper that points at it
+            self._selector = (batch, faiss.IDSelectorNot(batch))
+        return self._selector[1]
+
+
+def id_selector(ids: np.ndarray) -> Tuple[faiss.IDSelector, tuple]:
+    """The cheapest IDSelector accepting exactly `ids`, and the objects it points into.
+
+    A contiguous run of ids (a file ingested in one go) becomes a range; ids
+    dense enough that one bit per id up to the largest beats a hash set become
+    a bitmap; anything sparser a batch (hash set + bloom filter). The second
+    element must be kept alive for as long as the selector is used.
+    """
+    ids = np.unique(ids.astype(np.int64))
+    lo, hi = int(ids[0]), int(ids[-1])
+    if hi - lo + 1 == len(ids):
+        sel = faiss.IDSelectorRange(lo, hi + 1)
+        return sel, (sel,)
+    if (hi + 1) // 8 <= 8 * len(ids):
+        mask = np.zeros(hi + 1, dtype=bool)
+        mask[ids] = True
+        bitmap = np.packbits(mask, bitorder="little")
+        sel = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))  # length in bytes
+        return sel, (sel, bitmap)
+    sel = faiss.IDSelectorBatch(ids)
+    return sel, (sel,)
+
+
+def exact_search(
+    queries: np.ndarray, vectors: np.ndarray, ids: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Brute-force inner-product top-k over `vectors`, padded like a FAISS result."""
+    scores = queries @ np.asarray(vectors, dtype=np.float32).T
+    n, m = scores.shape
+    kk = min(k, m)
+    top = (
+        np.argpartition(-scores, kk - 1, axis=1)[:, :kk] if kk else np.zeros((n, 0), dtype=np.int64)
+    )
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    D = np.full((n, k), -np.finfo(np.float32).max, dtype=np.float32)
+    I = np.full((n, k), -1, dtype=np.int64)
+    D[:, :kk] = np.take_along_axis(top_scores, order, axis=1)
+    I[:, :kk] = ids[np.take_along_axis(top, order, axis=1)]
+    return D, I
+
+
+def _merge_results(
+    parts: List[Tuple[np.ndarray, np.ndarray]], k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    D = np.concatenate([p[0] for p in parts], axis=1)
+    I = np.concatenate([p[1] for p in parts], axis=1)
+    order = np.argsort(-D, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+
+def _training_sample(vectors: np.ndarray) -> np.ndarray:
+    limit = int(get_section("index").get("train_size", 100000))
+    if len(vectors) <= limit:
+        return vectors
+    rows = np.random.default_rng(0).choice(len(vectors), size=limit, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def build_index(
+    dim: int,
+    factory: Optional[str] = None,
+    vectors: Optional[np.ndarray] = None,
+    ids: Optional[np.ndarray] = None,
+) -> faiss.Index:
+    """Create an inner-product index from a FAISS factory string and fill it.
+
+    `factory` defaults to `index.factory` in config.yaml (e.g. `Flat`,
+    `HNSW32`, `IVF4096,PQ32`). Indexes that need training are trained on a
+    sample of `vectors`; when there are too few vectors to train on, an exact
+    Flat index is returned instead and upgraded later by compaction. With
+    `ids` the index is wrapped in IndexIDMap2 and vectors are added under them.
+    """
+    factory = factory or get_section("index").get("factory") or "Flat"
+    index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        try:
+            if vectors is None or not len(vectors):
+                raise RuntimeError("no training vectors")
+            index.train(_training_sample(vectors))
+        except RuntimeError:
+            index = faiss.IndexFlatIP(dim)
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        if len(ids):
+            index.add_with_ids(vectors, ids)
+    elif vectors is not None and len(vectors):
+        index.add(vectors)
+    return index
+
+
+def search_params(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    sel: Optional[faiss.IDSelector] = None,
+):
+    """Per-query FAISS search parameters for IVF (`nprobe`) and HNSW (`efSearch`) indexes.
+
+    `sel` restricts the search to the ids it accepts (used to hide tombstoned vectors).
+    """
+    cfg = get_section("index")
+    nprobe = nprobe or cfg.get("nprobe")
+    ef_search = ef_search or cfg.get("ef_search")
+    extra = {"sel": sel} if sel is not None else {}
+    index = _unwrap(index)
+    if nprobe and faiss.try_extract_index_ivf(index) is not None:
+        return faiss.SearchParametersIVF(nprobe=int(nprobe), **extra)
+    if ef_search and isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search), **extra)
+    return faiss.SearchParameters(**extra) if extra else None
+
+
+def _maybe_upgrade(index: faiss.Index) -> faiss.Index:
+    """Migrate a Flat index to `index.ann_factory` once it crosses the size threshold."""
+    cfg = get_section("index")
+    factory = cfg.get("ann_factory")
+    threshold = int(cfg.get("auto_upgrade_threshold", 0) or 0)
+    if (
+        not factory
+        or not threshold
+        or not isinstance(_unwrap(index), faiss.IndexFlat)
+        or index.ntotal < threshold
+    ):
+        return index
+    upgraded = build_index(index.d, factory, reconstruct_all(index), index_ids(index))
+    return upgraded if not isinstance(_unwrap(upgraded), faiss.IndexFlat) else index
+
+
+class IndexManager:
+    """Keeps one FAISS index resident in memory for the whole process.
+
+    The index is a read-mostly base file plus a `DeltaSegment` of recent
+    appends; searches cover both. Both are read from disk once and then
+    served from memory, and are only re-read when their signature (mtime,
+    size) changes underneath us, e.g. after an offline
+    `scripts/rebuild_index.py` run. `compact()` folds the delta into the base
+    with write-temp-then-rename, and runs in the background once the delta
+    grows past `index.delta_max_vectors`, and also migrates a Flat base to
+    `index.ann_factory` once it crosses `index.auto_upgrade_threshold`.
+
+    Deletes are tombstones (see `TombstoneSet`) filtered out at query time;
+    compaction also purges them, and is started in the background once they
+    exceed `index.tombstone_ratio` of the index.
+    """
+
+    def __init__(self, path: str, dim: int, store: Optional[EmbeddingStore] = None):
+        self.path = path
+        self.dim = dim
+        # the collection's stored embeddings, pruned along with the index by compaction
+        self.store = store
+        self._lock = RWLock()
+        # serializes writers (appends, compaction) without blocking readers
+        self._write_mutex = threading.Lock()
+        self._index: Optional[faiss.Index] = None
+        self._delta = DeltaSegment(path + ".delta", dim)
+        self._tombstones = TombstoneSet(path + ".tombstones")
+        self._sig: Optional[tuple] = None
+        self._loaded = False
+        # bumped on every change to the searchable contents; used to invalidate caches
+        self._version = 0
+        self._compacting = False
+        self._compact_flag_lock = threading.Lock()
+
+    def _read(self, mmap: Optional[bool] = None) -> faiss.Index:
+        if mmap is None:
+            mmap = bool(get_section("index").get("mmap"))
+        return with_ids(faiss.read_index(self.path, faiss.IO_FLAG_MMAP if mmap else 0))
+
+    def _signature(self) -> tuple:
+        return (_file_signature(self.path), self._delta.signature(), self._tombstones.signature())
+
+    def _load_locked(self) -> None:
+        sig = self._signature()
+        if self._loaded and sig == self._sig:
+            return
+        self._index = self._read() if sig[0] is not None else None
+        self._delta.load(_max_id(self._index))
+        self._tombstones.load(self._present_ids())
+        self._sig = self._signature()
+        self._loaded = True
+        self._version += 1
+
+    def _present_ids(self) -> np.ndarray:
+        base = index_ids(self._index) if self._index is not None else np.zeros(0, dtype=np.int64)
+        return np.concatenate([base, index_ids(self._delta.index)])
+
+    def load(self) -> None:
+        """Load the index if it is not resident yet or changed on disk."""
+        if self._loaded and self._signature() == self._sig:
+            return
+        with self._lock.write():
+            self._load_locked()
+
+    @property
+    def ntotal(self) -> int:
+        self.load()
+        with self._lock.read():
+            base = self._index.ntotal if self._index is not None else 0
+            return base + self._delta.ntotal - len(self._tombstones)
+
+    @property
+    def delta_total(self) -> int:
+        self.load()
+        with self._lock.read():
+            return self._delta.ntotal
+
+    @property
+    def tombstones(self) -> int:
+        self.load()
+        with self._lock.read():
+            return len(self._tombstones)
+
+    @property
+    def version(self) -> int:
+        self.load()
+        return self._version
+
+    @property
+    def index_type(self) -> Optional[str]:
+        self.load()
+        with self._lock.read():
+            return type(_unwrap(self._index)).__name__ if self._index is not None else None
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        subset: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k ids and scores; with `subset`, only those ids are considered, inside the FAISS search."""
+        self.load()
+        if subset is not None and not len(subset):
+            n = queries.shape[0]
+            return np.zeros((n, 0), dtype=np.float32), np.zeros((n, 0), dtype=np.int64)
+        with self._lock.read():
+            parts = []
+            sel = self._tombstones.selector()
+            if subset is not None:
+                # `keep` holds what the selectors point into until the search returns
+                subset_sel, keep = id_selector(subset)
+                sel = faiss.IDSelectorAnd(subset_sel, sel) if sel is not None else subset_sel
+            if self._index is not None and self._index.ntotal:
+                params = search_params(self._index, nprobe, ef_search, sel)
+                parts.append(self._index.search(queries, k, params=params))
+            if self._delta.ntotal:
+                params = faiss.SearchParameters(sel=sel) if sel is not None else None
+                parts.append(self._delta.index.search(queries, k, params=params))
+        if not parts:
+            n = queries.shape[0]
+            return np.zeros((n, 0), dtype=np.float32), np.zeros((n, 0), dtype=np.int64)
+        if len(parts) == 1:
+            return parts[0]
+        return _merge_results(parts, k)
+
+    def add(self, embeddings: np.ndarray) -> int:
+        """Append vectors to the delta segment under consecutive new ids; returns the first one."""
+        with self._write_mutex:
+            self.load()
+            with self._lock.write():
+                start_id = int(self._delta.append(embeddings)[0])
+                self._sig = self._signature()
+                self._version += 1
+            pending = self._delta.ntotal
+        if pending >= int(get_section("index").get("delta_max_vectors", 50000)):
+            self.compact_in_background()
+        return start_id
+
+    def compact(self) -> dict:
+        """Merge the delta segment into the base index file and purge tombstoned vectors.
+
+        Purged vectors are also dropped from the embedding store, if there is one.
+        """
+        with self._write_mutex:
+            self.load()
+            with self._lock.read():
+                dead = self._tombstones.ids.copy()
+            n = self._delta.ntotal
+            if n == 0 and not len(dead):
+                return {
+                    "merged": 0,
+                    "purged": 0,
+                    "vectors": self.ntotal,
+                    "index_type": self.index_type,
+                }
+            vectors, ids = self._delta.contents()
+            live = ~np.isin(ids, dead)
+            vectors, ids = vectors[live], ids[live]
+            # build on a private copy so readers keep using the resident index meanwhile
+            if self._index is not None:
+                index = self._read(mmap=False)
+                if len(dead):
+                    # vectors are reconstructed, never re-embedded
+                    index = _without_ids(index, dead)
+                if len(ids):
+                    index.add_with_ids(vectors, ids)
+            else:
+                index = build_index(self.dim, vectors=vectors, ids=ids)
+            before = type(_unwrap(index)).__name__
+            index = _maybe_upgrade(index)
+            ensure_storage()
+            tmp = self.path + ".tmp"
+            faiss.write_index(index, tmp)
+            with self._lock.write():
+                os.replace(tmp, self.path)
+                self._delta.reset(_max_id(index) + 1)
+                # deletes that arrived while we were building still apply to the new base
+                self._tombstones.reset(np.setdiff1d(self._tombstones.ids, dead))
+                self._index = self._read() if get_section("index").get("mmap") else index
+                self._sig = self._signature()
+                self._version += 1
+            if self.store is not None and len(dead):
+                # still under the write mutex, so no id is added to the index meanwhile
+                self.store.retain(self._present_ids())
+            result = {
+                "merged": len(ids),
+                "purged": len(dead),
+                "vectors": index.ntotal - len(self._tombstones),
+                "index_type": type(_unwrap(index)).__name__,
+            }
+            if result["index_type"] != before:
+                result["upgraded_from"] = before
+            return result
+
+    def compact_in_background(self) -> None:
+        with self._compact_flag_lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name="faiss-compact", daemon=True).start()
+
+    def remove(self, ids: Iterable[int]) -> int:
+        """Tombstone vectors by id; returns how many live vectors were deleted.
+
+        Takes effect for the next search straight away. Doesn't wait for a
+        running compaction, which carries later tombstones over to its result.
+        """
+        ids = np.unique(np.fromiter((int(i) for i in ids), dtype=np.int64))
+        if not len(ids):
+            return 0
+        self.load()
+        with self._lock.write():
+            ids = ids[np.isin(ids, self._present_ids())]
+            ids = np.setdiff1d(ids, self._tombstones.ids)
+            if len(ids):
+                self._tombstones.add(ids)
+                self._sig = self._signature()
+                self._version += 1
+            dead, total = (
+                len(self._tombstones),
+                (self._index.ntotal if self._index is not None else 0) + self._delta.ntotal,
+            )
+        ratio = float(get_section("index").get("tombstone_ratio", 0.2))
+        if dead and dead >= ratio * total:
+            self.compact_in_background()
+        return len(ids)
+
+    def replace(self, index: faiss.Index) -> None:
+        """Atomically swap in a freshly built index, discarding the delta."""
+        index = with_ids(index)
+        with self._write_mutex:
+            ensure_storage()
+            tmp = self.path + ".tmp"
+            faiss.write_index(index, tmp)
+            with self._lock.write():
+                os.replace(tmp, self.path)
+                self._delta.reset(_max_id(index) + 1)
+                self._tombstones.reset()
+                self._index = index
+                self._sig = self._signature()
+                self._loaded = True
+                self._version += 1
+
+
+_managers: dict = {}
+_manager_lock = threading.Lock()
+
+
+def index_path(collection: str = "text") -> str:
+    # the text collection keeps the historical faiss.index file name
+    if collection == "text":
+        return INDEX_PATH
+    return os.path.join(STORAGE_DIR, f"faiss_{collection}.index")
+
+
+def get_index_manager(collection: str = "text") -> IndexManager:
+    if collection not in COLLECTIONS:
+        raise ValueError(f"Unknown collection: {collection}")
+    path = index_path(collection)
+    store = get_embedding_store(collection)
+    with _manager_lock:
+        manager = _managers.get(collection)
+        if manager is None or manager.path != path or manager.store is not store:
+            manager = _managers[collection] = IndexManager(path, COLLECTIONS[collection], store)
+        return manager
+
+
+_stores: dict = {}
+
+
+def get_embedding_store(collection: str = "text") -> EmbeddingStore:
+    path = os.path.join(STORAGE_DIR, f"embeddings_{collection}")
+    with _manager_lock:
+        store = _stores.get(collection)
+        if store is None or store.path != path + ".f32":
+            store = _stores[collection] = EmbeddingStore(path)
+        return store
+
+
+def index_version() -> tuple:
+    """Version of the searchable contents of every collection."""
+    return tuple(get_index_manager(name).version for name in COLLECTIONS)
+
+
+def load_or_init_index(dim: int, collection: str = "text") -> faiss.Index:
     ensure_storage()
-    if os.path.exists(INDEX_PATH):
-        return faiss.read_index(INDEX_PATH)
+    path = index_path(collection)
+    if os.path.exists(path):
+        return faiss.read_index(path)
     index = faiss.IndexFlatIP(dim)
     return index
 
 
-def save_index(index: faiss.Index) -> None:
-    ensure_storage()
-    faiss.write_index(index, INDEX_PATH)
+def save_index(index: faiss.Index, collection: str = "text") -> None:
+    get_index_manager(collection).replace(index)
 
 
-def add_embeddings_with_metadata(embeddings: np.ndarray, metadatas: List[dict]) -> int:
+def add_embeddings_with_metadata(
+    embeddings: np.ndarray, metadatas: List[dict], collection: str = "text"
+) -> int:
     if embeddings.size == 0:
         return 0
-    index = load_or_init_index(embeddings.shape[1])
-    # store start id
-    start_id = index.ntotal
-    index.add(embeddings)
-    save_index(index)
+    manager = get_index_manager(collection)
+    if embeddings.shape[1] != manager.dim:
+        raise ValueError(
+            f"{collection} collection expects {manager.dim}-dim vectors, got {embeddings.shape[1]}"
+        )
+    start_id = manager.add(embeddings)
+    ids = np.arange(start_id, start_id + len(embeddings), dtype=np.int64)
+    get_embedding_store(collection).append(ids, embeddings, EMBEDDING_MODELS[collection])
 
     conn = connect_db()
-    cur = conn.cursor()
-    for i, meta in enumerate(metadatas):
-        cur.execute(
+    with conn:
+        conn.executemany(
             """
-            INSERT INTO vectors (vector_id, content, file_name, file_type, page_number, timestamp, filepath, width, height, bbox)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO vectors (vector_id, content, file_name, file_type, page_number, timestamp, filepath, width, height, bbox, collection, chunk_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (
-                start_id + i,
-                meta.get("content"),
-                meta.get("file_name"),
-                meta.get("file_type"),
-                meta.get("page_number"),
-                meta.get("timestamp"),
-                meta.get("filepath"),
-                meta.get("width"),
-                meta.get("height"),
-                meta.get("bbox"),
-            ),
-        )
-    conn.commit()
-    conn.close()
+            [
+                (
+                    start_id + i,
+                    meta.get("content"),
+                    meta.get("file_name"),
+                    meta.get("file_type"),
+                    meta.get("page_number"),
+                    meta.get("timestamp"),
+                    meta.get("filepath"),
+                    meta.get("width"),
+                    meta.get("height"),
+                    meta.get("bbox"),
+                    collection,
+                    meta.get("chunk_hash"),
+                )
+                for i, meta in enumerate(metadatas)
+            ],
+        )
     return embeddings.shape[0]
 
 
-def status() -> dict:
-    index_total = 0
-    if os.path.exists(INDEX_PATH):
-        index = faiss.read_index(INDEX_PATH)
-        index_total = index.ntotal
+def get_file(file_name: str) -> Optional[dict]:
+    row = (
+        connect_db()
+        .execute(
+            "SELECT file_name, content_hash, size, chunks, ingested_at FROM files WHERE file_name = ?",
+            (file_name,),
+        )
+        .fetchone()
+    )
+    if row is None:
+        return None
+    return {
+        "file_name": row[0],
+        "content_hash": row[1],
+        "size": row[2],
+        "chunks": row[3],
+        "ingested_at": row[4],
+    }
+
+
+def file_hashes(file_names: Iterable[str]) -> Dict[str, str]:
+    names = list(file_names)
+    out: Dict[str, str] = {}
+    # stay well under SQLite's bound-parameter limit
+    for i in range(0, len(names), 500):
+        part = names[i : i + 500]
+        placeholders = ",".join(["?"] * len(part))
+        rows = (
+            connect_db()
+            .execute(
+                f"SELECT file_name, content_hash FROM files WHERE file_name IN ({placeholders})",
+                part,
+            )
+            .fetchall()
+        )
+        out.update(dict(rows))
+    return out
+
+
+def find_file_by_hash(content_hash: str) -> Optional[str]:
+    # copies share one file's chunks; name that file
+    row = (
+        connect_db()
+        .execute(
+            "SELECT file_name FROM files WHERE content_hash = ? ORDER BY "
+            "EXISTS (SELECT 1 FROM vectors WHERE vectors.file_name = files.file_name) DESC, "
+            "ingested_at LIMIT 1",
+            (content_hash,),
+        )
+        .fetchone()
+    )
+    return row[0] if row else None
+
+
+def file_chunks(file_name: str) -> Dict[Optional[str], List[int]]:
+    """Row ids of a file's stored chunks, grouped by chunk hash (None for rows ingested before hashing)."""
+    out: Dict[Optional[str], List[int]] = {}
+    for rowid, chunk_hash in connect_db().execute(
+        "SELECT id, chunk_hash FROM vectors WHERE file_name = ? ORDER BY id", (file_name,)
+    ):
+        out.setdefault(chunk_hash, []).append(rowid)
+    return out
+
+
+def record_file(file_name: str, content_hash: str, size: int, chunks: int) -> None:
     conn = connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(DISTINCT file_name) FROM vectors")
-    files_count = cur.fetchone()[0]
-    conn.close()
-    return {"vectors": index_total, "files": files_count}
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO files (file_name, content_hash, size, chunks, ingested_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (file_name) DO UPDATE SET
+                content_hash = excluded.content_hash, size = excluded.size,
+                chunks = excluded.chunks, ingested_at = excluded.ingested_at
+            """,
+            (file_name, content_hash, size, chunks, datetime.now(timezone.utc).isoformat()),
+        )
 
 
-def rebuild_from_db(dim: int) -> dict:
+def delete_rows(row_ids: Iterable[int]) -> int:
+    """Delete metadata rows and remove their vectors from FAISS; returns vectors removed."""
+    row_ids = list(row_ids)
+    if not row_ids:
+        return 0
     conn = connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT rowid, content FROM vectors ORDER BY rowid")
-    rows = cur.fetchall()
-    conn.close()
-    if not rows:
-        # reset empty index
-        save_index(faiss.IndexFlatIP(dim))
-        return {"vectors": 0}
-    # Embedding requires text; images should have captions already stored in content
-    texts = [r[1] or "" for r in rows]
-    from .embeddings import embed_texts
-
-    embs = embed_texts(texts)
-    index = faiss.IndexFlatIP(embs.shape[1])
-    index.add(embs)
-    save_index(index)
-    return {"vectors": index.ntotal}
+    by_collection: Dict[str, List[int]] = {}
+    for i in range(0, len(row_ids), 500):
+        part = row_ids[i : i + 500]
+        placeholders = ",".join(["?"] * len(part))
+        for collection, vector_id in conn.execute(
+            f"SELECT collection, vector_id FROM vectors WHERE id IN ({placeholders})", part
+        ):
+            if vector_id is not None:
+                by_collection.setdefault(collection, []).append(vector_id)
+    with conn:
+        conn.executemany("DELETE FROM vectors WHERE id = ?", [(r,) for r in row_ids])
+    return sum(get_index_manager(c).remove(ids) for c, ids in by_collection.items())
+
+
+def file_aliases(file_name: str, content_hash: str) -> List[str]:
+    """Other ingested files with the same content, oldest first."""
+    rows = connect_db().execute(
+        "SELECT file_name FROM files WHERE content_hash = ? AND file_name != ? ORDER BY ingested_at",
+        (content_hash, file_name),
+    )
+    return [r[0] for r in rows]
+
+
+def hand_over_rows(row_ids: Iterable[int], file_name: str) -> None:
+    """Make stored chunks (and their vectors) belong to `file_name`, without re-embedding them."""
+    conn = connect_db()
+    with conn:
+        conn.execute(
+            "UPDATE vectors SET file_name = ? WHERE id IN (SELECT value FROM json_each(?))",
+            (file_name, json.dumps(list(row_ids))),
+        )
+        conn.execute(
+            "UPDATE files SET chunks = (SELECT count(*) FROM vectors WHERE file_name = ?) "
+            "WHERE file_name = ?",
+            (file_name, file_name),
+        )
+
+
+def delete_file(file_name: str) -> Optional[dict]:
+    """Remove every chunk of a file from the metadata DB and its indexes; None if it isn't ingested.
+
+    Chunks are stored once per content: if another file was ingested as a
+    copy of this one, the chunks become that file's instead of being deleted.
+    """
+    rows = [r for ids in file_chunks(file_name).values() for r in ids]
+    record = get_file(file_name)
+    if not rows and record is None:
+        return None
+    heirs = file_aliases(file_name, record["content_hash"]) if rows and record else []
+    if heirs:
+        hand_over_rows(rows, heirs[0])
+        removed = 0
+    else:
+        removed = delete_rows(rows)
+    conn = connect_db()
+    with conn:
+        conn.execute("DELETE FROM files WHERE file_name = ?", (file_name,))
+    out = {"file": file_name, "chunks_removed": len(rows), "vectors_removed": removed}
+    if heirs:
+        out["kept_for"] = heirs[0]
+    return out
+
+
+def lookup_vectors(ids: Iterable[int], collection: str = "text") -> dict:
+    """Fetch metadata rows for FAISS ids of a collection, keyed by vector_id."""
+    ids = sorted({int(i) for i in ids if i >= 0})
+    if not ids:
+        return {}
+    # one bound JSON array instead of a placeholder per id: any number of ids in one query
+    rows = (
+        connect_db()
+        .execute(
+            "SELECT vector_id, content, file_name, file_type, page_number, timestamp, filepath, width, height, bbox "
+            "FROM vectors WHERE collection = ? AND vector_id IN (SELECT value FROM json_each(?))",
+            (collection, json.dumps(ids)),
+        )
+        .fetchall()
+    )
+    return {
+        r[0]: {
+            "vector_id": r[0],
+            "content": r[1],
+            "file_name": r[2],
+            "file_type": r[3],
+            "page_number": r[4],
+            "timestamp": r[5],
+            "filepath": r[6],
+            "width": r[7],
+            "height": r[8],
+            "bbox": json.loads(r[9]) if r[9] else None,
+        }
+        for r in rows
+    }
+
+
+FILTER_KEYS = (
+    "file_name",
+    "file_type",
+    "page_min",
+    "page_max",
+    "ingested_after",
+    "ingested_before",
+)
+
+
+def parse_filters(raw: Optional[dict]) -> Optional[dict]:
+    """Validate and normalize search filters; None when there are none.
+
+    - file_name, file_type: a string or a list of strings (any of them)
+    - page_min, page_max: inclusive page range (chunks without a page never match)
+    - ingested_after, ingested_before: ISO dates or datetimes (UTC when no
+      offset is given), compared with the file's last ingest; after is
+      inclusive, before exclusive
+
+    Raises ValueError on unknown keys or malformed values.
+    """
+    if not raw:
+        return None
+    if not isinstance(raw, dict):
+        raise ValueError("filters must be an object")
+    unknown = sorted(set(raw) - set(FILTER_KEYS))
+    if unknown:
+        raise ValueError(
+            f"Unknown filter: {', '.join(unknown)} (expected {', '.join(FILTER_KEYS)})"
+        )
+    out: dict = {}
+    for key in ("file_name", "file_type"):
+        value = raw.get(key)
+        if value is None:
+            continue
+        values = [value] if isinstance(value, str) else value
+        if (
+            not isinstance(values, list)
+            or not values
+            or not all(isinstance(v, str) for v in values)
+        ):
+            raise ValueError(f"{key} must be a string or a non-empty list of strings")
+        out[key] = sorted(set(values))
+    for key in ("page_min", "page_max"):
+        value = raw.get(key)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f"{key} must be an integer")
+        out[key] = value
+    for key in ("ingested_after", "ingested_before"):
+        value = raw.get(key)
+        if value is None:
+            continue
+        try:
+            when = datetime.fromisoformat(str(value))
+        except ValueError:
+            raise ValueError(f"{key} must be an ISO date or datetime") from None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        # same format record_file writes, so the strings compare chronologically
+        out[key] = when.astimezone(timezone.utc).isoformat()
+    return out or None
+
+
+def filter_sql(filters: dict) -> Tuple[List[str], list]:
+    """WHERE conditions on `vectors v` for parsed filters, and their parameters."""
+    where: List[str] = []
+    params: list = []
+    for key in ("file_name", "file_type"):
+        if key in filters:
+            where.append(f"v.{key} IN ({','.join(['?'] * len(filters[key]))})")
+            params.extend(filters[key])
+    if "page_min" in filters:
+        where.append("v.page_number >= ?")
+        params.append(filters["page_min"])
+    if "page_max" in filters:
+        where.append("v.page_number <= ?")
+        params.append(filters["page_max"])
+    for key, op in (("ingested_after", ">="), ("ingested_before", "<")):
+        if key in filters:
+            where.append(f"v.file_name IN (SELECT file_name FROM files WHERE ingested_at {op} ?)")
+            params.append(filters[key])
+    return where, params
+
+
+def filter_ids(filters: dict, collection: str = "text") -> np.ndarray:
+    """Sorted vector ids of a collection's chunks matching `filters`."""
+    where, params = filter_sql(filters)
+    rows = (
+        connect_db()
+        .execute(
+            "SELECT v.vector_id FROM vectors v WHERE v.collection = ? AND v.vector_id IS NOT NULL"
+            + "".join(f" AND {w}" for w in where),
+            [collection, *params],
+        )
+        .fetchall()
+    )
+    return np.unique(np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)))
+
+
+def search_collection(
+    collection: str,
+    queries: np.ndarray,
+    k: int,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    filters: Optional[dict] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Search a collection, restricted to the chunks matching parsed `filters`.
+
+    The matching ids come from the metadata DB and are handed to FAISS as an
+    IDSelector, so the top-k is taken among them rather than filtered out of
+    an over-fetched result. Up to `index.filter_exact_max` matches are scored
+    exactly against their stored embeddings instead: with few candidates that
+    is cheaper than a graph/IVF walk that keeps rejecting ids, and never
+    comes back short.
+    """
+    manager = get_index_manager(collection)
+    if not filters:
+        return manager.search(queries, k, nprobe=nprobe, ef_search=ef_search)
+    ids = filter_ids(filters, collection)
+    if len(ids) <= int(get_section("index").get("filter_exact_max", 20000)):
+        found, vectors = get_embedding_store(collection).get(
+            ids, EMBEDDING_MODELS[collection], manager.dim
+        )
+        if found.all():
+            return exact_search(queries, vectors, ids, k)
+    return manager.search(queries, k, nprobe=nprobe, ef_search=ef_search, subset=ids)
+
+
+_FTS_TOKEN = re.compile(r"[\w\-]+")
+
+
+def fts_terms(text: str) -> List[str]:
+    """Distinct query terms, folded the way the unicode61 tokenizer folds indexed text."""
+    text = "".join(
+        c for c in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(c)
+    )
+    terms: List[str] = []
+    for term in _FTS_TOKEN.findall(text):
+        term = term.strip("-")
+        if term and term not in terms:
+            terms.append(term)
+    return terms
+
+
+def fts_query(terms: Iterable[str]) -> Optional[str]:
+    """An FTS5 OR-query of `terms`, each quoted so punctuation can't break the syntax."""
+    return " OR ".join(f'"{t}"' for t in terms) or None
+
+
+def lexical_search(
+    query: str,
+    k: int,
+    collection: str = "text",
+    max_postings: Optional[int] = None,
+    filters: Optional[dict] = None,
+) -> List[Tuple[int, float]]:
+    """(vector_id, bm25) of the `k` best keyword matches, best first (FTS5 bm25 is lower-is-better).
+
+    BM25 has to score every chunk containing any query term, so terms are
+    taken rarest first while their combined document count (within the
+    collection and filters) stays within `max_postings` (default
+    `hybrid.max_postings`). The rarest term is always searched, even over
+    budget, so a large corpus never turns hybrid search into vector-only
+    search; words that occur everywhere weigh almost nothing in BM25 and are
+    left to the vector search, which keeps latency flat as the corpus grows.
+    """
+    terms = fts_terms(query)
+    if not terms:
+        return []
+    if max_postings is None:
+        max_postings = int(get_section("hybrid").get("max_postings", 2000))
+    where, params = filter_sql(filters or {})
+    scope = (
+        "FROM vectors_fts f JOIN vectors v ON v.id = f.rowid "
+        "WHERE vectors_fts MATCH ? AND v.collection = ? AND v.vector_id IS NOT NULL"
+        + "".join(f" AND {w}" for w in where)
+    )
+    conn = connect_db()
+    docs = {}
+    for term in terms:
+        # a bounded count: stops reading the term's posting list once it is over budget anyway
+        docs[term] = conn.execute(
+            f"SELECT count(*) FROM (SELECT 1 {scope} LIMIT ?)",
+            [fts_query([term]), collection, *params, max_postings + 1],
+        ).fetchone()[0]
+    picked, postings = [], 0
+    for term in sorted((t for t in terms if docs[t]), key=docs.get):
+        if picked and postings + docs[term] > max_postings:
+            break
+        picked.append(term)
+        postings += docs[term]
+    match = fts_query(picked)
+    if match is None:
+        return []
+    rows = conn.execute(
+        f"SELECT v.vector_id, f.rank {scope} ORDER BY f.rank LIMIT ?",
+        [match, collection, *params, k],
+    ).fetchall()
+    return [(int(vid), float(rank)) for vid, rank in rows]
+
+
+def status() -> dict:
+    files_count = (
+        connect_db().execute("SELECT COUNT(DISTINCT file_name) FROM vectors").fetchone()[0]
+    )
+    collections = {}
+    for name in COLLECTIONS:
+        manager = get_index_manager(name)
+        collections[name] = {
+            "vectors": manager.ntotal,
+            "delta_vectors": manager.delta_total,
+            "tombstones": manager.tombstones,
+            "stored_embeddings": get_embedding_store(name).count(),
+            "dim": manager.dim,
+            "index_type": manager.index_type,
+        }
+    return {
+        "vectors": sum(c["vectors"] for c in collections.values()),
+        "files": files_count,
+        "delta_vectors": sum(c["delta_vectors"] for c in collections.values()),
+        "collections": collections,
+    }
+
+
+def rebuild_from_db(
+    collection: str = "text", factory: Optional[str] = None, reembed: bool = False
+) -> dict:
+    """Rebuild a collection's index from the metadata DB and replace it.
+
+    Vectors come from the embedding store; only rows it has no vector for
+    (or every row, with `reembed`) go through the encoder. Text rows are
+    encoded from their content and image rows from the image file itself,
+    so CLIP vectors never degrade into caption-text vectors. Rows keep their
+    vector ids; rows whose source can no longer be embedded are left
+    unindexed (vector_id NULL). `factory` overrides `index.factory`, so
+    switching index types costs no encoding at all.
+    """
+    dim = COLLECTIONS[collection]
+    model = EMBEDDING_MODELS[collection]
+    store = get_embedding_store(collection)
+    conn = connect_db()
+    rows = conn.execute(
+        "SELECT id, vector_id, content, filepath FROM vectors WHERE collection = ? ORDER BY id",
+        (collection,),
+    ).fetchall()
+    if reembed:
+        found, vectors = np.zeros(len(rows), dtype=bool), np.zeros(
+            (len(rows), dim), dtype=np.float32
+        )
+    else:
+        found, vectors = store.get([r[1] if r[1] is not None else -1 for r in rows], model, dim)
+
+    missing = [i for i in range(len(rows)) if not found[i]]
+    if collection == "image":
+        missing = [i for i in missing if rows[i][3] and os.path.exists(rows[i][3])]
+    if missing:
+        if collection == "image":
+            from .embeddings import embed_image_paths
+
+            vectors[missing] = embed_image_paths([rows[i][3] for i in missing])
+        else:
+            from .embeddings import embed_texts
+
+            vectors[missing] = embed_texts([rows[i][2] or "" for i in missing])
+        found[missing] = True
 
+    next_id = max([r[1] for r in rows if r[1] is not None], default=-1) + 1
+    ids = np.full(len(rows), -1, dtype=np.int64)
+    updates = []
+    for i, r in enumerate(rows):
+        vector_id = None
+        if found[i]:
+            vector_id = r[1]
+            if vector_id is None:
+                vector_id, next_id = next_id, next_id + 1
+            ids[i] = vector_id
+        if vector_id != r[1]:
+            updates.append((vector_id, r[0]))
+    vectors, ids = vectors[found], ids[found]
 
+    index = build_index(dim, factory, vectors, ids)
+    with conn:
+        conn.executemany("UPDATE vectors SET vector_id = ? WHERE id = ?", updates)
+        save_index(index, collection)
+    # also drops vectors of rows deleted since the last rebuild
+    store.reset(ids, vectors, model)
+    return {
+        "vectors": index.ntotal,
+        "collection": collection,
+        "index_type": type(_unwrap(index)).__name__,
+        "reused": int(found.sum()) - len(missing),
+        "embedded": len(missing),
+    }
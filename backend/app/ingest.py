@@ -1,21 +1,357 @@
 """
-Placeholder ingestion module.
+Ingestion pipeline.
 
-Implement functions to:
-- Read documents from disk
-- Chunk text
-- Compute embeddings (e.g., sentence-transformers)
-- Store in a local vector store (e.g., FAISS)
+- `index_chunks` embeds extracted chunks and commits them per collection
+  (MiniLM text chunks, CLIP images).
+- `ingest_paths` is the bulk path: files are extracted in a process pool
+  while the main thread accumulates chunks from many files into large
+  embedding batches, and vectors + metadata are committed once per batch
+  rather than once per file.
+- `ingest_file` is the single-upload path; it consumes chunks as a stream
+  (e.g. `extractors.iter_pdf`) and embeds them batch by batch.
+- Files and chunks are content-hashed. Re-ingesting an unchanged file is a
+  no-op, a file whose bytes are already indexed under another name is
+  skipped, and a modified file only embeds the chunks that are new; chunks
+  that disappeared are removed from the index and metadata.
 """
 
-from typing import List
+from __future__ import annotations
 
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
 
-def ingest_documents(paths: List[str]) -> int:
-    """Stub: ingest the given file paths into a local vector store.
+from .config import get_section
+from .extractors import Chunk, extract_any
 
-    Returns the number of chunks indexed.
+
+TEXT_TYPES = ("pdf", "docx", "text", "audio")
+
+
+def chunk_metadata(c: Chunk) -> dict:
+    return {
+        "content": c.content,
+        "file_name": c.file_name,
+        "file_type": c.file_type,
+        "page_number": c.page_number,
+        "timestamp": c.timestamp,
+        "filepath": c.filepath,
+        "width": getattr(c, "width", None),
+        "height": getattr(c, "height", None),
+        "bbox": c.bbox,
+        "chunk_hash": getattr(c, "chunk_hash", None),
+    }
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_hash(c: Chunk, content_hash: str) -> str:
+    if c.file_type == "image":
+        # an image chunk's caption is derived from the file; the pixels are what get embedded
+        return content_hash
+    key = "\0".join([c.file_type, str(c.page_number), str(c.timestamp), c.content])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class FilePlan:
+    """What ingesting one file will change: chunks to embed and stale rows to drop."""
+
+    file_name: str
+    content_hash: str
+    size: int
+    new_chunks: List[Chunk] = field(default_factory=list)
+    reused: int = 0
+    chunks: int = 0
+    stale_rows: List[int] = field(default_factory=list)
+    skipped: Optional[str] = None
+    # another file with this file's previous content, which takes over its stored rows
+    heir: Optional[str] = None
+    heir_rows: List[int] = field(default_factory=list)
+    # the file's rows already in the DB, by chunk hash, not yet matched to a chunk
+    stored: Dict[Optional[str], List[int]] = field(default_factory=dict)
+    seen: set = field(default_factory=set)
+
+    def add(self, chunks: Iterable[Chunk]) -> List[Chunk]:
+        """Match chunks against the stored ones; returns those that need embedding."""
+        new: List[Chunk] = []
+        for c in chunks:
+            h = chunk_hash(c, self.content_hash)
+            if h in self.seen:
+                continue
+            self.seen.add(h)
+            self.chunks += 1
+            rows = self.stored.pop(h, None)
+            if rows:
+                self.reused += 1
+                # keep one row per chunk; extra copies from earlier duplicate ingests go
+                self.stale_rows.extend(rows[1:])
+            else:
+                c.chunk_hash = h
+                new.append(c)
+        return new
+
+    def finish(self) -> None:
+        # everything left over (including unhashed legacy rows) is no longer in the file
+        for rows in self.stored.values():
+            self.stale_rows.extend(rows)
+        self.stored = {}
+
+
+def check_duplicate(file_name: str, content_hash: str) -> Optional[str]:
+    """Return why a file needs no ingest, or None if it does."""
+    from .index_store import find_file_by_hash, get_file
+
+    existing = get_file(file_name)
+    if existing and existing["content_hash"] == content_hash:
+        return "unchanged"
+    other = find_file_by_hash(content_hash)
+    if other and other != file_name:
+        return f"duplicate of {other}"
+    return None
+
+
+def start_plan(
+    path: str,
+    file_name: str,
+    content_hash: Optional[str] = None,
+    duplicate_of: Optional[str] = None,
+) -> FilePlan:
+    """Plan a file's ingest; nothing is written until the plan is committed.
+
+    A file with the same content as another (`duplicate_of`, or found by
+    hash) is recorded as a copy that shares the other file's chunks.
+    """
+    from .index_store import file_aliases, file_chunks, get_file
+
+    content_hash = content_hash or file_hash(path)
+    plan = FilePlan(file_name, content_hash, os.path.getsize(path))
+    if duplicate_of:
+        plan.skipped = f"duplicate of {duplicate_of}"
+    else:
+        plan.skipped = check_duplicate(file_name, content_hash)
+    if plan.skipped == "unchanged":
+        return plan
+    stored = file_chunks(file_name)
+    existing = get_file(file_name)
+    heirs = file_aliases(file_name, existing["content_hash"]) if stored and existing else []
+    rows = [r for ids in stored.values() for r in ids]
+    if heirs:
+        # a copy of the old version still needs its chunks: they become the copy's,
+        # and this file is embedded afresh
+        plan.heir, plan.heir_rows = heirs[0], rows
+    elif plan.skipped:
+        # its own old chunks go once the plan is committed; the copy's chunks serve it
+        plan.stale_rows = rows
+    else:
+        plan.stored = stored
+    return plan
+
+
+def plan_file(
+    path: str, file_name: str, chunks: List[Chunk], content_hash: Optional[str] = None
+) -> FilePlan:
+    plan = start_plan(path, file_name, content_hash)
+    if not plan.skipped:
+        plan.new_chunks = plan.add(chunks)
+        plan.finish()
+    return plan
+
+
+def _finish_plans(plans: List[FilePlan]) -> int:
+    from .index_store import delete_rows, hand_over_rows, record_file
+
+    for p in plans:
+        if p.heir:
+            hand_over_rows(p.heir_rows, p.heir)
+    # new vectors go in before stale ones come out, so a file is never briefly missing
+    removed = delete_rows([r for p in plans for r in p.stale_rows])
+    for p in plans:
+        record_file(p.file_name, p.content_hash, p.size, p.chunks)
+    return removed
+
+
+def commit_plans(plans: List[FilePlan]) -> dict:
+    """Embed new chunks, then drop stale rows and record the files' hashes."""
+    plans = [p for p in plans if p.skipped != "unchanged"]
+    chunks = [c for p in plans for c in p.new_chunks]
+    added = index_chunks(chunks) if chunks else {"chunks_added": 0, "vectors_indexed": 0}
+    removed = _finish_plans(plans)
+    return {
+        **added,
+        "chunks_reused": sum(p.reused for p in plans),
+        "vectors_removed": removed,
+    }
+
+
+def ingest_file(
+    path: str,
+    file_name: str,
+    chunks: Iterable[Chunk],
+    content_hash: Optional[str] = None,
+    batch_size: Optional[int] = None,
+) -> dict:
+    """Ingest one file's chunks, embedding them in batches as they arrive.
+
+    `chunks` may be a generator (e.g. `iter_pdf`), so embedding the first
+    pages overlaps with extracting the rest.
+    """
+    plan = start_plan(path, file_name, content_hash)
+    if plan.skipped:
+        return {
+            "chunks_added": 0,
+            "vectors_indexed": 0,
+            "chunks_reused": 0,
+            "vectors_removed": _finish_plans([plan]) if plan.skipped != "unchanged" else 0,
+            "skipped": plan.skipped,
+        }
+    batch_size = batch_size or int(get_section("ingest").get("batch_size", 512))
+    totals = {"chunks_added": 0, "vectors_indexed": 0}
+    batch: List[Chunk] = []
+
+    def flush():
+        new = plan.add(batch)
+        if new:
+            added = index_chunks(new)
+            totals["chunks_added"] += added["chunks_added"]
+            totals["vectors_indexed"] += added["vectors_indexed"]
+        batch.clear()
+
+    for c in chunks:
+        batch.append(c)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    plan.finish()
+    return {
+        **totals,
+        "chunks_reused": plan.reused,
+        "vectors_removed": _finish_plans([plan]),
+        "skipped": None,
+    }
+
+
+def index_chunks(chunks: List[Chunk]) -> Dict[str, int]:
+    """Embed chunks and add them to their collections in one commit each."""
+    from .embeddings import embed_images, embed_texts
+    from .index_store import add_embeddings_with_metadata
+
+    text_chunks = [c for c in chunks if c.file_type in TEXT_TYPES]
+    image_chunks = [c for c in chunks if c.file_type == "image" and c.filepath]
+
+    vectors_added = 0
+    total_chunks = 0
+    if text_chunks:
+        embs = embed_texts([c.content for c in text_chunks])
+        vectors_added += add_embeddings_with_metadata(
+            embs, [chunk_metadata(c) for c in text_chunks]
+        )
+        total_chunks += len(text_chunks)
+    if image_chunks:
+        embs, sizes = embed_images([c.filepath for c in image_chunks])
+        # dimensions come from the same decode that fed the model
+        for c, (w, h) in zip(image_chunks, sizes):
+            c.width, c.height = w, h
+        vectors_added += add_embeddings_with_metadata(
+            embs, [chunk_metadata(c) for c in image_chunks], collection="image"
+        )
+        total_chunks += len(image_chunks)
+    return {"chunks_added": total_chunks, "vectors_indexed": vectors_added}
+
+
+def _extract(
+    path: str, file_name: str, known_hash: Optional[str] = None
+) -> Tuple[str, Optional[List[Chunk]]]:
+    digest = file_hash(path)
+    if digest == known_hash:
+        # unchanged since the last ingest: don't pay for extraction
+        return digest, None
+    return digest, extract_any(path, file_name, "")
+
+
+def ingest_paths(
+    paths: List[str],
+    file_names: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+    batch_size: Optional[int] = None,
+) -> dict:
+    """Extract, embed and index many files at once.
+
+    `workers` extraction processes (default `ingest.workers`) run ahead of the
+    embedding stage; chunks are flushed to the index whenever `batch_size`
+    (default `ingest.batch_size`) of them have accumulated.
     """
-    return 0
+    cfg = get_section("ingest")
+    workers = workers or int(cfg.get("workers", os.cpu_count() or 1))
+    batch_size = batch_size or int(cfg.get("batch_size", 512))
+    file_names = file_names or [os.path.basename(p) for p in paths]
+
+    from .index_store import file_hashes
+
+    known = file_hashes(file_names)
+    totals = {
+        "files": 0,
+        "chunks_added": 0,
+        "chunks_reused": 0,
+        "vectors_indexed": 0,
+        "vectors_removed": 0,
+        "skipped": [],
+        "errors": [],
+    }
+    pending: List[FilePlan] = []
+    planned: Dict[str, str] = {}  # content hash -> file name, for duplicates within this run
 
+    def flush():
+        if pending:
+            added = commit_plans(pending)
+            for key in ("chunks_added", "chunks_reused", "vectors_indexed", "vectors_removed"):
+                totals[key] += added[key]
+            pending.clear()
 
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_extract, p, n, known.get(n)): (p, n) for p, n in zip(paths, file_names)
+        }
+        for fut in as_completed(futures):
+            path, name = futures[fut]
+            try:
+                digest, chunks = fut.result()
+            except Exception as e:
+                totals["errors"].append({"file": name, "error": str(e)})
+                continue
+            totals["files"] += 1
+            if chunks is None:
+                totals["skipped"].append({"file": name, "reason": "unchanged"})
+                continue
+            if digest in planned or name in planned.values():
+                owner = planned.get(digest, name)
+                if owner != name:
+                    pending.append(start_plan(path, name, digest, duplicate_of=owner))
+                totals["skipped"].append({"file": name, "reason": f"duplicate of {owner}"})
+                continue
+            plan = plan_file(path, name, chunks, digest)
+            if plan.skipped:
+                totals["skipped"].append({"file": name, "reason": plan.skipped})
+            else:
+                planned[digest] = name
+            pending.append(plan)
+            if sum(len(p.new_chunks) for p in pending) >= batch_size:
+                flush()
+    flush()
+    return totals
+
+
+def ingest_documents(paths: List[str]) -> int:
+    """Ingest the given file paths into the local vector store.
+
+    Returns the number of chunks indexed.
+    """
+    return ingest_paths(paths)["chunks_added"]
@@ -1,19 +1,109 @@
+import asyncio
+import json
+import logging
 import os
+import shutil
+import threading
+from contextlib import asynccontextmanager
 from typing import List
 
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from .audio import TranscriptionError
+from .extractors import extract_any, extract_audio, iter_pdf
+from .hybrid import hybrid_search
+from .rerank import RERANK_MODEL, get_reranker, rerank_stats
+from .search import MODES as SEARCH_MODES, semantic_search
+from .ingest import check_duplicate, file_hash, ingest_file, ingest_paths
+from .cache import cache_stats, get_cache, normalize_query
+from .embeddings import (
+    batch_stats,
+    embed_clip_texts,
+    embed_texts,
+    embed_image_paths,
+    embed_query,
+    embed_clip_query,
+)
+from .index_store import (
+    COLLECTIONS,
+    delete_file,
+    status as index_status,
+    rebuild_from_db,
+    ensure_storage,
+    get_index_manager,
+    index_version,
+    init_db,
+    lookup_vectors,
+    parse_filters,
+    search_collection,
+)
+from .config import CONFIG_PATH, get_config, get_section
+from .rag import answer_query, get_model_registry, stream_answer
+from .splitter import splitter_stats
+from .workers import (
+    QueueFullError,
+    get_executor,
+    queue_stats,
+    run_in,
+    shutdown as shutdown_workers,
+    stream_in,
+)
+
+
+logger = logging.getLogger(__name__)
 
-from .extractors import extract_any
-from .embeddings import embed_texts, embed_image_paths
-from .index_store import add_embeddings_with_metadata, status as index_status, rebuild_from_db, ensure_storage
-import faiss
-import numpy as np
-from .rag import answer_query
+# what startup warms in the background; /ready reports their state
+WARMUPS = {
+    "text": lambda: embed_texts(["warm up"]),
+    "clip": lambda: embed_clip_texts(["warm up"]),
+    "llm": lambda: get_model_registry().preload(get_config(CONFIG_PATH)),
+    "rerank": lambda: get_reranker(get_section("rerank").get("model") or RERANK_MODEL).predict(
+        [("warm up", "warm up")]
+    ),
+}
+_warmup_state: dict = {}
 
-app = FastAPI(title="RAG Offline Chatbot Backend", version="0.1.0")
+
+def _warm_up(names: List[str]) -> None:
+    for name in names:
+        _warmup_state[name] = "loading"
+        logger.info("warming up %s", name)
+        try:
+            WARMUPS[name]()
+            _warmup_state[name] = "ready"
+            logger.info("%s ready", name)
+        except Exception as e:
+            _warmup_state[name] = f"failed: {e}"
+            logger.warning("%s warm-up failed: %s", name, e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # schema migrations and WAL setup run once, before any request touches the DB
+    init_db()
+    # load the FAISS indexes once so the first query doesn't pay for it
+    for name in COLLECTIONS:
+        get_index_manager(name).load()
+    names = [n for n in get_section("startup").get("warm") or [] if n in WARMUPS]
+    if get_section("llm").get("preload") and "llm" not in names:
+        names.append("llm")
+    # a cold cross-encoder would blow the first queries' re-rank budget
+    if get_section("rerank").get("enabled") and "rerank" not in names:
+        names.append("rerank")
+    _warmup_state.clear()
+    _warmup_state.update({name: "pending" for name in names})
+    if names:
+        # load models in the background so startup isn't blocked on multi-GB loads
+        threading.Thread(target=_warm_up, args=(names,), name="warm-up", daemon=True).start()
+    yield
+    shutdown_workers()
+
+
+app = FastAPI(title="RAG Offline Chatbot Backend", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,74 +114,112 @@ app.add_middleware(
 )
 
 
+@app.exception_handler(QueueFullError)
+async def queue_full(request, exc: QueueFullError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
+@app.exception_handler(TranscriptionError)
+async def transcription_failed(request, exc: TranscriptionError):
+    return JSONResponse(status_code=500, content={"detail": f"Transcription failed: {exc}"})
+
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
 
-@app.post("/ingest")
-async def ingest(file: UploadFile = File(...)):
+@app.get("/ready")
+def ready():
+    # /health answers as soon as the process is up; /ready once the warmed models are loaded
+    state = dict(_warmup_state)
+    ok = all(v == "ready" for v in state.values())
+    return JSONResponse(status_code=200 if ok else 503, content={"ready": ok, "models": state})
+
+
+def _filters(payload: dict) -> dict | None:
+    try:
+        return parse_filters(payload.get("filters"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _storage_dir() -> str:
     ensure_storage()
     storage_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "storage"))
     os.makedirs(storage_dir, exist_ok=True)
     # mount static if not mounted yet
     if not any(r.path == "/storage" for r in app.router.routes):
         app.mount("/storage", StaticFiles(directory=storage_dir), name="storage")
+    return storage_dir
+
+
+def _save_upload(file: UploadFile, dest_path: str) -> str:
+    # stream to disk instead of buffering the whole upload in memory
+    with open(dest_path, "wb") as f:
+        shutil.copyfileobj(file.file, f)
+    return dest_path
+
+
+def _extract_submitter():
+    """submit(fn, *args) for worker threads: runs the call on the extract stage of this event loop."""
+    loop = asyncio.get_running_loop()
+    return lambda fn, *args: asyncio.run_coroutine_threadsafe(run_in("extract", fn, *args), loop)
+
+
+@app.post("/ingest")
+async def ingest(file: UploadFile = File(...)):
+    storage_dir = _storage_dir()
     if not file.filename:
         raise HTTPException(status_code=400, detail="Missing filename")
-    dest_path = os.path.join(storage_dir, file.filename)
-    data = await file.read()
-    with open(dest_path, "wb") as f:
-        f.write(data)
-
-    # Extract chunks
-    chunks = extract_any(dest_path, file.filename, file.content_type or "")
-    # Separate text chunks vs image entries
-    text_chunks = [c for c in chunks if c.file_type in ("pdf", "docx", "text", "audio")]
-    image_chunks = [c for c in chunks if c.file_type == "image"]
-
-    vectors_added = 0
-    total_chunks = 0
-
-    if text_chunks:
-        texts = [c.content for c in text_chunks]
-        embs = embed_texts(texts)
-        meta = [
-            {
-                "content": c.content,
-                "file_name": c.file_name,
-                "file_type": c.file_type,
-                "page_number": c.page_number,
-                "timestamp": c.timestamp,
-                "filepath": c.filepath,
-            }
-            for c in text_chunks
-        ]
-        vectors_added += add_embeddings_with_metadata(embs, meta)
-        total_chunks += len(texts)
-
-    if image_chunks:
-        paths = [c.filepath for c in image_chunks if c.filepath]
-        if paths:
-            embs = embed_image_paths(paths)
-            meta = [
-                {
-                    "content": c.content,
-                    "file_name": c.file_name,
-                    "file_type": c.file_type,
-                    "page_number": c.page_number,
-                    "timestamp": c.timestamp,
-                    "filepath": c.filepath,
-                    "width": getattr(c, "width", None),
-                    "height": getattr(c, "height", None),
-                    "bbox": None,
-                }
-                for c in image_chunks
-            ]
-            vectors_added += add_embeddings_with_metadata(embs, meta)
-            total_chunks += len(paths)
-
-    return {"chunks_added": total_chunks, "vectors_indexed": vectors_added, "file": file.filename}
+    dest_path = await run_in_threadpool(
+        _save_upload, file, os.path.join(storage_dir, file.filename)
+    )
+
+    digest = await run_in_threadpool(file_hash, dest_path)
+    # hash before extracting so re-uploads of an indexed file cost nothing
+    skipped = await run_in_threadpool(check_duplicate, file.filename, digest)
+    if skipped:
+        # nothing to extract; a copy of another file is recorded as sharing its chunks
+        added = await run_in("ingest", ingest_file, dest_path, file.filename, [], digest)
+        return {**added, "file": file.filename}
+    if file.filename.lower().endswith(".pdf"):
+        # page ranges are parsed on the extract stage and embedded as they arrive, not after the whole document
+        chunks = iter_pdf(
+            dest_path,
+            file.filename,
+            workers=get_executor("extract").max_workers,
+            submit=_extract_submitter(),
+        )
+    else:
+        chunks = await run_in(
+            "extract", extract_any, dest_path, file.filename, file.content_type or ""
+        )
+    added = await run_in("ingest", ingest_file, dest_path, file.filename, chunks, digest)
+    return {**added, "file": file.filename}
+
+
+@app.post("/ingest/batch")
+async def ingest_batch(files: List[UploadFile] = File(...)):
+    storage_dir = _storage_dir()
+    paths, names = [], []
+    for file in files:
+        if not file.filename:
+            raise HTTPException(status_code=400, detail="Missing filename")
+        paths.append(
+            await run_in_threadpool(_save_upload, file, os.path.join(storage_dir, file.filename))
+        )
+        names.append(file.filename)
+    return await run_in("ingest", ingest_paths, paths, names)
+
+
+@app.delete("/documents/{file_name}")
+async def delete_document(file_name: str):
+    # a tombstone per vector: searches stop returning the file immediately
+    removed = await run_in("ingest", delete_file, file_name)
+    if removed is None:
+        raise HTTPException(status_code=404, detail=f"Unknown document: {file_name}")
+    return removed
 
 
 @app.post("/api/chat")
@@ -102,144 +230,268 @@ async def chat(query: dict):
 
 
 @app.post("/query")
-def query(payload: dict):
+async def query(payload: dict):
     try:
         q = payload.get("query", "")
         if not q:
             raise HTTPException(status_code=400, detail="Missing query")
         cfg_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "config.yaml"))
-        return answer_query(cfg_path, q)
-    except HTTPException:
-        # re-raise FastAPI HTTP errors as-is
+        return await run_in("query", answer_query, cfg_path, q, _filters(payload))
+    except (HTTPException, QueueFullError):
+        # re-raise FastAPI HTTP errors and backpressure as-is
         raise
     except Exception as e:
         # surface underlying backend errors to the client to aid debugging
         raise HTTPException(status_code=500, detail=f"Query failed: {e}")
 
 
+@app.post("/query/stream")
+async def query_stream(payload: dict):
+    """Server-sent events: `sources`, then `token`s as generated, then `done` with timing stats."""
+    q = payload.get("query", "")
+    if not q:
+        raise HTTPException(status_code=400, detail="Missing query")
+    filters = _filters(payload)
+    cfg_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "config.yaml"))
+
+    def events():
+        try:
+            for ev in stream_answer(cfg_path, q, filters):
+                yield f"event: {ev['event']}\ndata: {json.dumps(ev['data'])}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': f'Query failed: {e}'})}\n\n"
+
+    # generated on the bounded query stage like /query; a full queue is a 503 before the stream starts
+    return StreamingResponse(
+        stream_in("query", events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
 @app.get("/status")
 def status():
-    return index_status()
+    return {
+        **index_status(),
+        "queues": queue_stats(),
+        "cache": cache_stats(),
+        "batching": batch_stats(),
+        "rerank": rerank_stats(),
+        "splitter": splitter_stats(),
+        "llm": get_model_registry().stats(),
+    }
+
+
+def _check_collection(collection: str | None) -> List[str]:
+    if collection is None:
+        return list(COLLECTIONS)
+    if collection not in COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown collection: {collection}")
+    return [collection]
 
 
 @app.post("/index/rebuild")
-def rebuild():
-    # Assume text embedding dimension 384 for MiniLM-L6-v2
-    return rebuild_from_db(384)
+async def rebuild(collection: str | None = None, reembed: bool = False):
+    # stored embeddings are reused; only `reembed` runs the encoders over everything again
+    return {
+        "collections": [
+            await run_in("ingest", rebuild_from_db, name, reembed=reembed)
+            for name in _check_collection(collection)
+        ]
+    }
+
+
+@app.post("/index/compact")
+async def compact(collection: str | None = None):
+    # like ingest, rewriting an index is bounded by the ingest stage, off the event loop
+    return {
+        name: await run_in("ingest", get_index_manager(name).compact)
+        for name in _check_collection(collection)
+    }
 
 
 @app.post("/ingest/audio")
 async def ingest_audio(file: UploadFile = File(...)):
-    ensure_storage()
-    storage_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "storage"))
-    os.makedirs(storage_dir, exist_ok=True)
-    if not any(r.path == "/storage" for r in app.router.routes):
-        app.mount("/storage", StaticFiles(directory=storage_dir), name="storage")
+    storage_dir = _storage_dir()
     if not file.filename:
         raise HTTPException(status_code=400, detail="Missing filename")
-    dest_path = os.path.join(storage_dir, file.filename)
-    data = await file.read()
-    with open(dest_path, "wb") as f:
-        f.write(data)
-
-    # extract audio -> transcript chunks with segments stored on chunk objects
-    from .extractors import extract_audio
-    chunks = extract_audio(dest_path, file.filename)
-
-    texts = [c.content for c in chunks]
-    embs = embed_texts(texts)
-    meta = []
-    for c in chunks:
-        # find first segment overlap as a simple heuristic (timestamp string)
-        ts = None
-        segs = getattr(c, "segments", []) or []
-        if segs:
-            # use the first segment timestamp
-            s0, s1, _ = segs[0]
-            ts = f"{s0}-{s1}"
-        meta.append({
-            "content": c.content,
-            "file_name": c.file_name,
-            "file_type": c.file_type,
-            "page_number": c.page_number,
-            "timestamp": ts,
-            "filepath": c.filepath,
-        })
-
-    added = add_embeddings_with_metadata(embs, meta)
-    return {"chunks_added": len(texts), "vectors_indexed": added, "file": file.filename}
+    dest_path = await run_in_threadpool(
+        _save_upload, file, os.path.join(storage_dir, file.filename)
+    )
+    digest = await run_in_threadpool(file_hash, dest_path)
+    skipped = await run_in_threadpool(check_duplicate, file.filename, digest)
+    if skipped:
+        # nothing to extract; a copy of another file is recorded as sharing its chunks
+        added = await run_in("ingest", ingest_file, dest_path, file.filename, [], digest)
+        return {**added, "file": file.filename}
+    # each chunk carries the time range of the whisper segments it spans
+    chunks = await run_in("audio", extract_audio, dest_path, file.filename)
+    added = await run_in("ingest", ingest_file, dest_path, file.filename, chunks, digest)
+    return {**added, "file": file.filename}
+
+
+def _embed_image(path: str):
+    return embed_image_paths([path])
+
+
+def _cached(cache_key: tuple | None, compute) -> List[dict]:
+    if cache_key is None:
+        return compute()
+    cache = get_cache("results")
+    version = index_version()
+    cached = cache.get_versioned(version, cache_key)
+    if cached is not None:
+        return cached
+    results = compute()
+    cache.put_versioned(version, cache_key, results)
+    return results
+
+
+def _similarity(
+    collection: str, embed, item, k: int, opts: dict, cache_key: tuple | None = None
+) -> List[dict]:
+    def compute():
+        # ntotal can load the index from disk, so it's checked here rather than on the event loop
+        if get_index_manager(collection).ntotal == 0:
+            return []
+        query_emb = embed(item)
+        D, I = search_collection(
+            collection, query_emb, k, opts.get("nprobe"), opts.get("ef_search"), opts.get("filters")
+        )
+        ids = I[0].tolist()
+        scores = D[0].tolist()
+        meta_map = lookup_vectors(ids, collection)
+        results = []
+        for vid, score in zip(ids, scores):
+            row = meta_map.get(vid)
+            if row:
+                results.append({**row, "score": float(score)})
+        return results
+
+    return _cached(cache_key, compute)
+
+
+def _hybrid(query: str, k: int, opts: dict, cache_key: tuple) -> List[dict]:
+    return _cached(
+        cache_key,
+        lambda: hybrid_search(
+            query,
+            k,
+            nprobe=opts.get("nprobe"),
+            ef_search=opts.get("ef_search"),
+            filters=opts.get("filters"),
+        ),
+    )
 
 
 @app.post("/search/similarity")
 async def similarity(payload: dict = None, mode: str = "text", file: UploadFile | None = None):
-    k = 5
-    query_emb = None
-    from .index_store import INDEX_PATH, connect_db
-    if not os.path.exists(INDEX_PATH):
-        return {"results": []}
-
+    # text and hybrid queries search MiniLM text chunks (hybrid fuses in BM25 keyword matches);
+    # image and cross-modal queries search CLIP image vectors
+    collection = "text" if mode in ("text", "hybrid") else "image"
+    opts = dict(payload or {})
+    k = int(opts.get("k", 5))
+    opts["filters"] = _filters(opts)
+    # part of every cache key: the same query under different filters has different results
+    scope = json.dumps(opts["filters"], sort_keys=True) if opts["filters"] else None
     if mode == "text":
-        query = (payload or {}).get("query", "")
-        k = int((payload or {}).get("k", 5))
+        query = opts.get("query", "")
+        if not query:
+            raise HTTPException(status_code=400, detail="Missing query")
+        key = (
+            "similarity",
+            mode,
+            normalize_query(query),
+            k,
+            opts.get("nprobe"),
+            opts.get("ef_search"),
+            scope,
+        )
+        results = await run_in("search", _similarity, collection, embed_query, query, k, opts, key)
+    elif mode == "hybrid":
+        query = opts.get("query", "")
         if not query:
             raise HTTPException(status_code=400, detail="Missing query")
-        query_emb = embed_texts([query])
+        key = (
+            "similarity",
+            mode,
+            normalize_query(query),
+            k,
+            opts.get("nprobe"),
+            opts.get("ef_search"),
+            scope,
+        )
+        results = await run_in("search", _hybrid, query, k, opts, key)
     elif mode == "image":
         if file is None:
             raise HTTPException(status_code=400, detail="Missing image file")
-        data = await file.read()
-        tmp_path = os.path.join(os.path.dirname(__file__), "..", "storage", f"_query_{file.filename}")
+        tmp_path = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "..", "storage", f"_query_{file.filename}")
+        )
         os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
-        with open(tmp_path, "wb") as f:
-            f.write(data)
-        query_emb = embed_image_paths([os.path.abspath(tmp_path)])
+        await run_in_threadpool(_save_upload, file, tmp_path)
         try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
-        k = int((payload or {}).get("k", 5))
+            results = await run_in(
+                "search", _similarity, collection, _embed_image, tmp_path, k, opts
+            )
+        finally:
+            try:
+                os.remove(tmp_path)
+            except Exception:
+                pass
     else:
-        # cross-modal defaults to text embedding of query string
-        query = (payload or {}).get("query", "")
-        k = int((payload or {}).get("k", 5))
+        # cross-modal: CLIP text embedding of the query against the image collection
+        query = opts.get("query", "")
         if not query:
             raise HTTPException(status_code=400, detail="Missing query for cross mode")
-        query_emb = embed_texts([query])
-
-    index = faiss.read_index(INDEX_PATH)
-    D, I = index.search(query_emb, k)
-    ids = I[0].tolist()
-    scores = D[0].tolist()
-    placeholders = ",".join(["?"] * len(ids)) if ids else ""
-    results = []
-    if ids:
-        conn = connect_db()
-        cur = conn.cursor()
-        cur.execute(
-            f"SELECT vector_id, content, file_name, file_type, page_number, timestamp, filepath, width, height, bbox FROM vectors WHERE vector_id IN ({placeholders})",
-            ids,
+        key = (
+            "similarity",
+            mode,
+            normalize_query(query),
+            k,
+            opts.get("nprobe"),
+            opts.get("ef_search"),
+            scope,
+        )
+        results = await run_in(
+            "search", _similarity, collection, embed_clip_query, query, k, opts, key
         )
-        metas = cur.fetchall()
-        conn.close()
-        meta_map = {row[0]: row for row in metas}
-        for vid, score in zip(ids, scores):
-            row = meta_map.get(vid)
-            if row:
-                results.append(
-                    {
-                        "vector_id": row[0],
-                        "content": row[1],
-                        "file_name": row[2],
-                        "file_type": row[3],
-                        "page_number": row[4],
-                        "timestamp": row[5],
-                        "filepath": row[6],
-                        "width": row[7],
-                        "height": row[8],
-                        "bbox": row[9],
-                        "score": float(score),
-                    }
-                )
     return {"results": results}
 
 
+@app.post("/search/batch")
+async def search_batch(payload: dict):
+    """Many queries in one request: one encoder batch, one index search, one metadata lookup."""
+    queries = payload.get("queries")
+    if (
+        not isinstance(queries, list)
+        or not queries
+        or not all(isinstance(q, str) and q for q in queries)
+    ):
+        raise HTTPException(
+            status_code=400, detail="queries must be a non-empty list of non-empty strings"
+        )
+    limit = int(get_section("batching").get("max_queries", 1024))
+    if len(queries) > limit:
+        raise HTTPException(status_code=400, detail=f"At most {limit} queries per request")
+    k = payload.get("k", 5)
+    max_k = int(get_section("batching").get("max_k", 1000))
+    if isinstance(k, bool) or not isinstance(k, int) or not 0 < k <= max_k:
+        raise HTTPException(status_code=400, detail=f"k must be an integer from 1 to {max_k}")
+    mode = payload.get("mode", "text")
+    if mode not in SEARCH_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown mode: {mode} (expected one of {', '.join(SEARCH_MODES)})",
+        )
+    results = await run_in(
+        "search",
+        semantic_search,
+        queries,
+        k,
+        mode,
+        _filters(payload),
+        payload.get("nprobe"),
+        payload.get("ef_search"),
+    )
+    return {"results": [{"query": q, "results": r} for q, r in zip(queries, results)]}
@@ -0,0 +1,207 @@
+"""
+Token-budgeted prompt assembly for /query.
+
+Retrieved chunks overlap (the splitter carries `splitter.overlap_tokens`
+into the next chunk) and often repeat each other, so before they go into
+the prompt:
+
+- chunks from the same file and page that continue each other (overlapping
+  text, or consecutive vector ids) are merged into one passage
+- near-duplicates, whose word 5-grams are mostly (`prompt.dedup_threshold`)
+  contained in a better-ranked snippet, are dropped
+- snippets are added best first while the prompt, counted with the model's
+  own tokenizer, fits the budget: the context window minus the `max_tokens`
+  reserved for the answer (or `prompt.budget_tokens`, if smaller). The
+  first snippet that doesn't fit is cut at a word boundary if at least
+  `prompt.min_snippet_tokens` of it fit; the rest are left out.
+
+The sources returned are the ones in the prompt, so citations [i] match.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import get_section
+
+
+SHINGLE = 5  # words per shingle for near-duplicate detection
+_PROBE = 32  # characters of a chunk's head looked up in the other chunk's text
+_WORD = re.compile(r"\w+")
+
+Counter = Callable[[str], int]
+
+
+def _where(s: Dict) -> str:
+    where = s.get("file_name") or ""
+    if s.get("file_type") == "pdf" and s.get("page_number"):
+        where += f" page {s['page_number']}"
+    if s.get("file_type") == "audio" and s.get("timestamp"):
+        where += f" {s['timestamp']}"
+    return where
+
+
+def _source_line(i: int, s: Dict) -> str:
+    snippet = (s.get("content") or "").replace("\n", " ")
+    return f'Source [{i}] {_where(s)}: "{snippet}"'
+
+
+def build_prompt(query: str, sources: List[Dict]) -> str:
+    lines = [_source_line(i, s) for i, s in enumerate(sources, start=1)]
+    lines.append(
+        "\nAnswer the user query using only the information from sources [1..k]. Provide citations inline like [1], [2]. If the answer is unknown from sources, say you don't know."
+    )
+    lines.append(f"\nUser query: {query}\nAnswer:")
+    return "\n".join(lines)
+
+
+def _join_text(first: str, second: str) -> Optional[str]:
+    """`first` followed by `second` if `second` starts inside `first` (or is contained in it)."""
+    if second in first:
+        return first
+    probe = second[:_PROBE]
+    start = first.find(probe)
+    while start != -1:
+        if second.startswith(first[start:]):
+            return first + second[len(first) - start :]
+        start = first.find(probe, start + 1)
+    return None
+
+
+def _join_timestamps(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    try:
+        (a0, a1), (b0, b1) = (map(int, t.split("-")) for t in (a, b))
+    except (AttributeError, ValueError):
+        return a or b
+    return f"{min(a0, b0)}-{max(a1, b1)}"
+
+
+def _join_bbox(a: Optional[dict], b: Optional[dict]) -> Optional[dict]:
+    if not a or not b:
+        return a or b
+    return {**a, "boxes": (a.get("boxes") or []) + (b.get("boxes") or [])}
+
+
+def _merge_pair(a: Dict, b: Dict) -> Optional[Dict]:
+    """One source covering `a` and `b` (a ranked above b), or None if they aren't adjacent."""
+    if (a.get("file_name"), a.get("page_number")) != (b.get("file_name"), b.get("page_number")):
+        return None
+    ta, tb = a.get("content") or "", b.get("content") or ""
+    ids_a, ids_b = (
+        a.get("_ids") or (a.get("vector_id"),) * 2,
+        b.get("_ids") or (b.get("vector_id"),) * 2,
+    )
+    text = _join_text(ta, tb) or _join_text(tb, ta)
+    if text is None and None not in ids_a + ids_b:
+        if ids_a[1] + 1 == ids_b[0]:
+            text = f"{ta} {tb}"
+        elif ids_b[1] + 1 == ids_a[0]:
+            text = f"{tb} {ta}"
+    if text is None:
+        return None
+    merged = {
+        **a,
+        "content": text,
+        "score": max(a.get("score") or 0.0, b.get("score") or 0.0),
+        "timestamp": _join_timestamps(a.get("timestamp"), b.get("timestamp")),
+        "bbox": _join_bbox(a.get("bbox"), b.get("bbox")),
+    }
+    if None not in ids_a + ids_b:
+        merged["_ids"] = (min(ids_a[0], ids_b[0]), max(ids_a[1], ids_b[1]))
+    return merged
+
+
+def merge_sources(sources: List[Dict]) -> List[Dict]:
+    """Merge adjacent or overlapping chunks of the same file and page, keeping the better rank."""
+    out: List[Dict] = []
+    for s in sources:
+        for i, kept in enumerate(out):
+            merged = _merge_pair(kept, s)
+            if merged is not None:
+                out[i] = merged
+                break
+        else:
+            out.append(s)
+    # a merged passage can now bridge two others
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(out)):
+            for j in range(i + 1, len(out)):
+                merged = _merge_pair(out[i], out[j])
+                if merged is not None:
+                    out[i] = merged
+                    del out[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return [{k: v for k, v in s.items() if k != "_ids"} for s in out]
+
+
+def _shingles(text: str) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) <= SHINGLE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i : i + SHINGLE]) for i in range(len(words) - SHINGLE + 1)}
+
+
+def drop_near_duplicates(sources: List[Dict], threshold: float = 0.8) -> List[Dict]:
+    """`sources` without snippets mostly contained in a better-ranked one."""
+    kept: List[Tuple[Dict, set]] = []
+    for s in sources:
+        sh = _shingles(s.get("content") or "")
+        if not any(
+            len(sh & other) >= threshold * min(len(sh), len(other))
+            for _, other in kept
+            if sh and other
+        ):
+            kept.append((s, sh))
+    return [s for s, _ in kept]
+
+
+def _truncate(text: str, max_tokens: int, count_tokens: Counter) -> str:
+    """The longest word prefix of `text` that, with an ellipsis, fits `max_tokens`."""
+    words = text.split()
+    lo, hi = 0, len(words)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(" ".join(words[:mid]) + " ...") <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return " ".join(words[:lo]) + " ..." if lo else ""
+
+
+def assemble_prompt(
+    query: str, sources: List[Dict], count_tokens: Counter, budget: int, opts: Optional[dict] = None
+) -> Tuple[str, List[Dict], int]:
+    """(prompt, sources in it, prompt tokens) for `sources` in rank order within `budget` tokens.
+
+    `opts` is the `prompt` config section (dedup_threshold, min_snippet_tokens).
+    """
+    opts = get_section("prompt") if opts is None else opts
+    sources = drop_near_duplicates(merge_sources(sources), float(opts.get("dedup_threshold", 0.8)))
+    used = count_tokens(build_prompt(query, []))
+    kept: List[Dict] = []
+    for s in sources:
+        n = count_tokens(_source_line(len(kept) + 1, s)) + 1
+        if used + n <= budget:
+            kept.append(s)
+            used += n
+            continue
+        room = budget - used - count_tokens(_source_line(len(kept) + 1, {**s, "content": ""})) - 1
+        if room >= int(opts.get("min_snippet_tokens", 32)):
+            snippet = _truncate((s.get("content") or "").replace("\n", " "), room, count_tokens)
+            if snippet:
+                kept.append({**s, "content": snippet})
+        break
+    prompt = build_prompt(query, kept)
+    n_tokens = count_tokens(prompt)
+    # lines were counted separately; tokens can shift where they're joined
+    while kept and n_tokens > budget:
+        kept.pop()
+        prompt = build_prompt(query, kept)
+        n_tokens = count_tokens(prompt)
+    return prompt, kept, n_tokens
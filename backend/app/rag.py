@@ -1,21 +1,20 @@
 from __future__ import annotations
 
-import os
-import yaml
-import faiss
-from typing import List, Dict
-from .embeddings import embed_texts
-from .index_store import INDEX_PATH, connect_db
+import json
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from .config import get_config
+from .cache import get_cache, normalize_query
+from .embeddings import embed_query
+from .hybrid import MODES, hybrid_search
+from .prompt import assemble_prompt
+from .rerank import rerank
+from .index_store import get_index_manager, index_version, lookup_vectors, search_collection
 from .adapters.base import LLMAdapter
 from .adapters.gpt4all_adapter import GPT4AllAdapter
 from .adapters.llama_cpp_adapter import LlamaCppAdapter
 from .adapters.mistral_adapter import MistralAdapter
-
-
-def load_config(path: str) -> dict:
-    if not os.path.exists(path):
-        return {"model_backend": "mistral", "model_path": None, "top_k": 5, "max_tokens": 512, "temperature": 0.2}
-    return yaml.safe_load(open(path, "r"))
+from .adapters.registry import ModelRegistry
 
 
 def build_adapter(cfg: dict) -> LLMAdapter:
@@ -28,69 +27,52 @@ def build_adapter(cfg: dict) -> LLMAdapter:
     return MistralAdapter(path)
 
 
-def similarity_search(query: str, k: int) -> List[Dict]:
-    if not os.path.exists(INDEX_PATH):
+# looked up at call time so tests can swap build_adapter
+_registry = ModelRegistry(lambda cfg: build_adapter(cfg))
+
+
+def get_model_registry() -> ModelRegistry:
+    return _registry
+
+
+def similarity_search(query: str, k: int, filters: Optional[dict] = None) -> List[Dict]:
+    manager = get_index_manager()
+    if manager.ntotal == 0:
         return []
-    q = embed_texts([query])
-    index = faiss.read_index(INDEX_PATH)
-    D, I = index.search(q, k)
+    q = embed_query(query)
+    D, I = search_collection("text", q, k, filters=filters)
     ids = I[0].tolist()
     scores = D[0].tolist()
-    if not ids:
-        return []
-    conn = connect_db()
-    cur = conn.cursor()
-    placeholders = ",".join(["?"] * len(ids))
-    cur.execute(
-        f"SELECT vector_id, content, file_name, file_type, page_number, timestamp, filepath FROM vectors WHERE vector_id IN ({placeholders})",
-        ids,
-    )
-    rows = cur.fetchall()
-    conn.close()
-    meta_map = {r[0]: r for r in rows}
+    meta_map = lookup_vectors(ids, "text")
     results = []
     for vid, score in zip(ids, scores):
         r = meta_map.get(vid)
-        if not r:
-            continue
-        results.append(
-            {
-                "vector_id": r[0],
-                "content": r[1],
-                "file_name": r[2],
-                "file_type": r[3],
-                "page_number": r[4],
-                "timestamp": r[5],
-                "filepath": r[6],
-                "score": float(score),
-            }
-        )
+        if r:
+            results.append({**r, "score": float(score)})
     return results
 
 
-def build_prompt(query: str, sources: List[Dict]) -> str:
-    lines = []
-    for i, s in enumerate(sources, start=1):
-        marker = f"[{i}]"
-        where = s.get("file_name")
-        if s.get("file_type") == "pdf" and s.get("page_number"):
-            where += f" page {s['page_number']}"
-        if s.get("file_type") == "audio" and s.get("timestamp"):
-            where += f" {s['timestamp']}"
-        snippet = (s.get("content") or "").replace("\n", " ")
-        lines.append(f"Source {marker} {where}: \"{snippet}\"")
-    lines.append("\nAnswer the user query using only the information from sources [1..k]. Provide citations inline like [1], [2]. If the answer is unknown from sources, say you don't know.")
-    lines.append(f"\nUser query: {query}\nAnswer:")
-    return "\n".join(lines)
-
-
-def answer_query(cfg_path: str, query: str) -> dict:
-    cfg = load_config(cfg_path)
-    k = int(cfg.get("top_k", 5))
-    sources = similarity_search(query, k)
-    prompt = build_prompt(query, sources)
-    adapter = build_adapter(cfg)
-    text = adapter.generate(prompt, max_tokens=int(cfg.get("max_tokens", 512)), temperature=float(cfg.get("temperature", 0.2)))
+def retrieve(cfg: dict, query: str, k: int, filters: Optional[dict] = None) -> List[Dict]:
+    """Sources for `query` by `search_mode` in config.yaml: dense (vectors only) or hybrid (vectors + BM25).
+
+    `filters` are parsed search filters (see index_store.parse_filters).
+    """
+    mode = cfg.get("search_mode") or "dense"
+    if mode not in MODES:
+        raise ValueError(f"Unknown search_mode: {mode} (expected one of {', '.join(MODES)})")
+    opts = cfg.get("rerank") or {}
+    # with re-ranking, over-fetch and let the cross-encoder pick the top k
+    n = max(k, int(opts.get("candidates", 50))) if opts.get("enabled") else k
+    if mode == "hybrid":
+        sources = hybrid_search(query, n, filters=filters)
+    else:
+        sources = similarity_search(query, n, filters)
+    if n > k:
+        sources = rerank(query, sources, k, opts, dense_scores=mode == "dense")
+    return sources
+
+
+def format_sources(sources: List[Dict]) -> List[Dict]:
     out_sources = []
     for i, s in enumerate(sources, start=1):
         out_sources.append(
@@ -100,9 +82,117 @@ def answer_query(cfg_path: str, query: str) -> dict:
                 "snippet": s.get("content"),
                 "page_number": s.get("page_number"),
                 "timestamp": s.get("timestamp"),
+                "bbox": s.get("bbox"),
                 "score": s.get("score"),
             }
         )
-    return {"answer": text, "sources": out_sources}
+    return out_sources
+
+
+def prompt_for(
+    cfg: dict, adapter: LLMAdapter, query: str, sources: List[Dict]
+) -> Tuple[str, List[Dict], int]:
+    """(prompt, sources in it, prompt tokens) fitted to `adapter`'s context with `max_tokens` left for the answer."""
+    opts = cfg.get("prompt") or {}
+    budget = adapter.context_size - int(cfg.get("max_tokens", 512))
+    if opts.get("budget_tokens"):
+        budget = min(budget, int(opts["budget_tokens"]))
+    return assemble_prompt(query, sources, adapter.count_tokens, budget, opts)
+
+
+def _answer_key(cfg: dict, query: str, k: int, filters: Optional[dict] = None) -> tuple:
+    return (
+        "answer",
+        normalize_query(query),
+        k,
+        cfg.get("search_mode") or "dense",
+        json.dumps(filters, sort_keys=True) if filters else None,
+        (
+            json.dumps(cfg.get("rerank"), sort_keys=True)
+            if (cfg.get("rerank") or {}).get("enabled")
+            else None
+        ),
+        json.dumps(cfg.get("prompt"), sort_keys=True) if cfg.get("prompt") else None,
+        cfg.get("model_backend"),
+        cfg.get("model_path"),
+        int(cfg.get("max_tokens", 512)),
+        float(cfg.get("temperature", 0.2)),
+    )
+
+
+def answer_query(cfg_path: str, query: str, filters: Optional[dict] = None) -> dict:
+    cfg = get_config(cfg_path)
+    k = int(cfg.get("top_k", 5))
+    cache = get_cache("results")
+    version = index_version()
+    key = _answer_key(cfg, query, k, filters)
+    cached = cache.get_versioned(version, key)
+    if cached is not None:
+        return cached
+    sources = retrieve(cfg, query, k, filters)
+    with _registry.acquire(cfg) as adapter:
+        prompt, sources, _ = prompt_for(cfg, adapter, query, sources)
+        text = adapter.generate(
+            prompt,
+            max_tokens=int(cfg.get("max_tokens", 512)),
+            temperature=float(cfg.get("temperature", 0.2)),
+        )
+    result = {"answer": text, "sources": format_sources(sources)}
+    cache.put_versioned(version, key, result)
+    return result
+
+
+def stream_answer(cfg_path: str, query: str, filters: Optional[dict] = None) -> Iterator[Dict]:
+    """Yield `sources`, then `token` events as the LLM produces them, then `done` with timings (ms)."""
+    t0 = time.perf_counter()
+    cfg = get_config(cfg_path)
+    k = int(cfg.get("top_k", 5))
+    cache = get_cache("results")
+    version = index_version()
+    key = _answer_key(cfg, query, k, filters)
+    cached = cache.get_versioned(version, key)
+    if cached is not None:
+        yield {"event": "sources", "data": cached["sources"]}
+        yield {"event": "token", "data": cached["answer"]}
+        yield {
+            "event": "done",
+            "data": {"cached": True, "total_ms": (time.perf_counter() - t0) * 1000},
+        }
+        return
 
+    sources = retrieve(cfg, query, k, filters)
+    t_retrieved = time.perf_counter()
+    parts: List[str] = []
+    t_first = None
+    with _registry.acquire(cfg) as adapter:
+        # waiting for a free (or cold) model instance
+        t_loaded = time.perf_counter()
+        # sources are sent once fitted to the prompt so their numbers match the citations
+        prompt, sources, prompt_tokens = prompt_for(cfg, adapter, query, sources)
+        out_sources = format_sources(sources)
+        yield {"event": "sources", "data": out_sources}
+        for token in adapter.stream(
+            prompt,
+            max_tokens=int(cfg.get("max_tokens", 512)),
+            temperature=float(cfg.get("temperature", 0.2)),
+        ):
+            if t_first is None:
+                t_first = time.perf_counter()
+            parts.append(token)
+            yield {"event": "token", "data": token}
+    t_end = time.perf_counter()
 
+    cache.put_versioned(version, key, {"answer": "".join(parts), "sources": out_sources})
+    yield {
+        "event": "done",
+        "data": {
+            "cached": False,
+            "retrieval_ms": (t_retrieved - t0) * 1000,
+            "model_load_ms": (t_loaded - t_retrieved) * 1000,
+            "first_token_ms": ((t_first or t_end) - t0) * 1000,
+            "generation_ms": (t_end - t_loaded) * 1000,
+            "total_ms": (t_end - t0) * 1000,
+            "chunks": len(parts),
+            "prompt_tokens": prompt_tokens,
+        },
+    }
@@ -0,0 +1,114 @@
+"""
+Cross-encoder re-ranking of retrieved chunks.
+
+With `rerank.enabled`, `/query` over-fetches `rerank.candidates` chunks,
+scores each (query, chunk) pair with a small local cross-encoder in batches
+of `rerank.batch_size`, and keeps the best `top_k` for the prompt. Two
+guards keep it cheap:
+
+- early exit: when the dense scores already separate the top-k from the
+  next candidate by `rerank.margin` or more, the vector order is kept
+  without running the model
+- budget: batches are scored best-first; once the next batch would push
+  the query past `rerank.budget_ms`, scoring stops and the vector order is
+  used, so a slow CPU degrades to plain retrieval instead of slow answers
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+import numpy as np
+
+from . import encoders
+
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder
+
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+_model: Optional[CrossEncoder] = None
+_model_name: Optional[str] = None
+_model_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {"queries": 0, "reranked": 0, "early_exit": 0, "over_budget": 0, "total_ms": 0.0}
+
+
+def get_reranker(name: str = RERANK_MODEL) -> CrossEncoder:
+    global _model, _model_name
+    with _model_lock:
+        if _model is None or _model_name != name:
+            from sentence_transformers import CrossEncoder
+
+            encoders.configure_threads()
+            _model, _model_name = CrossEncoder(name, max_length=256), name
+        return _model
+
+
+def _score_with_model(name: str) -> Callable[[str, List[str]], np.ndarray]:
+    def score(query: str, texts: List[str]) -> np.ndarray:
+        return np.asarray(
+            get_reranker(name).predict([(query, t) for t in texts], batch_size=len(texts))
+        )
+
+    return score
+
+
+def _count(outcome: str, ms: float) -> None:
+    with _stats_lock:
+        _stats["queries"] += 1
+        _stats[outcome] += 1
+        _stats["total_ms"] += ms
+
+
+def rerank(
+    query: str,
+    candidates: List[Dict],
+    k: int,
+    opts: Optional[dict] = None,
+    score: Optional[Callable[[str, List[str]], np.ndarray]] = None,
+    dense_scores: bool = True,
+) -> List[Dict]:
+    """The best `k` of `candidates` (given in retrieval order) by cross-encoder score.
+
+    `opts` is the `rerank` config section. `dense_scores` says whether the
+    candidates' `score` is a vector similarity the early exit can compare
+    (fused hybrid scores aren't). Re-ranked results carry `rerank_score`.
+    """
+    opts = opts or {}
+    t0 = time.perf_counter()
+    if len(candidates) <= 1:
+        return candidates[:k]
+    margin = opts.get("margin")
+    if dense_scores and margin is not None and len(candidates) > k:
+        if candidates[k - 1]["score"] - candidates[k]["score"] >= float(margin):
+            _count("early_exit", (time.perf_counter() - t0) * 1000)
+            return candidates[:k]
+
+    score = score or _score_with_model(opts.get("model") or RERANK_MODEL)
+    budget = float(opts.get("budget_ms", 150)) / 1000
+    batch_size = max(1, int(opts.get("batch_size", 16)))
+    texts = [c.get("content") or "" for c in candidates]
+    scores: List[float] = []
+    for start in range(0, len(texts), batch_size):
+        scores.extend(float(s) for s in score(query, texts[start : start + batch_size]))
+        elapsed = time.perf_counter() - t0
+        per_batch = elapsed / (start // batch_size + 1)
+        if len(scores) < len(texts) and elapsed + per_batch > budget:
+            _count("over_budget", elapsed * 1000)
+            return candidates[:k]
+
+    order = np.argsort(-np.asarray(scores), kind="stable")[:k]
+    _count("reranked", (time.perf_counter() - t0) * 1000)
+    return [{**candidates[i], "rerank_score": scores[i]} for i in order]
+
+
+def rerank_stats() -> dict:
+    with _stats_lock:
+        out = dict(_stats)
+    out["avg_ms"] = round(out.pop("total_ms") / out["queries"], 3) if out["queries"] else 0.0
+    return out
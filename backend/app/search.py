@@ -1,17 +1,51 @@
 """
-Placeholder search module.
+Batch semantic search, for offline evaluation and bulk lookups.
 
-Implement functions to:
-- Load vector store
-- Compute query embedding
-- Perform similarity search and return top-k chunks
+`semantic_search` answers N queries with one encoder call (cached queries
+are skipped), one FAISS search over the N x d query matrix and one SQL
+query for the metadata of every hit, instead of N round trips through
+each stage.
 """
 
-from typing import List, Dict
+from __future__ import annotations
 
+from typing import Dict, List, Optional, Sequence
 
-def semantic_search(query: str, top_k: int = 5) -> List[Dict]:
-    """Stub: return mock search results."""
-    return [{"text": "Example relevant chunk", "score": 0.99}]
+from .embeddings import embed_clip_queries, embed_queries
+from .index_store import get_index_manager, lookup_vectors, search_collection
 
 
+# query encoder and collection searched per mode, as in /search/similarity
+MODES = {"text": (embed_queries, "text"), "cross": (embed_clip_queries, "image")}
+
+
+def semantic_search(
+    queries: Sequence[str],
+    top_k: int = 5,
+    mode: str = "text",
+    filters: Optional[dict] = None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> List[List[Dict]]:
+    """Top-`top_k` results for each query, in query order.
+
+    `mode` "text" searches MiniLM text chunks, "cross" CLIP image vectors
+    with the CLIP text embedding of each query. `filters` are parsed search
+    filters (see index_store.parse_filters) applied to every query.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode} (expected one of {', '.join(MODES)})")
+    embed, collection = MODES[mode]
+    if not queries or get_index_manager(collection).ntotal == 0:
+        return [[] for _ in queries]
+    D, I = search_collection(collection, embed(list(queries)), top_k, nprobe, ef_search, filters)
+    meta_map = lookup_vectors(I.ravel().tolist(), collection)
+    results = []
+    for ids, scores in zip(I.tolist(), D.tolist()):
+        hits = []
+        for vid, score in zip(ids, scores):
+            row = meta_map.get(vid)
+            if row:
+                hits.append({**row, "score": float(score)})
+        results.append(hits)
+    return results
@@ -0,0 +1,156 @@
+"""
+Token-aware text splitting.
+
+Text is tokenized once with the embedding model's tokenizer (only the
+character offsets are kept) and sentence boundaries are found in one regex
+pass. Chunks are then cut in a single left-to-right pass so that none
+exceeds `splitter.max_tokens` word pieces (MiniLM silently truncates past
+256), ending on a sentence boundary whenever one falls in the second half
+of the window, with `splitter.overlap_tokens` carried into the next chunk.
+
+If the tokenizer isn't in the local model cache yet, a regex stand-in that
+over-counts tokens is used, so chunks come out shorter rather than
+truncated. The fallback is logged and shown in /status, and the cache is
+checked again after `splitter.retry_seconds` (the text model's warm-up
+downloads the tokenizer).
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from itertools import chain
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .config import get_section
+
+
+logger = logging.getLogger(__name__)
+
+# a sentence ends after . ! ? (and closing quotes/brackets) or at a line break
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+|\n\s*")
+
+
+class RegexTokenizer:
+    """Offline stand-in: word pieces of at most 5 characters, so counts err high."""
+
+    _TOKEN = re.compile(r"\w{1,5}|[^\w\s]")
+    name = "regex"
+
+    def offsets(self, text: str) -> np.ndarray:
+        spans = chain.from_iterable(m.span() for m in self._TOKEN.finditer(text))
+        return np.fromiter(spans, dtype=np.int64).reshape(-1, 2)
+
+
+class HFTokenizer:
+    """A Hugging Face fast tokenizer, used only for token offsets."""
+
+    def __init__(self, name: str):
+        from transformers import AutoTokenizer
+
+        self.name = name
+        # never downloads: the text model's warm-up fills the cache, and the fallback retries
+        self.tokenizer = AutoTokenizer.from_pretrained(name, local_files_only=True)
+
+    def offsets(self, text: str) -> np.ndarray:
+        enc = self.tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            verbose=False,
+        )
+        return np.asarray(enc["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+
+
+class TokenSplitter:
+    def __init__(
+        self,
+        tokenizer,
+        max_tokens: int = 254,
+        overlap_tokens: int = 48,
+        min_tokens: Optional[int] = None,
+    ):
+        self.tokenizer = tokenizer
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = min(max(0, overlap_tokens), self.max_tokens - 1)
+        # a chunk only ends early at a sentence boundary if it is at least this long
+        self.min_tokens = self.max_tokens // 2 if min_tokens is None else min_tokens
+
+    def spans(self, text: str) -> List[Tuple[int, int]]:
+        """(start, end) character offsets of the chunks of `text`."""
+        offsets = self.tokenizer.offsets(text or "")
+        n = len(offsets)
+        if n == 0:
+            return []
+        starts, ends = offsets[:, 0], offsets[:, 1]
+        # token index at which each sentence starts
+        bounds = np.fromiter((m.end() for m in _SENTENCE_END.finditer(text)), dtype=np.int64)
+        cuts = np.unique(np.searchsorted(starts, bounds))
+
+        spans: List[Tuple[int, int]] = []
+        i = 0
+        while i < n:
+            cut = min(i + self.max_tokens, n)
+            if cut < n:
+                k = np.searchsorted(cuts, cut, side="right") - 1
+                if k >= 0 and cuts[k] - i >= self.min_tokens:
+                    cut = int(cuts[k])
+            spans.append((int(starts[i]), int(ends[cut - 1])))
+            if cut >= n:
+                break
+            nxt = cut - self.overlap_tokens
+            # let the overlap start at a sentence start when one falls inside it
+            k = np.searchsorted(cuts, nxt, side="left")
+            if k < len(cuts) and cuts[k] < cut:
+                nxt = int(cuts[k])
+            i = max(nxt, i + 1)
+        return spans
+
+    def split(self, text: str) -> List[str]:
+        return [text[s:e] for s, e in self.spans(text)]
+
+
+_splitter: Optional[TokenSplitter] = None
+_splitter_lock = threading.Lock()
+_retry_at = 0.0  # when to try loading the real tokenizer again after a fallback
+
+
+def get_splitter() -> TokenSplitter:
+    """The process-wide splitter configured by the `splitter` section of config.yaml."""
+    global _splitter, _retry_at
+    with _splitter_lock:
+        fallback = _splitter is not None and isinstance(_splitter.tokenizer, RegexTokenizer)
+        if _splitter is None or (fallback and time.monotonic() >= _retry_at):
+            from .embeddings import TEXT_MODEL
+
+            cfg = get_section("splitter")
+            name = cfg.get("tokenizer") or TEXT_MODEL
+            try:
+                tokenizer = HFTokenizer(name)
+            except Exception as e:
+                logger.warning(
+                    "tokenizer %s unavailable, splitting with the regex stand-in: %s", name, e
+                )
+                tokenizer = RegexTokenizer()
+                _retry_at = time.monotonic() + float(cfg.get("retry_seconds", 300))
+            _splitter = TokenSplitter(
+                tokenizer, int(cfg.get("max_tokens", 254)), int(cfg.get("overlap_tokens", 48))
+            )
+        return _splitter
+
+
+def splitter_stats() -> dict:
+    """The tokenizer this process splits with (None until the first split)."""
+    splitter = _splitter
+    if splitter is None:
+        return {"tokenizer": None, "fallback": False}
+    return {
+        "tokenizer": splitter.tokenizer.name,
+        "fallback": isinstance(splitter.tokenizer, RegexTokenizer),
+    }
@@ -0,0 +1,169 @@
+"""
+Bounded executors that keep CPU-heavy request work off the asyncio event loop.
+
+Each stage (extraction, ingest embedding, search, LLM queries, audio) gets
+its own pool sized from the `concurrency` section of config.yaml, so one
+large upload cannot starve `/health` or `/query`. Pools track how many
+calls are waiting and running, which `/status` reports as queue depth.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterator
+
+from .config import get_section
+
+
+# stage -> (config key, default size, process pool?)
+POOLS = {
+    "extract": ("extract_processes", 2, True),
+    "ingest": ("ingest_threads", 1, False),
+    "search": ("search_threads", 4, False),
+    "query": ("query_threads", 2, False),
+    "audio": ("audio_threads", 1, False),
+}
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a stage already has `concurrency.max_queue` calls waiting."""
+
+
+class BoundedExecutor:
+    def __init__(self, name: str, max_workers: int, processes: bool = False, max_queue: int = 0):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.processes = processes
+        self._pool: Executor = (
+            ProcessPoolExecutor(max_workers=max_workers)
+            if processes
+            else ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        )
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._running = 0
+
+    def _track(self, call: Callable):
+        with self._lock:
+            self._running += 1
+        try:
+            return call()
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _running_count(self) -> int:
+        # calls handed to a process pool can't report when they start; assume the pool is busy
+        return min(self._submitted, self.max_workers) if self.processes else self._running
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._submitted -= 1
+
+    def submit(self, fn: Callable, *args, **kwargs) -> asyncio.Future:
+        """Queue a call on this stage; raises QueueFullError right away if the stage is full."""
+        with self._lock:
+            if self.max_queue and self._submitted - self._running_count() >= self.max_queue:
+                raise QueueFullError(f"{self.name} queue is full")
+            self._submitted += 1
+        call = functools.partial(fn, *args, **kwargs)
+        if not self.processes:
+            call = functools.partial(self._track, call)
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._pool, call)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        return await self.submit(fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = self._running_count()
+            return {
+                "workers": self.max_workers,
+                "running": running,
+                "queued": self._submitted - running,
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executors: Dict[str, BoundedExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name: str) -> BoundedExecutor:
+    with _executors_lock:
+        ex = _executors.get(name)
+        if ex is None:
+            key, default, processes = POOLS[name]
+            cfg = get_section("concurrency")
+            ex = _executors[name] = BoundedExecutor(
+                name, int(cfg.get(key, default)), processes, int(cfg.get("max_queue", 0) or 0)
+            )
+        return ex
+
+
+async def run_in(name: str, fn: Callable, *args, **kwargs):
+    return await get_executor(name).run(fn, *args, **kwargs)
+
+
+def stream_in(name: str, fn: Callable[..., Iterator], *args, **kwargs) -> AsyncIterator:
+    """Iterate the generator `fn(*args, **kwargs)` on a thread stage, yielding its items on the event loop.
+
+    The call is admitted (or rejected with QueueFullError) immediately, so a
+    streaming endpoint can still answer 503 before it starts its response.
+    Closing the returned iterator, e.g. when the client disconnects, stops
+    the generator at its next item.
+    """
+    loop = asyncio.get_running_loop()
+    items: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    end = object()
+
+    def drain() -> None:
+        gen = fn(*args, **kwargs)
+        try:
+            for item in gen:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(items.put_nowait, item)
+        finally:
+            gen.close()
+            loop.call_soon_threadsafe(items.put_nowait, end)
+
+    future = get_executor(name).submit(drain)
+
+    async def relay() -> AsyncIterator:
+        try:
+            while True:
+                item = await items.get()
+                if item is end:
+                    break
+                yield item
+            await future  # surface an exception raised by the generator
+        finally:
+            stop.set()
+
+    return relay()
+
+
+def queue_stats() -> dict:
+    with _executors_lock:
+        return {name: ex.stats() for name, ex in _executors.items()}
+
+
+def shutdown() -> None:
+    with _executors_lock:
+        for ex in _executors.values():
+            ex.shutdown()
+        _executors.clear()
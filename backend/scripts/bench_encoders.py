@@ -0,0 +1,94 @@
+"""Compare encoder backends (fp32 torch, dynamic int8, ONNX Runtime) on this CPU.
+
+Reports texts/s for MiniLM, images/s for CLIP and the mean / min cosine
+similarity of each backend's vectors to the first backend's (fp32 torch by
+default), so `encoders.backend` and `encoders.threads` in config.yaml can
+be picked from data.
+
+Usage (from backend/, with PYTHONPATH=.):
+    python scripts/bench_encoders.py
+    python scripts/bench_encoders.py --backends torch quantized --threads 1 4 --texts 2000
+    python scripts/bench_encoders.py --images ../samples/*.png
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from app import embeddings, encoders
+
+
+SENTENCES = [
+    "Solar panel efficiency drops as cell temperature rises.",
+    "Offshore wind farms need subsea cables to reach the grid.",
+    "Lithium iron phosphate batteries tolerate more charge cycles.",
+    "Heat pumps move heat rather than generate it, so their COP exceeds one.",
+]
+
+
+def use_backend(name: str, threads: int, onnx_dir: str) -> None:
+    encoders.get_section = lambda section: {
+        "backend": name,
+        "threads": threads,
+        "onnx_dir": onnx_dir,
+    }
+    encoders._threads_set = False
+    for attr in ("_text_model", "_clip_model", "_clip_preprocess", "_onnx_text", "_onnx_clip"):
+        setattr(embeddings, attr, None)
+
+
+def timed(fn, items):
+    fn(items[:8])  # load / export the model and warm up outside the timing
+    t0 = time.perf_counter()
+    out = fn(items)
+    return out, len(items) / (time.perf_counter() - t0)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> str:
+    cos = (a * b).sum(axis=1)
+    return f"{cos.mean():.4f}/{cos.min():.4f}"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--backends", nargs="+", default=list(encoders.BACKENDS), choices=encoders.BACKENDS
+    )
+    ap.add_argument("--threads", type=int, nargs="+", default=[0])
+    ap.add_argument("--texts", type=int, default=1000, help="number of sentences to encode")
+    ap.add_argument("--images", nargs="*", default=[], help="image files for the CLIP benchmark")
+    args = ap.parse_args()
+
+    texts = [f"{SENTENCES[i % len(SENTENCES)]} ({i})" for i in range(args.texts)]
+    onnx_dir = tempfile.mkdtemp(prefix="onnx-")
+    reference = {}
+    print(
+        f"{'backend':<10} {'threads':>7} {'texts/s':>9} {'cos text':>15} {'images/s':>9} {'cos image':>15}"
+    )
+    for threads in args.threads:
+        for name in args.backends:
+            use_backend(name, threads, onnx_dir)
+            try:
+                text_vecs, text_rate = timed(embeddings.embed_texts, texts)
+                image_vecs, image_rate = (
+                    timed(embeddings.embed_image_paths, args.images) if args.images else (None, 0.0)
+                )
+            except RuntimeError as e:
+                print(f"{name:<10} {threads:>7} skipped: {e}")
+                continue
+            reference.setdefault("text", text_vecs)
+            if image_vecs is not None:
+                reference.setdefault("image", image_vecs)
+            cos_image = (
+                similarity(image_vecs, reference["image"]) if image_vecs is not None else "-"
+            )
+            print(
+                f"{name:<10} {threads:>7} {text_rate:>9.1f} {similarity(text_vecs, reference['text']):>15} "
+                f"{image_rate:>9.1f} {cos_image:>15}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measure how long importing the API takes, to keep cold starts from regressing.
+
+Runs `import app.main` in fresh interpreters, reports the median wall time,
+the slowest modules by cumulative import time (from `python -X importtime`)
+and any heavy modules that got imported eagerly. Exits non-zero when the
+median exceeds --max-ms or a heavy module is imported, so it can gate CI.
+
+Usage (from backend/, with PYTHONPATH=.):
+    python scripts/bench_import.py
+    python scripts/bench_import.py --runs 10 --max-ms 1500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# only imported on first use; importing the app must not pull them in
+HEAVY = (
+    "torch",
+    "sentence_transformers",
+    "open_clip",
+    "transformers",
+    "fitz",
+    "docx",
+    "onnxruntime",
+)
+
+PROBE = (
+    "import sys, time; t = time.perf_counter(); import app.main; "
+    "print(__import__('json').dumps({'ms': (time.perf_counter() - t) * 1000, "
+    "'heavy': [m for m in %r if m in sys.modules]}))" % (HEAVY,)
+)
+
+
+def run(args: list) -> subprocess.CompletedProcess:
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [".", os.environ.get("PYTHONPATH")])),
+    }
+    return subprocess.run(
+        [sys.executable, *args], capture_output=True, text=True, env=env, check=True
+    )
+
+
+def slowest(top: int) -> list:
+    rows = []
+    for line in run(["-X", "importtime", "-c", "import app.main"]).stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument(
+        "--max-ms", type=float, default=0, help="fail when the median import time exceeds this"
+    )
+    args = ap.parse_args()
+
+    results = [json.loads(run(["-c", PROBE]).stdout) for _ in range(args.runs)]
+    median = statistics.median(r["ms"] for r in results)
+    heavy = sorted({m for r in results for m in r["heavy"]})
+    print(f"import app.main: median {median:.0f} ms over {args.runs} runs")
+    print(f"{'cumulative ms':>14}  module")
+    for ms, name in slowest(args.top):
+        print(f"{ms:>14.1f}  {name}")
+    failed = False
+    if heavy:
+        print(f"FAIL: imported eagerly: {', '.join(heavy)}")
+        failed = True
+    if args.max_ms and median > args.max_ms:
+        print(f"FAIL: median {median:.0f} ms > --max-ms {args.max_ms:.0f}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Compare FAISS index factories against exact Flat search.
+
+Reports recall@k versus IndexFlatIP, query latency and build time so the
+`index.factory` / `index.ann_factory` / `nprobe` / `ef_search` settings in
+config.yaml can be picked from data rather than guessed.
+
+Usage (from backend/, with PYTHONPATH=.):
+    python scripts/bench_index.py                      # vectors from the text collection
+    python scripts/bench_index.py --synthetic 200000   # random unit vectors
+    python scripts/bench_index.py --factories Flat HNSW32 IVF1024,Flat --nprobe 8 32
+"""
+
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from app.index_store import (
+    COLLECTIONS,
+    EMBEDDING_MODELS,
+    _unwrap,
+    build_index,
+    get_embedding_store,
+    get_index_manager,
+    reconstruct_all,
+    search_params,
+)
+
+
+def load_vectors(args) -> np.ndarray:
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        v = rng.standard_normal((args.synthetic, args.dim), dtype=np.float32)
+        return v / np.linalg.norm(v, axis=1, keepdims=True)
+    _, vectors = get_embedding_store(args.collection).load(
+        EMBEDDING_MODELS[args.collection], COLLECTIONS[args.collection]
+    )
+    if len(vectors):
+        # exact vectors, whatever the collection's index type
+        return np.asarray(vectors)
+    # the base file only; run POST /index/compact first to include the delta segment
+    index = faiss.read_index(get_index_manager(args.collection).path)
+    if not isinstance(_unwrap(index), faiss.IndexFlat):
+        raise SystemExit(
+            "collection index is not Flat; use --synthetic or rebuild with factory: Flat"
+        )
+    return reconstruct_all(index)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--collection", default="text")
+    ap.add_argument("--synthetic", type=int, default=0, help="benchmark N random vectors instead")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("-k", type=int, default=10)
+    ap.add_argument(
+        "--factories", nargs="+", default=["Flat", "HNSW32", "IVF1024,Flat", "IVF1024,PQ32"]
+    )
+    ap.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 64])
+    ap.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    args = ap.parse_args()
+
+    xb = load_vectors(args)
+    rng = np.random.default_rng(1)
+    xq = xb[rng.choice(len(xb), size=min(args.queries, len(xb)), replace=False)]
+    print(f"{len(xb)} vectors, dim {xb.shape[1]}, {len(xq)} queries, k={args.k}")
+
+    exact = faiss.IndexFlatIP(xb.shape[1])
+    exact.add(xb)
+    _, truth = exact.search(xq, args.k)
+
+    print(f"{'factory':<20} {'param':<14} {'recall@k':>9} {'ms/query':>9} {'build s':>8}")
+    for factory in args.factories:
+        t0 = time.perf_counter()
+        index = build_index(xb.shape[1], factory, xb)
+        build_s = time.perf_counter() - t0
+        if faiss.try_extract_index_ivf(index) is not None:
+            settings = [("nprobe", n) for n in args.nprobe]
+        elif isinstance(index, faiss.IndexHNSW):
+            settings = [("ef_search", e) for e in args.ef_search]
+        else:
+            settings = [("-", None)]
+        for name, value in settings:
+            params = search_params(index, **({name: value} if value else {}))
+            t0 = time.perf_counter()
+            _, found = index.search(xq, args.k, params=params)
+            ms = (time.perf_counter() - t0) * 1000 / len(xq)
+            recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+            label = f"{name}={value}" if value else name
+            print(f"{factory:<20} {label:<14} {recall:>9.3f} {ms:>9.3f} {build_s:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Compare the token-aware splitter with the character splitter it replaced.
+
+Splits a multi-MB text (synthetic, or the files given) with both and
+reports throughput, chunk counts, mean chunk length in tokens and the share
+of chunks longer than the text encoder's 256-token window (which it would
+silently truncate). Token counts use the same tokenizer as the splitter.
+
+Usage (from backend/, with PYTHONPATH=.):
+    python scripts/bench_splitter.py
+    python scripts/bench_splitter.py --mb 16
+    python scripts/bench_splitter.py ../docs/*.txt
+"""
+
+import argparse
+import random
+import time
+from typing import List, Tuple
+
+from app.splitter import get_splitter
+
+ENCODER_WINDOW = 256
+
+WORDS = (
+    "inverter battery grid solar panel turbine storage voltage frequency load demand "
+    "capacity transmission substation efficiency lithium hydrogen electrolyser curtailment"
+).split()
+
+
+def legacy_spans(
+    text: str, min_size: int = 400, max_size: int = 700, overlap_ratio: float = 0.2
+) -> List[Tuple[int, int]]:
+    """The previous extractors._split_spans: fixed character windows ending at '. ' or a newline."""
+    start = len(text) - len(text.lstrip())
+    stop = len(text.rstrip())
+    spans: List[Tuple[int, int]] = []
+    overlap = int(max_size * overlap_ratio)
+    while start < stop:
+        end = min(start + max_size, stop)
+        boundary = max(text.rfind(". ", start, end), text.rfind("\n", start, end))
+        if boundary != -1 and boundary + 1 - start >= min_size:
+            end = boundary + 1
+        if text[start:end].strip():
+            spans.append((start, end))
+        if end == stop:
+            break
+        start = max(0, end - overlap)
+    return spans
+
+
+def synthetic(mb: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts, size = [], 0
+    while size < mb * 1_000_000:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 30))).capitalize()
+        sentence += rng.choice([". ", ". ", "? ", ".\n", ".\n\n"])
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)
+
+
+def report(name: str, text: str, fn, tokenizer) -> None:
+    t0 = time.perf_counter()
+    spans = fn(text)
+    elapsed = time.perf_counter() - t0
+    tokens = [len(tokenizer.offsets(text[s:e])) for s, e in spans]
+    over = sum(t > ENCODER_WINDOW - 2 for t in tokens)
+    print(
+        f"{name:<8} {len(text) / 1e6 / elapsed:>8.2f} {len(spans):>8} {sum(tokens) / max(len(tokens), 1):>10.1f} "
+        f"{max(tokens, default=0):>8} {100 * over / max(len(tokens), 1):>9.1f}%"
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("files", nargs="*", help="text files to split instead of synthetic text")
+    ap.add_argument("--mb", type=float, default=4, help="size of the synthetic text")
+    args = ap.parse_args()
+
+    if args.files:
+        text = "\n".join(open(p, "r", encoding="utf-8", errors="ignore").read() for p in args.files)
+    else:
+        text = synthetic(args.mb)
+    splitter = get_splitter()
+    print(f"{len(text) / 1e6:.1f} MB, tokenizer: {type(splitter.tokenizer).__name__}")
+    print(
+        f"{'splitter':<8} {'MB/s':>8} {'chunks':>8} {'avg tokens':>10} {'max':>8} {'> window':>10}"
+    )
+    report("legacy", text, legacy_spans, splitter.tokenizer)
+    report("token", text, splitter.spans, splitter.tokenizer)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
+import argparse
 import time
 from backend.app.rag import answer_query
+from backend.app.search import semantic_search
 import os
 
 CFG = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'config.yaml'))
@@ -9,8 +11,23 @@ EXAMPLES = [
   ("What converts kinetic energy into electricity?", "Wind turbines"),
 ]
 
-def run():
+def eval_retrieval(k):
+  # all examples in one batch: one encoder call, one index search, one metadata query
+  t0 = time.time()
+  results = semantic_search([q for q, _ in EXAMPLES], top_k=k)
+  dt = (time.time() - t0) * 1000
+  hits = 0
+  for (q, kw), sources in zip(EXAMPLES, results):
+    ok = any(kw.lower() in (s.get('content') or '').lower() for s in sources)
+    hits += ok
+    print(f"Q: {q}\n  hit@{k}={ok}\n  sources: {[s.get('file_name') for s in sources]}")
+  print(f"retrieval: hit@{k}={hits}/{len(EXAMPLES)} time_ms={dt:.1f} for {len(EXAMPLES)} queries")
+
+def run(retrieval_only=False, k=5):
   print("Evaluating RAG pipeline...")
+  eval_retrieval(k)
+  if retrieval_only:
+    return
   for q, kw in EXAMPLES:
     t0 = time.time()
     out = answer_query(CFG, q)
@@ -19,6 +36,8 @@ def run():
     print(f"Q: {q}\n  ok={ok} time_ms={dt:.1f}\n  answer: {out.get('answer')[:200]}...\n  sources: {[s.get('file_name') for s in out.get('sources', [])]}")
 
 if __name__ == '__main__':
-  run()
-
-
+  ap = argparse.ArgumentParser()
+  ap.add_argument('--retrieval-only', action='store_true', help='skip the LLM and only score batched retrieval')
+  ap.add_argument('-k', type=int, default=5)
+  args = ap.parse_args()
+  run(args.retrieval_only, args.k)
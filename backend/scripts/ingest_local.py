@@ -1,32 +1,59 @@
 import os
 import sys
 import asyncio
+import shutil
 from pathlib import Path
 
 import aiohttp
 
+# POST this many files per /ingest/batch request
+BATCH_FILES = 32
 
-async def ingest_file(session: aiohttp.ClientSession, path: Path):
-  url = "http://localhost:8000/ingest"
-  with path.open('rb') as f:
+
+async def ingest_batch(session: aiohttp.ClientSession, paths: list):
+  url = "http://localhost:8000/ingest/batch"
+  handles = [p.open('rb') for p in paths]
+  try:
     data = aiohttp.FormData()
-    data.add_field('file', f, filename=path.name)
+    for p, f in zip(paths, handles):
+      data.add_field('files', f, filename=p.name)
     async with session.post(url, data=data) as resp:
-      print(path.name, resp.status, await resp.text())
+      print(f"{len(paths)} files", resp.status, await resp.text())
+  finally:
+    for f in handles:
+      f.close()
 
 
-async def main(folder: str):
-  p = Path(folder)
-  files = [x for x in p.iterdir() if x.is_file()]
+async def main(files: list):
   async with aiohttp.ClientSession() as session:
-    for f in files:
-      await ingest_file(session, f)
+    for i in range(0, len(files), BATCH_FILES):
+      await ingest_batch(session, files[i:i + BATCH_FILES])
 
 
-if __name__ == "__main__":
-  if len(sys.argv) < 2:
-    print("Usage: python scripts/ingest_local.py <folder>")
-    sys.exit(1)
-  asyncio.run(main(sys.argv[1]))
+def direct(files: list):
+  # in-process: no HTTP, extraction in a process pool, one commit per embedding batch
+  sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+  from app.index_store import STORAGE_DIR, ensure_storage
+  from app.ingest import ingest_paths
 
+  ensure_storage()
+  paths = []
+  for f in files:
+    # keep files under storage/ like the HTTP path so /storage links resolve
+    dest = os.path.join(STORAGE_DIR, f.name)
+    if os.path.abspath(f) != dest:
+      shutil.copy2(f, dest)
+    paths.append(dest)
+  print(ingest_paths(paths, [f.name for f in files]))
 
+
+if __name__ == "__main__":
+  args = [a for a in sys.argv[1:] if not a.startswith('--')]
+  if len(args) < 1:
+    print("Usage: python scripts/ingest_local.py <folder> [--direct]")
+    sys.exit(1)
+  files = sorted(x for x in Path(args[0]).iterdir() if x.is_file())
+  if '--direct' in sys.argv:
+    direct(files)
+  else:
+    asyncio.run(main(files))
@@ -1,8 +1,24 @@
-from app.index_store import rebuild_from_db
-
-if __name__ == "__main__":
-    # MiniLM-L6-v2 embedding size
-    res = rebuild_from_db(384)
-    print(res)
+import argparse
 
+from app.index_store import COLLECTIONS, rebuild_from_db
 
+if __name__ == "__main__":
+    # PYTHONPATH=. python scripts/rebuild_index.py [image] [--factory HNSW32] [--reembed]
+    parser = argparse.ArgumentParser(
+        description="Rebuild FAISS indexes from the metadata DB and embedding store."
+    )
+    parser.add_argument(
+        "collections", nargs="*", help=f"any of {', '.join(COLLECTIONS)} (default: all)"
+    )
+    parser.add_argument("--factory", help="FAISS index_factory string, overrides index.factory")
+    parser.add_argument(
+        "--reembed",
+        action="store_true",
+        help="re-encode every row instead of reusing stored vectors",
+    )
+    args = parser.parse_args()
+    unknown = set(args.collections) - set(COLLECTIONS)
+    if unknown:
+        parser.error(f"unknown collection(s): {', '.join(sorted(unknown))}")
+    for name in args.collections or list(COLLECTIONS):
+        print(rebuild_from_db(name, factory=args.factory, reembed=args.reembed))
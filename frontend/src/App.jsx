@@ -22,22 +22,47 @@ function App() {
   const handleSend = async (text) => {
     setMessages((prev) => [...prev, { role: "user", content: text }]);
     setIsTyping(true);
+    // update the assistant message at the end of the list as stream events arrive
+    const updateLast = (patch) =>
+      setMessages((prev) => {
+        const next = [...prev];
+        const last = next[next.length - 1];
+        next[next.length - 1] = { ...last, ...patch(last) };
+        return next;
+      });
     try {
-      const res = await fetch("http://localhost:8000/query", {
+      const res = await fetch("http://localhost:8000/query/stream", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({ query: text }),
       });
-      const data = await res.json();
+      if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
       setMessages((prev) => [
         ...prev,
-        {
-          role: "assistant",
-          content: data.answer,
-          sources: data.sources,
-          onOpenSource: setModalItem,
-        },
+        { role: "assistant", content: "", sources: [], onOpenSource: setModalItem },
       ]);
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] ?? "null");
+          if (event === "sources") {
+            updateLast(() => ({ sources: data }));
+          } else if (event === "token") {
+            setIsTyping(false);
+            updateLast((last) => ({ content: last.content + data }));
+          } else if (event === "error") {
+            updateLast(() => ({ content: data.detail }));
+          }
+        }
+      }
     } catch (e) {
       setMessages((prev) => [
         ...prev,
@@ -0,0 +1,15 @@
+import pytest
+
+from backend.app import index_store
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+  """Point the index and metadata DB at an empty temporary storage directory."""
+  store = tmp_path / "storage"
+  store.mkdir()
+  monkeypatch.setattr(index_store, "STORAGE_DIR", str(store))
+  monkeypatch.setattr(index_store, "INDEX_PATH", str(store / "faiss.index"))
+  monkeypatch.setattr(index_store, "DB_PATH", str(store / "metadata.db"))
+  monkeypatch.setattr(index_store, "_managers", {})
+  return store
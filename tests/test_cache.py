@@ -0,0 +1,31 @@
+from backend.app.cache import LRUCache, VersionedCache, normalize_query
+
+
+def test_lru_evicts_least_recently_used():
+  cache = LRUCache(max_size=2)
+  cache.put("a", 1)
+  cache.put("b", 2)
+  assert cache.get("a") == 1
+  cache.put("c", 3)
+  assert cache.get("b") is None
+  assert cache.get("a") == 1 and cache.get("c") == 3
+  st = cache.stats()
+  assert st["hits"] == 3 and st["misses"] == 1 and st["evictions"] == 1
+
+
+def test_lru_ttl_expires_entries():
+  cache = LRUCache(max_size=4, ttl=0)
+  cache.put("a", 1)
+  assert cache.get("a") is None
+
+
+def test_versioned_cache_drops_entries_on_new_version():
+  cache = VersionedCache(max_size=4)
+  cache.put_versioned((1,), "q", "old")
+  assert cache.get_versioned((1,), "q") == "old"
+  assert cache.get_versioned((2,), "q") is None
+  assert len(cache) == 0
+
+
+def test_normalize_query():
+  assert normalize_query("  Solar   Panel\n") == "solar panel"
@@ -1,4 +1,9 @@
+import os
+
 import numpy as np
+import pytest
+
+from backend.app import embeddings, encoders
 from backend.app.embeddings import embed_texts
 
 
@@ -10,3 +15,102 @@ def test_embed_texts_shape():
   assert embs.shape[1] == 384
 
 
+@pytest.mark.parametrize("backend", ["quantized", "onnx"])
+def test_fast_backends_match_fp32(backend, tmp_path, monkeypatch):
+  if backend == "onnx":
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+  texts = ["solar panel efficiency", "offshore wind turbines", "how long do lithium batteries last?"]
+  image = os.path.join('samples', 'sample.png')
+  ref_text, ref_image = embed_texts(texts), embeddings.embed_image_paths([image])
+
+  monkeypatch.setattr(encoders, "get_section", lambda name: {"backend": backend, "onnx_dir": str(tmp_path)})
+  for name in ("_text_model", "_clip_model", "_clip_preprocess", "_onnx_text", "_onnx_clip"):
+    monkeypatch.setattr(embeddings, name, None)
+  fast_text, fast_image = embed_texts(texts), embeddings.embed_image_paths([image])
+
+  assert fast_text.shape == ref_text.shape and fast_image.shape == ref_image.shape
+  # cosine similarity to the fp32 vectors (all are unit length)
+  assert (fast_text * ref_text).sum(axis=1).min() > 0.99
+  assert (fast_image * ref_image).sum(axis=1).min() > 0.98
+
+
+def test_micro_batcher_coalesces_concurrent_calls():
+  import threading
+
+  sizes = []
+
+  def encode(texts):
+    sizes.append(len(texts))
+    return np.array([[float(t)] for t in texts], dtype=np.float32)
+
+  batcher = embeddings.MicroBatcher(encode, max_batch=8, max_wait_ms=50)
+  results = {}
+  barrier = threading.Barrier(16)
+
+  def call(i):
+    barrier.wait()
+    results[i] = batcher(str(i))
+
+  threads = [threading.Thread(target=call, args=(i,)) for i in range(16)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  # every caller gets its own row back
+  assert all(results[i].shape == (1, 1) and results[i][0, 0] == i for i in range(16))
+  assert sum(sizes) == 16 and max(sizes) <= 8 and len(sizes) < 16
+  stats = batcher.stats()
+  assert stats["items"] == 16 and stats["batches"] == len(sizes) and stats["max_wait_ms"] > 0
+
+
+def test_micro_batcher_propagates_errors():
+  def encode(texts):
+    raise RuntimeError("model not loaded")
+
+  batcher = embeddings.MicroBatcher(encode, max_wait_ms=1)
+  with pytest.raises(RuntimeError, match="model not loaded"):
+    batcher("query")
+
+
+def test_embed_images_streams_fixed_batches(tmp_path, monkeypatch):
+  import torch
+  from PIL import Image
+
+  paths = []
+  for i in range(5):
+    p = tmp_path / f"photo{i}.jpg"
+    Image.new("RGB", (2000, 1500), (i * 40, 80, 120)).save(p)
+    paths.append(str(p))
+  decoded, batches = [], []
+
+  def preprocess(im):
+    decoded.append(im.size)
+    return torch.zeros(3, 4, 4)
+
+  class FakeClip:
+    def encode_image(self, batch):
+      batches.append(len(batch))
+      return torch.ones(len(batch), 512)
+
+  monkeypatch.setattr(encoders, "get_section", lambda name: {})
+  monkeypatch.setattr(embeddings, "get_clip", lambda: (FakeClip(), preprocess))
+  embs, sizes = embeddings.embed_images(paths, batch_size=2, workers=2)
+  assert embs.shape == (5, 512) and batches == [2, 2, 1]
+  # original dimensions are reported, but the JPEGs were decoded at reduced scale
+  assert sizes == [(2000, 1500)] * 5
+  assert all(224 <= min(s) < 1500 for s in decoded)
+
+
+def test_embed_queries_encodes_only_uncached_misses_once():
+  calls = []
+
+  def encode(texts):
+    calls.append(list(texts))
+    return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+  first = embeddings._cached_queries("test-batch", ["ab", "abc", "AB "], encode)
+  assert calls == [["ab", "abc"]]  # "AB " normalizes to the same query as "ab"
+  assert first.shape == (3, 2) and first[0, 0] == first[2, 0] == 2.0
+  again = embeddings._cached_queries("test-batch", ["abc", "abcd"], encode)
+  assert calls[-1] == ["abcd"] and again[:, 0].tolist() == [3.0, 4.0]
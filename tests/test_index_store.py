@@ -0,0 +1,297 @@
+import threading
+
+import faiss
+import numpy as np
+import pytest
+
+from backend.app import index_store
+
+
+def _vecs(n, dim=8, seed=0):
+  v = np.random.default_rng(seed).random((n, dim), dtype=np.float32)
+  return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def _meta(n, file_name, file_type):
+  return [{"content": f"{file_name} #{i}", "file_name": file_name, "file_type": file_type} for i in range(n)]
+
+
+def test_collections_have_separate_id_spaces(storage):
+  index_store.add_embeddings_with_metadata(_vecs(3, 384), _meta(3, "a.txt", "text"))
+  index_store.add_embeddings_with_metadata(_vecs(2, 512), _meta(2, "b.png", "image"), collection="image")
+  assert index_store.get_index_manager("text").ntotal == 3
+  assert index_store.get_index_manager("image").ntotal == 2
+  images = index_store.lookup_vectors([0, 1], "image")
+  assert [images[i]["file_name"] for i in (0, 1)] == ["b.png", "b.png"]
+  assert index_store.lookup_vectors([0], "text")[0]["file_name"] == "a.txt"
+  st = index_store.status()
+  assert st["vectors"] == 5 and st["files"] == 2
+
+
+def test_collection_rejects_wrong_dimension(storage):
+  with pytest.raises(ValueError):
+    index_store.add_embeddings_with_metadata(_vecs(1, 512), _meta(1, "b.png", "image"))
+
+
+def test_manager_add_and_search(tmp_path):
+  mgr = index_store.IndexManager(str(tmp_path / "faiss.index"), 8)
+  assert mgr.ntotal == 0
+  vecs = _vecs(10)
+  version = mgr.version
+  assert mgr.add(vecs[:6]) == 0
+  assert mgr.version > version
+  assert mgr.add(vecs[6:]) == 6
+  D, I = mgr.search(vecs[7:8], 1)
+  assert I[0][0] == 7
+
+
+def test_delta_appends_then_compacts(tmp_path):
+  path = tmp_path / "faiss.index"
+  mgr = index_store.IndexManager(str(path), 8)
+  vecs = _vecs(10)
+  mgr.add(vecs[:4])
+  mgr.add(vecs[4:])
+  # appends only touch the delta log
+  assert not path.exists()
+  assert mgr.delta_total == 10
+  res = mgr.compact()
+  assert res["merged"] == 10 and res["vectors"] == 10
+  assert faiss.read_index(str(path)).ntotal == 10
+  assert mgr.delta_total == 0
+  assert mgr.add(vecs[:2]) == 10
+  D, I = mgr.search(vecs[3:4], 2)
+  assert I[0][0] == 3
+  # base and delta hits are merged by score
+  D, I = mgr.search(vecs[1:2], 2)
+  assert sorted(I[0].tolist()) == [1, 11]
+
+
+def test_delta_recovery_skips_merged_rows(tmp_path):
+  path = str(tmp_path / "faiss.index")
+  mgr = index_store.IndexManager(path, 8)
+  vecs = _vecs(6)
+  mgr.add(vecs)
+  # simulate a crash after the base was replaced but before the delta was reset
+  base = faiss.IndexFlatIP(8)
+  base.add(vecs[:4])
+  faiss.write_index(base, path)
+  fresh = index_store.IndexManager(path, 8)
+  assert fresh.ntotal == 6
+  assert fresh.delta_total == 2
+  D, I = fresh.search(vecs[5:6], 1)
+  assert I[0][0] == 5
+
+
+def test_manager_reloads_only_on_change(tmp_path):
+  path = str(tmp_path / "faiss.index")
+  mgr = index_store.IndexManager(path, 8)
+  mgr.add(_vecs(3))
+  mgr.compact()
+  resident = mgr._index
+  mgr.load()
+  assert mgr._index is resident
+  # an external writer replaces the file on disk
+  other = faiss.IndexFlatIP(8)
+  other.add(_vecs(5, seed=1))
+  faiss.write_index(other, path)
+  assert mgr.ntotal == 5
+  assert mgr._index is not resident
+
+
+def test_removed_ids_are_hidden_then_purged_by_compaction(tmp_path, monkeypatch):
+  monkeypatch.setattr(index_store, "get_section", lambda name: {"tombstone_ratio": 0.9})
+  path = tmp_path / "faiss.index"
+  mgr = index_store.IndexManager(str(path), 8)
+  vecs = _vecs(10)
+  mgr.add(vecs[:6])
+  mgr.compact()
+  mgr.add(vecs[6:])
+  # one id in the base, one in the delta, one unknown
+  assert mgr.remove([2, 8, 99]) == 2
+  assert mgr.ntotal == 8 and mgr.tombstones == 2
+  # the base file isn't rewritten by a delete
+  assert faiss.read_index(str(path)).ntotal == 6
+  D, I = mgr.search(vecs[[2, 8]], 10)
+  assert not {2, 8} & set(I.ravel().tolist())
+  # tombstones survive a restart
+  assert index_store.IndexManager(str(path), 8).ntotal == 8
+  res = mgr.compact()
+  assert res["purged"] == 2 and res["vectors"] == 8
+  assert mgr.tombstones == 0
+  assert sorted(index_store.index_ids(faiss.read_index(str(path))).tolist()) == [0, 1, 3, 4, 5, 6, 7, 9]
+  # purged ids are never handed out again
+  assert mgr.add(vecs[:1]) == 10
+
+
+def test_tombstone_ratio_triggers_compaction(tmp_path, monkeypatch):
+  monkeypatch.setattr(index_store, "get_section", lambda name: {"tombstone_ratio": 0.3})
+  mgr = index_store.IndexManager(str(tmp_path / "faiss.index"), 8)
+  mgr.add(_vecs(10))
+  started = []
+  monkeypatch.setattr(mgr, "compact_in_background", lambda: started.append(True))
+  mgr.remove([0, 1])
+  assert not started
+  mgr.remove([2])
+  assert started
+
+
+def test_rwlock_excludes_writer_while_reading():
+  lock = index_store.RWLock()
+  events = []
+
+  def writer():
+    with lock.write():
+      events.append("w")
+
+  with lock.read():
+    t = threading.Thread(target=writer)
+    t.start()
+    t.join(0.05)
+    assert events == []
+  t.join(1)
+  assert events == ["w"]
+
+
+def test_build_index_falls_back_to_flat_without_training_data():
+  index = index_store.build_index(8, "IVF64,Flat", _vecs(10))
+  assert isinstance(index, faiss.IndexFlat)
+  assert index.ntotal == 10
+  index = index_store.build_index(8, "IVF4,Flat", _vecs(200))
+  assert faiss.try_extract_index_ivf(index) is not None
+  assert index_store.search_params(index, nprobe=2).nprobe == 2
+
+
+def test_compaction_upgrades_flat_past_threshold(tmp_path, monkeypatch):
+  cfg = {"ann_factory": "HNSW8", "auto_upgrade_threshold": 50}
+  monkeypatch.setattr(index_store, "get_section", lambda name: cfg)
+  mgr = index_store.IndexManager(str(tmp_path / "faiss.index"), 8)
+  vecs = _vecs(60)
+  mgr.add(vecs[:20])
+  assert mgr.compact()["index_type"].startswith("IndexFlat")
+  mgr.add(vecs[20:])
+  res = mgr.compact()
+  assert res["index_type"] == "IndexHNSWFlat" and res["upgraded_from"].startswith("IndexFlat")
+  D, I = mgr.search(vecs[42:43], 1, ef_search=32)
+  assert I[0][0] == 42
+
+
+def test_db_migrations_run_once_with_wal_and_indexes(storage):
+  conn = index_store.connect_db()
+  assert conn is index_store.connect_db()
+  assert conn.execute("PRAGMA user_version").fetchone()[0] == len(index_store.MIGRATIONS)
+  assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+  names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+  assert {"idx_vectors_vector_id", "idx_vectors_file_name", "idx_vectors_file_type"} <= names
+  seen = []
+  t = threading.Thread(target=lambda: seen.append(index_store.connect_db()))
+  t.start()
+  t.join()
+  assert seen[0] is not conn
+
+
+def test_rebuild_reuses_stored_embeddings(storage, monkeypatch):
+  from backend.app import embeddings
+
+  vecs = _vecs(6, 384)
+  index_store.add_embeddings_with_metadata(vecs, _meta(6, "a.txt", "text"))
+  index_store.delete_rows([1])
+  monkeypatch.setattr(embeddings, "embed_texts", lambda texts: pytest.fail("rebuild re-encoded stored rows"))
+  res = index_store.rebuild_from_db("text", factory="HNSW16")
+  assert res["reused"] == 5 and res["embedded"] == 0
+  assert res["index_type"] == "IndexHNSWFlat"
+  # ids are kept, so the metadata still lines up with the vectors
+  D, I = index_store.get_index_manager().search(vecs[4:5], 1)
+  assert I[0][0] == 4
+  # the deleted row's vector is dropped from the store
+  assert index_store.get_embedding_store("text").count() == 5
+
+
+def test_compaction_drops_deleted_embeddings(storage):
+  index_store.add_embeddings_with_metadata(_vecs(9, 384), _meta(9, "a.txt", "text"))
+  index_store.add_embeddings_with_metadata(_vecs(1, 384, seed=1), _meta(1, "b.txt", "text"))
+  index_store.delete_file("b.txt")
+  stored = lambda: index_store.status()["collections"]["text"]["stored_embeddings"]
+  assert stored() == 10
+  index_store.get_index_manager().compact()
+  assert stored() == 9
+  found, _ = index_store.get_embedding_store().get([8, 9], index_store.EMBEDDING_MODELS["text"], 384)
+  assert found.tolist() == [True, False]
+
+
+def test_rebuild_embeds_only_rows_missing_from_store(storage, monkeypatch):
+  from backend.app import embeddings
+
+  index_store.add_embeddings_with_metadata(_vecs(3, 384), _meta(3, "a.txt", "text"))
+  # rows ingested before the embedding store existed
+  with index_store.connect_db() as conn:
+    conn.executemany(
+      "INSERT INTO vectors (vector_id, content, file_name, file_type, collection) VALUES (NULL, ?, 'old.txt', 'text', 'text')",
+      [("legacy one",), ("legacy two",)],
+    )
+  encoded = []
+  monkeypatch.setattr(embeddings, "embed_texts", lambda texts: encoded.extend(texts) or _vecs(len(texts), 384, seed=5))
+  res = index_store.rebuild_from_db("text")
+  assert encoded == ["legacy one", "legacy two"]
+  assert res["vectors"] == 5 and res["reused"] == 3
+  ids = [r[0] for r in index_store.connect_db().execute("SELECT vector_id FROM vectors WHERE file_name = 'old.txt'")]
+  assert ids == [3, 4]
+
+
+def test_lexical_index_tracks_inserts_and_deletes(storage):
+  metas = [
+    {"content": "Inverter fault E-4021 after firmware update", "file_name": "a.txt", "file_type": "text"},
+    {"content": "The inverter converts DC to AC", "file_name": "a.txt", "file_type": "text"},
+    {"content": "Replace fuse part XJ_200 yearly", "file_name": "b.txt", "file_type": "text"},
+  ]
+  index_store.add_embeddings_with_metadata(_vecs(3, 384), metas)
+  assert [vid for vid, _ in index_store.lexical_search("what does E-4021 mean?", 5)] == [0]
+  assert [vid for vid, _ in index_store.lexical_search("xj_200", 5)] == [2]
+  assert {vid for vid, _ in index_store.lexical_search("inverter", 5)} == {0, 1}
+  assert index_store.lexical_search("?!", 5) == [] and index_store.fts_terms("Café E-4021") == ["cafe", "e-4021"]
+  # with a budget of one posting only the rare term is searched
+  assert [vid for vid, _ in index_store.lexical_search("inverter E-4021", 5, max_postings=1)] == [0]
+  # the rarest term is kept even over budget
+  assert {vid for vid, _ in index_store.lexical_search("inverter", 5, max_postings=1)} == {0, 1}
+  # document counts only cover the searched collection
+  images = [{"content": "E-4021 label photo", "file_name": f"{i}.png", "file_type": "image"} for i in range(3)]
+  index_store.add_embeddings_with_metadata(_vecs(3, 512), images, collection="image")
+  assert [vid for vid, _ in index_store.lexical_search("inverter E-4021", 5, max_postings=2)] == [0]
+  index_store.delete_file("a.txt")
+  assert index_store.lexical_search("inverter", 5) == []
+
+
+def test_id_selector_picks_range_bitmap_or_batch():
+  sel, _ = index_store.id_selector(np.arange(10, 20))
+  assert isinstance(sel, faiss.IDSelectorRange)
+  sel, keep = index_store.id_selector(np.arange(1, 700, 3))
+  assert isinstance(sel, faiss.IDSelectorBitmap) and sel.is_member(697) and not sel.is_member(698)
+  assert not sel.is_member(5000)
+  sel, _ = index_store.id_selector(np.array([2, 10 ** 9]))
+  assert isinstance(sel, faiss.IDSelectorBatch) and sel.is_member(10 ** 9) and not sel.is_member(3)
+
+
+def test_filtered_search_stays_inside_the_filter(storage, monkeypatch):
+  vecs = _vecs(40, 384)
+  metas = [
+    {"content": f"chunk {i}", "file_name": f"f{i % 4}.pdf", "file_type": "pdf", "page_number": i // 4}
+    for i in range(40)
+  ]
+  index_store.add_embeddings_with_metadata(vecs, metas)
+  index_store.record_file("f1.pdf", "h1", 1, 10)
+  filters = index_store.parse_filters({"file_name": ["f1.pdf", "f2.pdf"], "page_min": 2, "page_max": 5})
+  expected = sorted(i for i in range(40) if i % 4 in (1, 2) and 2 <= i // 4 <= 5)
+  assert index_store.filter_ids(filters).tolist() == expected
+  # the nearest neighbour of vector 0 is itself, but it's outside the filter
+  for exact_max in (1000, 0):  # exact scoring over stored embeddings, then a FAISS IDSelector
+    monkeypatch.setattr(index_store, "get_section", lambda name: {"filter_exact_max": exact_max})
+    D, I = index_store.search_collection("text", vecs[:1], 5, filters=filters)
+    assert set(I[0].tolist()) <= set(expected) and len(I[0]) == 5
+    assert I[0][0] == expected[int(np.argmax(vecs[expected] @ vecs[0]))]
+  rowid = index_store.connect_db().execute("SELECT id FROM vectors WHERE vector_id = ?", (expected[0],)).fetchone()[0]
+  index_store.delete_rows([rowid])
+  _, I = index_store.search_collection("text", vecs[expected[0]:expected[0] + 1], 3, filters=filters)
+  assert expected[0] not in I[0].tolist()
+  recent = index_store.parse_filters({"ingested_after": "2000-01-01"})
+  assert set(index_store.filter_ids(recent).tolist()) == {i for i in range(40) if i % 4 == 1} - {expected[0]}
+  with pytest.raises(ValueError):
+    index_store.parse_filters({"page": 3})
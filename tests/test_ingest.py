@@ -1,4 +1,9 @@
 import os
+
+import numpy as np
+import pytest
+
+from backend.app import index_store
 from backend.app.extractors import extract_pdf, extract_docx, extract_image
 
 
@@ -17,3 +22,313 @@ def test_extract_image():
   assert 'Image:' in chunks[0].content
 
 
+def test_ingest_paths_batches_chunks(tmp_path, storage, monkeypatch):
+  from backend.app import ingest
+
+  paths = []
+  for i in range(5):
+    p = tmp_path / f"doc{i}.txt"
+    p.write_text(f"Document {i} talks about wind turbines. " * 40)
+    paths.append(str(p))
+  batches = []
+
+  def fake_index(chunks):
+    batches.append(len(chunks))
+    return {"chunks_added": len(chunks), "vectors_indexed": len(chunks)}
+
+  monkeypatch.setattr(ingest, "index_chunks", fake_index)
+  out = ingest.ingest_paths(paths, workers=2, batch_size=6)
+  assert out["files"] == 5 and not out["errors"]
+  assert out["chunks_added"] == sum(batches)
+  # chunks from several files share one embedding/commit batch
+  assert len(batches) < out["chunks_added"] / 2
+
+
+@pytest.fixture
+def fake_embed(monkeypatch):
+  from backend.app import embeddings
+  embedded = []
+
+  def embed(texts):
+    embedded.extend(texts)
+    rng = np.random.default_rng(len(embedded))
+    v = rng.random((len(texts), 384), dtype=np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+  monkeypatch.setattr(embeddings, "embed_texts", embed)
+  return embedded
+
+
+def test_reingest_skips_unchanged_and_duplicates(tmp_path, storage, fake_embed):
+  from backend.app import ingest
+
+  a = tmp_path / "a.txt"
+  a.write_text("Battery storage smooths solar output. " * 60)
+  first = ingest.ingest_paths([str(a)], workers=1)
+  assert first["chunks_added"] > 0 and not first["skipped"]
+  calls = len(fake_embed)
+
+  again = ingest.ingest_paths([str(a)], workers=1)
+  assert again["chunks_added"] == 0
+  assert again["skipped"] == [{"file": "a.txt", "reason": "unchanged"}]
+  copy = tmp_path / "copy.txt"
+  copy.write_bytes(a.read_bytes())
+  dup = ingest.ingest_paths([str(copy)], workers=1)
+  assert dup["skipped"][0]["reason"] == "duplicate of a.txt"
+  assert len(fake_embed) == calls
+
+
+def test_modified_file_embeds_only_new_chunks(tmp_path, storage, fake_embed):
+  from backend.app import ingest
+
+  paras = [f"Paragraph {i} explains turbine maintenance in detail. " * 12 for i in range(4)]
+  doc = tmp_path / "doc.txt"
+  doc.write_text("\n".join(paras))
+  ingest.ingest_paths([str(doc)], workers=1)
+  before = index_store.get_index_manager().ntotal
+  fake_embed.clear()
+
+  doc.write_text("\n".join(paras[:3] + ["A brand new closing paragraph about grid storage. " * 12]))
+  out = ingest.ingest_paths([str(doc)], workers=1)
+  assert out["chunks_reused"] > 0
+  assert out["chunks_added"] == len(fake_embed) < before
+  assert out["vectors_removed"] > 0
+  total = index_store.get_index_manager().ntotal
+  assert total == before + out["vectors_indexed"] - out["vectors_removed"]
+  assert index_store.status()["vectors"] == total
+
+
+def test_file_edited_into_a_copy_drops_its_old_chunks(tmp_path, storage, fake_embed):
+  from backend.app import ingest
+
+  a, b = tmp_path / "a.txt", tmp_path / "b.txt"
+  a.write_text("alpha v1 describes flywheel storage. " * 40)
+  b.write_text("Offshore wind farms need subsea cables. " * 40)
+  ingest.ingest_paths([str(a), str(b)], workers=1)
+  total = index_store.get_index_manager().ntotal
+  old = sum(len(ids) for ids in index_store.file_chunks("a.txt").values())
+
+  a.write_bytes(b.read_bytes())
+  out = ingest.ingest_paths([str(a)], workers=1)
+  assert out["skipped"] == [{"file": "a.txt", "reason": "duplicate of b.txt"}]
+  assert out["vectors_removed"] == old > 0
+  assert index_store.file_chunks("a.txt") == {}
+  # recorded as a copy sharing b.txt's chunks
+  assert index_store.get_file("a.txt")["content_hash"] == index_store.get_file("b.txt")["content_hash"]
+  assert index_store.get_index_manager().ntotal == total - old
+  # the same through the single-file path
+  c = tmp_path / "c.txt"
+  c.write_text("Heat pumps move heat rather than generate it. " * 40)
+  ingest.ingest_paths([str(c)], workers=1)
+  c.write_bytes(b.read_bytes())
+  out = ingest.ingest_file(str(c), "c.txt", [])
+  assert out["skipped"] == "duplicate of b.txt" and out["vectors_removed"] > 0
+  assert index_store.file_chunks("c.txt") == {}
+
+
+def _searched_files(term):
+  hits = index_store.lexical_search(term, 10, "text")
+  return {row["file_name"] for row in index_store.lookup_vectors([vid for vid, _ in hits], "text").values()}
+
+
+def test_copy_keeps_content_after_original_is_deleted_or_changed(tmp_path, storage, fake_embed):
+  from backend.app import ingest
+
+  a, b = tmp_path / "a.txt", tmp_path / "b.txt"
+  a.write_text("Flywheels store energy as rotational momentum. " * 40)
+  ingest.ingest_paths([str(a)], workers=1)
+  total = index_store.get_index_manager().ntotal
+  calls = len(fake_embed)
+  b.write_bytes(a.read_bytes())
+  out = ingest.ingest_paths([str(b)], workers=1)
+  assert out["skipped"] == [{"file": "b.txt", "reason": "duplicate of a.txt"}]
+  assert len(fake_embed) == calls and index_store.get_index_manager().ntotal == total
+
+  # the shared chunks pass to the copy instead of being deleted
+  out = index_store.delete_file("a.txt")
+  assert out["vectors_removed"] == 0 and out["kept_for"] == "b.txt"
+  assert _searched_files("flywheels") == {"b.txt"}
+  assert index_store.get_index_manager().ntotal == total
+
+  # likewise when the original changes: the copy keeps the old text
+  a.write_bytes(b.read_bytes())
+  ingest.ingest_paths([str(a)], workers=1)
+  c = tmp_path / "c.txt"
+  c.write_bytes(b.read_bytes())
+  ingest.ingest_paths([str(c)], workers=1)
+  b.write_text("Pumped hydro lifts water uphill. " * 40)
+  ingest.ingest_paths([str(b)], workers=1)
+  assert _searched_files("flywheels") == {"a.txt"}
+  assert _searched_files("hydro") == {"b.txt"}
+  assert index_store.delete_file("a.txt")["kept_for"] == "c.txt"
+  assert _searched_files("flywheels") == {"c.txt"}
+
+
+def test_delete_file_removes_chunks(tmp_path, storage, fake_embed):
+  from backend.app import ingest
+
+  a, b = tmp_path / "a.txt", tmp_path / "b.txt"
+  a.write_text("Heat pumps move heat rather than generate it. " * 40)
+  b.write_text("Offshore wind farms need subsea cables. " * 40)
+  ingest.ingest_paths([str(a), str(b)], workers=1)
+  total = index_store.get_index_manager().ntotal
+
+  out = index_store.delete_file("a.txt")
+  assert out["chunks_removed"] == out["vectors_removed"] > 0
+  assert index_store.get_index_manager().ntotal == total - out["vectors_removed"]
+  assert index_store.get_file("a.txt") is None
+  assert index_store.delete_file("a.txt") is None
+  # a deleted file can be ingested again
+  assert ingest.ingest_paths([str(a)], workers=1)["chunks_added"] == out["chunks_removed"]
+
+
+def test_token_splitter_respects_budget_and_sentences():
+  from backend.app.splitter import RegexTokenizer, TokenSplitter
+
+  tok = RegexTokenizer()
+  text = " ".join(f"Sentence {i} is about grid batteries." for i in range(300))
+  splitter = TokenSplitter(tok, max_tokens=64, overlap_tokens=12)
+  spans = splitter.spans(text)
+  assert spans[0][0] == 0 and spans[-1][1] == len(text)
+  for (s, e), (s2, _) in zip(spans, spans[1:]):
+    assert len(tok.offsets(text[s:e])) <= 64
+    assert text[e - 1] == "." and text[s2:].startswith("Sentence")
+    assert s < s2 < e  # consecutive chunks overlap
+  # no sentence boundaries at all: hard cuts at the budget
+  words = splitter.split("word " * 1000)
+  assert all(len(tok.offsets(w)) <= 64 for w in words) and len(words) > 1
+  assert splitter.spans("") == [] and splitter.spans("  \n ") == []
+
+
+def test_splitter_falls_back_to_regex_then_retries(monkeypatch):
+  from backend.app import splitter
+
+  class Loaded:
+    def __init__(self, name):
+      if not loaded:
+        raise OSError("not cached")
+      self.name = name
+
+  loaded = []
+  monkeypatch.setattr(splitter, "HFTokenizer", Loaded)
+  monkeypatch.setattr(splitter, "_splitter", None)
+  monkeypatch.setattr(splitter, "get_section", lambda name: {"tokenizer": "tok", "retry_seconds": 0})
+  assert splitter.splitter_stats() == {"tokenizer": None, "fallback": False}
+  splitter.get_splitter()
+  assert splitter.splitter_stats() == {"tokenizer": "regex", "fallback": True}
+  # the fallback isn't kept once the tokenizer can be loaded
+  loaded.append(True)
+  splitter.get_splitter()
+  assert splitter.splitter_stats() == {"tokenizer": "tok", "fallback": False}
+
+
+def _make_pdf(path, pages):
+  import fitz
+  doc = fitz.open()
+  for i in range(pages):
+    page = doc.new_page()
+    for j in range(12):
+      page.insert_text((72, 72 + j * 40), f"Page {i} line {j}: inverters convert DC to AC power.")
+  doc.save(str(path))
+  doc.close()
+
+
+def test_iter_pdf_parallel_matches_sequential_with_bboxes(tmp_path):
+  import json
+  from backend.app.extractors import iter_pdf
+
+  pdf = tmp_path / "manual.pdf"
+  _make_pdf(pdf, 9)
+  sequential = list(iter_pdf(str(pdf), "manual.pdf", workers=1))
+  parallel = list(iter_pdf(str(pdf), "manual.pdf", workers=3, pages_per_task=2))
+  assert [(c.page_number, c.content) for c in parallel] == [(c.page_number, c.content) for c in sequential]
+  assert [c.page_number for c in parallel] == sorted(c.page_number for c in parallel)
+  box = json.loads(parallel[0].bbox)
+  assert box["page"] == [595.0, 842.0] and box["boxes"]
+  assert all(len(b) == 4 and b[0] < b[2] and b[1] < b[3] for b in box["boxes"])
+  # ranges handed to a caller's pool, even for a single range
+  from concurrent.futures import ThreadPoolExecutor
+
+  with ThreadPoolExecutor(2) as pool:
+    tasks = []
+    submit = lambda fn, *args: tasks.append(args[2:]) or pool.submit(fn, *args)
+    shared = list(iter_pdf(str(pdf), "manual.pdf", workers=2, pages_per_task=4, submit=submit))
+    assert [(c.page_number, c.content) for c in shared] == [(c.page_number, c.content) for c in sequential]
+    assert tasks == [(0, 4), (4, 8), (8, 9)]
+    tasks.clear()
+    list(iter_pdf(str(pdf), "manual.pdf", pages_per_task=16, submit=submit))
+    assert tasks == [(0, 9)]
+
+
+def test_ingest_file_embeds_streamed_chunks_in_batches(tmp_path, storage, fake_embed, monkeypatch):
+  from backend.app import ingest
+  from backend.app.extractors import iter_pdf
+
+  pdf = tmp_path / "manual.pdf"
+  _make_pdf(pdf, 6)
+  calls = []
+  index_chunks = ingest.index_chunks
+  monkeypatch.setattr(ingest, "index_chunks", lambda chunks: calls.append(len(chunks)) or index_chunks(chunks))
+  out = ingest.ingest_file(str(pdf), "manual.pdf", iter_pdf(str(pdf), "manual.pdf", workers=2, pages_per_task=1), batch_size=2)
+  assert out["chunks_added"] == sum(calls) and len(calls) > 1
+  rows = index_store.lookup_vectors(range(out["vectors_indexed"]))
+  assert all(r["bbox"]["boxes"] for r in rows.values())
+  assert index_store.get_file("manual.pdf")["chunks"] == out["chunks_added"]
+
+
+FAKE_WHISPER = '''
+import json, sys, wave
+args = {flag: sys.argv[sys.argv.index(flag) + 1] for flag in ("-m", "-f", "-of")}
+if "fail" in args["-m"]:
+  sys.exit("model is corrupt")
+with wave.open(args["-f"]) as w:
+  ms = w.getnframes() * 1000 // w.getframerate()
+words = [{"offsets": {"from": t, "to": min(t + 1000, ms)}, "text": f" second {t // 1000}."} for t in range(0, ms, 1000)]
+json.dump({"transcription": words}, open(args["-of"] + ".json", "w"))
+'''
+
+
+def _tone_wav(path, seconds, quiet):
+  import wave
+  t = np.arange(int(seconds * 16000)) / 16000
+  samples = (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+  for s, e in quiet:
+    samples[int(s * 16000):int(e * 16000)] = 0
+  with wave.open(str(path), "wb") as w:
+    w.setnchannels(1)
+    w.setsampwidth(2)
+    w.setframerate(16000)
+    w.writeframes(samples.tobytes())
+
+
+def test_transcribe_splits_on_silence_with_absolute_timestamps(tmp_path, monkeypatch):
+  import sys
+  from backend.app import audio, extractors
+
+  binary = tmp_path / "whisper"
+  binary.write_text(f"#!{sys.executable}\n{FAKE_WHISPER}")
+  binary.chmod(0o755)
+  (tmp_path / "model.bin").write_bytes(b"")
+  wav = tmp_path / "talk.wav"
+  _tone_wav(wav, 10, quiet=[(3.7, 4.3), (7.6, 8.2)])
+
+  samples = audio.decode(str(wav))
+  ranges = audio.split_on_silence(samples, segment_s=5, search_s=2)
+  assert len(ranges) == 3 and ranges[-1][1] == len(samples)
+  assert 3.7 < ranges[0][1] / 16000 < 4.3 and 7.6 < ranges[1][1] / 16000 < 8.2
+  opts = {"binary": str(binary), "model": str(tmp_path / "model.bin"), "workers": 2, "segment_s": 5, "search_s": 2}
+  monkeypatch.setattr(audio, "_settings", lambda: {**opts, "threads": 1})
+  transcript, segments = audio.transcribe(str(wav))
+  starts = [s for s, _, _ in segments]
+  assert starts == sorted(starts) and segments[-1][1] == 10000
+  assert any(s > 4000 and text == "second 0." for s, _, text in segments)  # second segment, shifted
+
+  chunks = extractors.extract_audio(str(wav), "talk.wav")
+  assert chunks and all(c.timestamp for c in chunks)
+  assert chunks[0].timestamp.startswith("0-") and chunks[-1].timestamp.endswith("-10000")
+
+  (tmp_path / "fail.bin").write_bytes(b"")
+  with pytest.raises(audio.TranscriptionError, match="model is corrupt"):
+    audio.transcribe(str(wav), model=str(tmp_path / "fail.bin"))
+  with pytest.raises(audio.TranscriptionError, match="not found"):
+    audio.transcribe(str(wav), binary=str(tmp_path / "missing"))
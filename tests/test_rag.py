@@ -0,0 +1,152 @@
+from backend.app import rag
+from backend.app.adapters.base import LLMAdapter
+
+
+class FakeAdapter(LLMAdapter):
+  def generate(self, prompt, max_tokens=512, temperature=0.2):
+    return "wind turbines [1]"
+
+  def stream(self, prompt, max_tokens=512, temperature=0.2):
+    yield from ["wind ", "turbines ", "[1]"]
+
+
+def test_stream_answer_sends_sources_tokens_then_stats(monkeypatch, tmp_path):
+  src = {"content": "Wind turbines convert kinetic energy.", "file_name": "a.pdf", "file_type": "pdf", "page_number": 2, "score": 0.9}
+  monkeypatch.setattr(rag, "similarity_search", lambda q, k, filters=None: [src])
+  monkeypatch.setattr(rag, "build_adapter", lambda cfg: FakeAdapter())
+  monkeypatch.setattr(rag, "index_version", lambda: ("test-stream",))
+  events = list(rag.stream_answer(str(tmp_path / "missing.yaml"), "what converts kinetic energy?"))
+  assert [e["event"] for e in events] == ["sources", "token", "token", "token", "done"]
+  assert events[0]["data"][0]["file_name"] == "a.pdf"
+  assert "".join(e["data"] for e in events if e["event"] == "token") == "wind turbines [1]"
+  assert events[-1]["data"]["first_token_ms"] <= events[-1]["data"]["total_ms"]
+  # the finished answer is cached for /query
+  assert rag.answer_query(str(tmp_path / "missing.yaml"), "What converts  kinetic energy?")["answer"] == "wind turbines [1]"
+
+
+def test_model_registry_reuses_instances_until_model_settings_change():
+  from backend.app.adapters.registry import ModelRegistry
+
+  built = []
+
+  def factory(cfg):
+    built.append(cfg["model_path"])
+    return FakeAdapter()
+
+  registry = ModelRegistry(factory)
+  cfg = {"model_backend": "llama_cpp", "model_path": "a.gguf", "temperature": 0.2}
+  for _ in range(3):
+    with registry.acquire(cfg) as adapter:
+      assert adapter.generate("hi")
+  # generation settings don't force a reload, a different model does
+  with registry.acquire({**cfg, "temperature": 0.7}):
+    pass
+  assert built == ["a.gguf"]
+  with registry.acquire({**cfg, "model_path": "b.gguf"}):
+    pass
+  assert built == ["a.gguf", "b.gguf"]
+  assert registry.stats()["loaded"] == 1
+
+
+def _candidates(scores):
+  return [{"vector_id": i, "content": f"chunk {i}", "score": s} for i, s in enumerate(scores)]
+
+
+def test_rerank_orders_by_cross_encoder_with_early_exit_and_budget(monkeypatch):
+  import time
+  from backend.app import rerank
+
+  def score(query, texts):
+    return [int(t.split()[1]) for t in texts]  # later chunks score higher
+
+  cands = _candidates([0.9, 0.8, 0.79, 0.78, 0.77])
+  out = rerank.rerank("q", cands, 2, {"batch_size": 2, "margin": 0.5}, score=score)
+  assert [c["vector_id"] for c in out] == [4, 3] and out[0]["rerank_score"] == 4
+  # top-2 clearly ahead of the third: keep the vector order without scoring
+  calls = []
+  separated = _candidates([0.9, 0.85, 0.4, 0.3])
+  out = rerank.rerank("q", separated, 2, {"margin": 0.2}, score=lambda q, t: calls.append(t) or score(q, t))
+  assert [c["vector_id"] for c in out] == [0, 1] and not calls
+  # fused hybrid scores aren't comparable, so they never exit early
+  assert rerank.rerank("q", separated, 2, {"margin": 0.2}, score=score, dense_scores=False)[0]["vector_id"] == 3
+
+  def slow(query, texts):
+    time.sleep(0.03)
+    return score(query, texts)
+
+  before = rerank.rerank_stats()["over_budget"]
+  out = rerank.rerank("q", cands, 2, {"batch_size": 1, "budget_ms": 50}, score=slow)
+  assert [c["vector_id"] for c in out] == [0, 1] and "rerank_score" not in out[0]
+  assert rerank.rerank_stats()["over_budget"] == before + 1
+
+
+def test_retrieve_overfetches_for_rerank(monkeypatch):
+  from backend.app import rerank
+
+  asked = []
+  monkeypatch.setattr(rag, "similarity_search", lambda q, k, filters=None: asked.append(k) or _candidates([0.5] * k))
+  monkeypatch.setattr(rerank, "_score_with_model", lambda name: lambda q, texts: [-int(t.split()[1]) % 7 for t in texts])
+  cfg = {"rerank": {"enabled": True, "candidates": 20, "budget_ms": 10000}}
+  out = rag.retrieve(cfg, "q", 3)
+  assert asked == [20] and [c["vector_id"] for c in out] == [1, 8, 15]
+  assert len(rag.retrieve({}, "q", 3)) == 3 and asked[-1] == 3
+
+
+def test_assemble_prompt_merges_dedupes_and_fits_budget():
+  from backend.app.prompt import assemble_prompt
+
+  words = lambda text: len(text.split())
+  text = " ".join(f"w{i}" for i in range(60))
+  sources = [
+    # two overlapping chunks of one page, the later one ranked first
+    {"vector_id": 11, "content": " ".join(text.split()[20:60]), "file_name": "a.pdf", "file_type": "pdf", "page_number": 1, "score": 0.9},
+    {"vector_id": 10, "content": " ".join(text.split()[:30]), "file_name": "a.pdf", "file_type": "pdf", "page_number": 1, "score": 0.8},
+    # the same passage from another file is a near-duplicate
+    {"vector_id": 40, "content": " ".join(text.split()[5:45]), "file_name": "copy.pdf", "file_type": "pdf", "page_number": 1, "score": 0.7},
+    {"vector_id": 50, "content": " ".join(f"x{i}" for i in range(100)), "file_name": "b.txt", "file_type": "text", "score": 0.6},
+  ]
+  prompt, kept, n = assemble_prompt("q", sources, words, 1000, {})
+  assert [s["file_name"] for s in kept] == ["a.pdf", "b.txt"]
+  assert kept[0]["content"] == text and kept[0]["score"] == 0.9
+  assert "Source [2] b.txt" in prompt and n == words(prompt)
+  # a tight budget cuts the last snippet at a word boundary
+  prompt, kept, n = assemble_prompt("q", sources, words, 150, {"min_snippet_tokens": 10})
+  assert n <= 150 and kept[1]["content"].endswith(" ...") and kept[1]["content"].startswith("x0 x1")
+  prompt, kept, n = assemble_prompt("q", sources, words, 150, {"min_snippet_tokens": 100})
+  assert len(kept) == 1
+
+
+def test_answer_reserves_max_tokens_of_context(monkeypatch, tmp_path):
+  class SmallAdapter(FakeAdapter):
+    context_size = 700
+
+    def count_tokens(self, text):
+      return len(text.split())
+
+  sources = [{"vector_id": i * 10, "content": " ".join(f"s{i}w{j}" for j in range(100)), "file_name": f"{i}.txt", "file_type": "text", "score": 1 - i / 10} for i in range(5)]
+  monkeypatch.setattr(rag, "similarity_search", lambda q, k, filters=None: sources)
+  monkeypatch.setattr(rag, "_registry", rag.ModelRegistry(lambda cfg: SmallAdapter()))
+  monkeypatch.setattr(rag, "index_version", lambda: ("test-budget",))
+  events = list(rag.stream_answer(str(tmp_path / "missing.yaml"), "budget?"))
+  # 700 - 512 reserved for the answer leaves room for one full snippet and part of the next
+  assert [s["file_name"] for s in events[0]["data"]] == ["0.txt", "1.txt"]
+  assert 150 < events[-1]["data"]["prompt_tokens"] <= 188
+
+
+def test_dense_sources_carry_pdf_bbox(storage, monkeypatch):
+  import json
+
+  import numpy as np
+  from backend.app import index_store
+
+  embs = np.eye(2, 384, dtype=np.float32)
+  bbox = {"page": [612, 792], "boxes": [[72, 90, 300, 120]]}
+  metas = [
+    {"content": "Solar panel efficiency", "file_name": "a.pdf", "file_type": "pdf", "page_number": 1, "bbox": json.dumps(bbox)},
+    {"content": "Wind turbines", "file_name": "a.pdf", "file_type": "pdf", "page_number": 2, "bbox": json.dumps(bbox)},
+  ]
+  index_store.add_embeddings_with_metadata(embs, metas)
+  monkeypatch.setattr(rag, "embed_query", lambda q: embs[:1])
+  sources = rag.retrieve({}, "solar", 1)
+  assert sources[0]["file_name"] == "a.pdf" and sources[0]["bbox"] == bbox
+  assert rag.format_sources(sources)[0]["bbox"] == bbox
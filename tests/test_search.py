@@ -1,10 +1,8 @@
-import os
-import json
-from backend.app.index_store import add_embeddings_with_metadata, save_index, load_or_init_index, connect_db
+from backend.app.index_store import add_embeddings_with_metadata
 from backend.app.embeddings import embed_texts
 
 
-def test_similarity_flow(tmp_path, monkeypatch):
+def test_similarity_flow(storage):
   # Build a tiny index for test
   texts = ["solar panel efficiency", "wind turbine", "battery storage"]
   embs = embed_texts(texts)
@@ -18,3 +16,48 @@ def test_similarity_flow(tmp_path, monkeypatch):
   assert res and any("solar" in r["content"] for r in res)
 
 
+def test_hybrid_fuses_keyword_and_vector_ranks(storage, monkeypatch):
+  import numpy as np
+  from backend.app import hybrid, index_store
+
+  assert [vid for vid, _ in hybrid.rrf_fuse([[1, 2, 3], [3, 1]], rrf_k=60)] == [1, 3, 2]
+
+  texts = ["battery storage sizing", "wind turbine blades", "error code E-77 on the charger"]
+  embs = np.eye(3, 384, dtype=np.float32)
+  index_store.add_embeddings_with_metadata(embs, [{"content": t, "file_name": "t.txt", "file_type": "text"} for t in texts])
+  # the query vector is closest to chunk 0; only the keyword search knows about E-77
+  monkeypatch.setattr(hybrid, "embed_query", lambda q: embs[:1])
+  res = hybrid.hybrid_search("charger E-77", 2)
+  assert {r["vector_id"] for r in res} == {0, 2}
+  assert next(r for r in res if r["vector_id"] == 2)["lexical_rank"] == 1
+
+
+def test_semantic_search_batches_queries(storage, monkeypatch):
+  import numpy as np
+  from backend.app import index_store, search
+
+  embs = np.eye(4, 384, dtype=np.float32)
+  metas = [{"content": f"chunk {i}", "file_name": f"f{i % 2}.txt", "file_type": "text"} for i in range(4)]
+  index_store.add_embeddings_with_metadata(embs, metas)
+
+  calls = []
+  monkeypatch.setattr(search, "MODES", {"text": (lambda qs: calls.append(qs) or embs[[int(q[-1]) for q in qs]], "text")})
+  res = search.semantic_search(["q2", "q0", "q3"], top_k=2)
+  assert calls == [["q2", "q0", "q3"]]
+  assert [r[0]["vector_id"] for r in res] == [2, 0, 3] and all(len(r) == 2 for r in res)
+  res = search.semantic_search(["q2", "q1"], top_k=4, filters=index_store.parse_filters({"file_name": "f0.txt"}))
+  assert [[h["vector_id"] for h in r] for r in res] == [[2, 0], [0, 2]]
+  assert search.semantic_search([], top_k=2) == []
+
+
+def test_search_batch_rejects_bad_k():
+  import asyncio
+
+  import pytest
+  from fastapi import HTTPException
+  from backend.app import main
+
+  for k in ("x", 0, -3, 2.5, True, 10 ** 9):
+    with pytest.raises(HTTPException) as err:
+      asyncio.run(main.search_batch({"queries": ["wind"], "k": k}))
+    assert err.value.status_code == 400
@@ -0,0 +1,36 @@
+import json
+import subprocess
+import sys
+
+from backend.app import main
+
+
+def test_importing_app_defers_heavy_modules():
+  probe = (
+    "import sys, json, backend.app.main; "
+    "print(json.dumps([m for m in ('torch', 'sentence_transformers', 'open_clip', 'fitz') if m in sys.modules]))"
+  )
+  out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+  assert json.loads(out.stdout) == []
+
+
+def test_ready_reports_warm_up_progress(monkeypatch, caplog):
+  monkeypatch.setattr(main, "_warmup_state", {"text": "pending", "llm": "pending"})
+  res = main.ready()
+  assert res.status_code == 503
+  assert json.loads(res.body)["models"] == {"text": "pending", "llm": "pending"}
+
+  def broken():
+    raise RuntimeError("no model file")
+
+  monkeypatch.setitem(main.WARMUPS, "text", lambda: None)
+  monkeypatch.setitem(main.WARMUPS, "llm", broken)
+  with caplog.at_level("INFO", logger=main.logger.name):
+    main._warm_up(["text", "llm"])
+  assert "llm warm-up failed: no model file" in [r.getMessage() for r in caplog.records if r.levelname == "WARNING"]
+  body = json.loads(main.ready().body)
+  assert body["models"]["text"] == "ready" and body["models"]["llm"].startswith("failed")
+  assert not body["ready"]
+
+  monkeypatch.setattr(main, "_warmup_state", {"text": "ready"})
+  assert main.ready().status_code == 200
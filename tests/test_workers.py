@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+import pytest
+
+from backend.app.workers import BoundedExecutor, QueueFullError
+
+
+def test_bounded_executor_reports_queue_depth_and_rejects_overflow():
+  ex = BoundedExecutor("test", max_workers=1, max_queue=1)
+  release = threading.Event()
+
+  async def scenario():
+    running = asyncio.ensure_future(ex.run(release.wait))
+    queued = asyncio.ensure_future(ex.run(lambda: "done"))
+    for _ in range(100):
+      if ex.stats()["running"] == 1:
+        break
+      await asyncio.sleep(0.01)
+    assert ex.stats() == {"workers": 1, "running": 1, "queued": 1}
+    with pytest.raises(QueueFullError):
+      await ex.run(lambda: None)
+    release.set()
+    assert await queued == "done"
+    await running
+
+  asyncio.run(scenario())
+  assert ex.stats() == {"workers": 1, "running": 0, "queued": 0}
+  ex.shutdown()
+
+
+def test_stream_in_relays_items_and_rejects_when_full(monkeypatch):
+  from backend.app import workers
+
+  ex = BoundedExecutor("stream", max_workers=1, max_queue=1)
+  monkeypatch.setattr(workers, "get_executor", lambda name: ex)
+  release = threading.Event()
+
+  def tokens(n):
+    release.wait()
+    yield from range(n)
+
+  async def scenario():
+    first = workers.stream_in("query", tokens, 3)
+    second = workers.stream_in("query", tokens, 2)
+    # one streaming, one waiting: the next is turned away before it starts
+    with pytest.raises(QueueFullError):
+      workers.stream_in("query", tokens, 1)
+    release.set()
+    assert [i async for i in first] == [0, 1, 2]
+    assert [i async for i in second] == [0, 1]
+
+  asyncio.run(scenario())
+  assert ex.stats()["queued"] == 0
+  ex.shutdown()
+
+
+def test_shipped_config_sizes_every_stage():
+  from backend.app.config import CONFIG_PATH, load_config
+  from backend.app.workers import POOLS
+
+  cfg = load_config(CONFIG_PATH)
+  concurrency = cfg.get("concurrency") or {}
+  assert concurrency.get("max_queue")
+  assert all(key in concurrency for key, _, _ in POOLS.values())
+
+
+def test_index_maintenance_runs_on_the_ingest_stage(storage, monkeypatch):
+  from backend.app import main
+
+  stages = []
+
+  async def run_in(name, fn, *args, **kwargs):
+    stages.append(name)
+    return fn(*args, **kwargs)
+
+  monkeypatch.setattr(main, "run_in", run_in)
+  assert set(asyncio.run(main.compact())) == set(main.COLLECTIONS)
+  assert len(asyncio.run(main.rebuild("text"))["collections"]) == 1
+  assert stages == ["ingest"] * (len(main.COLLECTIONS) + 1)